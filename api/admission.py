@@ -0,0 +1,161 @@
+import math
+import time
+from collections import OrderedDict, defaultdict
+from typing import Optional
+
+from fastapi import HTTPException, Request
+from fastapi.responses import JSONResponse
+
+from config import (
+    RATE_LIMIT_IDLE, RATE_LIMIT_IP_BURST, RATE_LIMIT_IP_RATE, RATE_LIMIT_MAX_CLIENTS, RATE_LIMIT_USER_BURST,
+    RATE_LIMIT_USER_RATE, SHED_POOL_WAIT, SHED_RETRY_AFTER, SHED_THREADPOOL_QUEUE, async_engine,
+)
+from pools import sql_pool_wait, threadpool_report
+
+# Admission control, so one client cannot take every DB connection.
+#
+# Rate limits: a token bucket per authenticated user (checked in
+# get_current_user) and per client IP (limit_by_ip, on the public location
+# reads). Over the limit a request gets 429 with Retry-After. A bucket is two
+# floats, kept in last-use order, and buckets idle for RATE_LIMIT_IDLE
+# seconds are dropped from the front, so memory follows the number of
+# active clients (at most RATE_LIMIT_MAX_CLIENTS).
+#
+# Load shedding: while checkouts from the MySQL pool wait longer than
+# SHED_POOL_WAIT, or more than SHED_THREADPOOL_QUEUE calls wait for a worker
+# thread, LoadSheddingMiddleware answers every request with 503 and
+# Retry-After before it reaches a handler. /metrics and /internal are never
+# shed. Counters are at GET /internal/admission.
+
+# Never shed, needed to see what is going on
+SHED_EXEMPT_PATHS = ("/metrics", "/internal")
+
+
+class TokenBuckets:
+    def __init__(self, rate: float, burst: int, idle: float, maxsize: int):
+        self.rate = rate
+        self.burst = burst
+        # An idle bucket is full again after burst / rate seconds, so dropping
+        # it any later than that changes nothing
+        self.idle = max(idle, burst / rate) if rate > 0 else idle
+        self.maxsize = maxsize
+        self._buckets = OrderedDict()  # key -> [tokens, updated_at]
+        self.allowed = 0
+        self.limited = 0
+        self.evicted = 0
+
+    @property
+    def enabled(self) -> bool:
+        return self.rate > 0
+
+    def take(self, key) -> float:
+        # 0 if the request may go ahead, else seconds until it may
+        now = time.monotonic()
+        self._evict(now)
+        bucket = self._buckets.get(key)
+        if bucket is None:
+            bucket = self._buckets[key] = [float(self.burst), now]
+        else:
+            bucket[0] = min(self.burst, bucket[0] + (now - bucket[1]) * self.rate)
+            bucket[1] = now
+            self._buckets.move_to_end(key)
+        if bucket[0] >= 1:
+            bucket[0] -= 1
+            self.allowed += 1
+            return 0.0
+        self.limited += 1
+        return (1 - bucket[0]) / self.rate
+
+    def _evict(self, now: float) -> None:
+        # The least recently used bucket is always first
+        while self._buckets:
+            _, updated_at = next(iter(self._buckets.values()))
+            if now - updated_at < self.idle and len(self._buckets) < self.maxsize:
+                return
+            self._buckets.popitem(last=False)
+            self.evicted += 1
+
+    def stats(self) -> dict:
+        return {
+            "rate": self.rate,
+            "burst": self.burst,
+            "clients": len(self._buckets),
+            "allowed": self.allowed,
+            "limited": self.limited,
+            "evicted": self.evicted,
+        }
+
+
+user_buckets = TokenBuckets(RATE_LIMIT_USER_RATE, RATE_LIMIT_USER_BURST, RATE_LIMIT_IDLE, RATE_LIMIT_MAX_CLIENTS)
+ip_buckets = TokenBuckets(RATE_LIMIT_IP_RATE, RATE_LIMIT_IP_BURST, RATE_LIMIT_IDLE, RATE_LIMIT_MAX_CLIENTS)
+
+
+def _too_many_requests(retry_after: float) -> HTTPException:
+    return HTTPException(
+        status_code=429,
+        detail="Too many requests, please slow down",
+        headers={"Retry-After": str(math.ceil(retry_after))},
+    )
+
+
+def limit_user(user_id: int) -> None:
+    if user_buckets.enabled:
+        retry_after = user_buckets.take(user_id)
+        if retry_after:
+            raise _too_many_requests(retry_after)
+
+
+async def limit_by_ip(request: Request) -> None:
+    # request.client is the direct peer; behind a reverse proxy run uvicorn
+    # with --proxy-headers so it is the real client
+    if ip_buckets.enabled:
+        retry_after = ip_buckets.take(request.client.host if request.client else "")
+        if retry_after:
+            raise _too_many_requests(retry_after)
+
+
+# Load shedding ===============================================================
+shed_counts = defaultdict(int)  # reason -> requests shed
+
+
+def overload_reason() -> Optional[str]:
+    if SHED_POOL_WAIT > 0 and sql_pool_wait(async_engine) > SHED_POOL_WAIT:
+        return "pool_wait"
+    if SHED_THREADPOOL_QUEUE > 0 and threadpool_report()["waiting"] > SHED_THREADPOOL_QUEUE:
+        return "threadpool_queue"
+    return None
+
+
+class LoadSheddingMiddleware:
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or scope["path"].startswith(SHED_EXEMPT_PATHS):
+            await self.app(scope, receive, send)
+            return
+        reason = overload_reason()
+        if reason is None:
+            await self.app(scope, receive, send)
+            return
+        shed_counts[reason] += 1
+        response = JSONResponse(
+            {"detail": "Server busy, please retry"},
+            status_code=503,
+            headers={"Retry-After": str(SHED_RETRY_AFTER)},
+        )
+        await response(scope, receive, send)
+
+
+def admission_report() -> dict:
+    return {
+        "users": user_buckets.stats(),
+        "ips": ip_buckets.stats(),
+        "shedding": {
+            "pool_wait": sql_pool_wait(async_engine),
+            "pool_wait_threshold": SHED_POOL_WAIT,
+            "threadpool_waiting": threadpool_report()["waiting"],
+            "threadpool_queue_threshold": SHED_THREADPOOL_QUEUE,
+            "shed": dict(shed_counts),
+        },
+    }
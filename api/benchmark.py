@@ -0,0 +1,546 @@
+import argparse
+import asyncio
+import json
+import os
+import random
+import shutil
+import sys
+import tempfile
+import time
+from collections import Counter
+from dataclasses import dataclass, field
+from datetime import datetime, timezone
+from typing import Awaitable, Callable, List, Optional
+
+# Endpoint benchmarks. Boots main.app in-process against a throwaway SQLite
+# database and either a local mongod (a scratch database, dropped first) or
+# the mongomock double in mongo_double.py, seeds it, then drives each
+# endpoint through httpx's ASGI transport. Run from api/ with the dev
+# requirements installed (pip install -r ../req-dev.txt):
+#
+#   python benchmark.py run --rows 1000 --save baselines/1k.json
+#   python benchmark.py run --rows 100000 --compare baselines/100k.json
+#   python benchmark.py compare baselines/1k.json results/1k.json
+#
+# Each scenario reports req/s and p50/p95/p99 latency. --compare (and the
+# compare command) flag scenarios whose p95 grew or whose throughput dropped
+# by more than --threshold, and exit 1 if there are any.
+#
+# The app modules read their settings at import, so nothing from the app is
+# imported at module level here; _boot() sets the environment first.
+
+WORDS = [
+    "aviator", "wayfarer", "round", "cat-eye", "sport", "classic", "retro", "oversized",
+    "polarized", "tinted", "gradient", "mirrored", "titanium", "acetate", "rimless", "folding",
+]
+COLORS = ["black", "tortoise", "gold", "silver", "clear", "blue", "green", "rose"]
+STATES = ["CA", "NY", "TX", "WA", "OR", "NV", "AZ", "FL"]
+PASSWORD = "Bench-pass-1"
+BATCH = 5000
+
+
+@dataclass
+class Scenario:
+    name: str
+    method: str
+    # (rng, ctx, victim) -> (path, json body or None)
+    request: Callable
+    role: str = "user"
+    max_requests: Optional[int] = None
+    # Creates throwaway entities (for deletes) before timing, batch per request
+    prepare: Optional[Callable[..., Awaitable[list]]] = None
+    batch: int = 1
+    form: bool = False
+
+
+@dataclass
+class Context:
+    inventory: List[tuple] = field(default_factory=list)  # (inventory_id, mongo_id) of the bench user
+    locations: List[tuple] = field(default_factory=list)  # (location_id, mongo_id)
+    tokens: dict = field(default_factory=dict)  # role -> bearer token
+    spare_user_id: int = 0
+
+
+# Environment and seeding =====================================================
+def _boot(args):
+    os.environ["MYSQL_ASYNC_DATABASE_URL"] = f"sqlite+aiosqlite:///{args.workdir}/bench.db"
+    os.environ["MYSQL_DATABASE_URL"] = f"sqlite:///{args.workdir}/bench.db"
+    os.environ["MONGO_DB_NAME"] = args.mongo_db
+    os.environ["REPLICATION_MODE"] = "dual_write"
+    os.environ["OUTBOX_REPLICATOR_ENABLED"] = "0"
+    # Measure the endpoints, not admission control (unless asked for)
+    for name in ("RATE_LIMIT_USER_RATE", "RATE_LIMIT_IP_RATE", "SHED_POOL_WAIT", "SHED_THREADPOOL_QUEUE"):
+        os.environ.setdefault(name, "0")
+
+    import config
+    if args.mongo == "memory":
+        from mongo_double import InMemoryMongoDatabase
+        # Before any router binds async_mongo_db
+        config.async_mongo_db = InMemoryMongoDatabase(args.mongo_db)
+    import main
+    return config, main
+
+
+def _item(rng: random.Random, location_id: int) -> dict:
+    return {
+        "name": f"{rng.choice(COLORS)} {rng.choice(WORDS)} {rng.choice(WORDS)}",
+        "location_id": location_id,
+        "quantity": rng.randint(0, 20),
+        "description": " ".join(rng.choice(WORDS) for _ in range(8)),
+        "price": round(rng.uniform(5, 400), 2),
+        "width": round(rng.uniform(120, 160), 1),
+        "prescription_avail": rng.random() < 0.5,
+        "tinted": rng.random() < 0.5,
+        "polarized": rng.random() < 0.5,
+        "anti_glare": rng.random() < 0.5,
+    }
+
+
+async def _seed(args, config, rng: random.Random) -> Context:
+    from bson import ObjectId
+    from sqlalchemy import insert, select
+
+    import capacity
+    import inventory_stats
+    from hashing import hash_password
+    from models.mysql_models import InventoryMySQL, LocationMySQL, UserMySql
+    from routers.auth import create_access_token
+    from text_index import build_text_index
+
+    hashed = await hash_password(PASSWORD)
+    users = [{"username": "bench_admin", "email": "bench_admin@example.com", "hashed_password": hashed, "role": "admin"}]
+    users += [
+        {"username": f"bench_user_{n}", "email": f"bench_user_{n}@example.com", "hashed_password": hashed, "role": "user"}
+        for n in range(1, args.users + 1)
+    ]
+    location_count = max(10, args.rows // 1000)
+    locations = [
+        {
+            "name": f"Store {n}", "address": f"{n} Main St", "state": rng.choice(STATES),
+            "zip_code": rng.randint(10000, 99999), "capacity": args.rows * 100, "mongo_id": str(ObjectId()),
+        }
+        for n in range(location_count)
+    ]
+
+    async with config.AsyncSessionLocal() as db:
+        await db.execute(insert(UserMySql), users)
+        await db.execute(insert(LocationMySQL), locations)
+        await db.commit()
+        user_ids = (await db.execute(select(UserMySql.user_id).order_by(UserMySql.user_id))).scalars().all()
+        location_rows = (await db.execute(select(LocationMySQL).order_by(LocationMySQL.location_id))).scalars().all()
+
+    location_ids = [location.location_id for location in location_rows]
+    await config.get_async_mongo_collection("location").insert_many([
+        {
+            "_id": ObjectId(location.mongo_id), "name": location.name, "address": location.address,
+            "state": location.state, "zip_code": location.zip_code, "capacity": location.capacity,
+            "location_id": location.location_id, "used": 0,
+        }
+        for location in location_rows
+    ])
+
+    owners = user_ids[1:]  # not the admin
+    inventory = config.get_async_mongo_collection("inventory")
+    for start in range(0, args.rows, BATCH):
+        rows = []
+        for n in range(start, min(start + BATCH, args.rows)):
+            row = _item(rng, rng.choice(location_ids))
+            row["user_id"] = owners[n % len(owners)]
+            row["mongo_id"] = str(ObjectId())
+            rows.append(row)
+        async with config.AsyncSessionLocal() as db:
+            await db.execute(insert(InventoryMySQL), rows)
+            await db.commit()
+        await inventory.insert_many([
+            {**{key: value for key, value in row.items() if key != "mongo_id"}, "_id": ObjectId(row["mongo_id"])}
+            for row in rows
+        ])
+        print(f"seeded {min(start + BATCH, args.rows)}/{args.rows} inventory rows", file=sys.stderr)
+
+    await inventory_stats.rebuild_sql()
+    await capacity.rebuild_sql()
+    try:
+        if args.mongo == "mongod":
+            from indexes import migrate_mongo
+            await migrate_mongo()
+        await inventory_stats.rebuild_mongo()
+        await capacity.rebuild_mongo()
+    except Exception as exc:
+        # mongomock lacks some aggregation stages; Mongo stats start empty then
+        print(f"warning: MongoDB rebuild failed: {exc}", file=sys.stderr)
+    await build_text_index()
+
+    async with config.AsyncSessionLocal() as db:
+        sample = await db.execute(
+            select(InventoryMySQL.inventory_id, InventoryMySQL.mongo_id)
+            .where(InventoryMySQL.user_id == owners[0]).limit(1000)
+        )
+        ctx = Context(
+            inventory=[tuple(row) for row in sample],
+            locations=[(location.location_id, location.mongo_id) for location in location_rows],
+            spare_user_id=owners[-1],
+        )
+    ctx.tokens = {
+        "admin": create_access_token({"sub": "bench_admin"}),
+        "user": create_access_token({"sub": "bench_user_1"}),
+    }
+    return ctx
+
+
+# Scenarios ===================================================================
+async def _victim_inventory(client, ctx: Context, rng, count: int) -> list:
+    # Items created through the bulk endpoint, as (inventory_id, mongo_id)
+    import config
+    from sqlalchemy import select
+    from models.mysql_models import InventoryMySQL
+
+    mongo_ids = []
+    for start in range(0, count, 1000):
+        body = [_item(rng, rng.choice(ctx.locations)[0]) for _ in range(min(1000, count - start))]
+        response = await client.post("/inventory/bulk", json=body, headers=_auth(ctx, "user"))
+        mongo_ids += [result["mongo_id"] for result in response.json()["results"] if result["mongo_id"]]
+    async with config.AsyncSessionLocal() as db:
+        rows = await db.execute(
+            select(InventoryMySQL.inventory_id, InventoryMySQL.mongo_id).where(InventoryMySQL.mongo_id.in_(mongo_ids))
+        )
+        return [tuple(row) for row in rows]
+
+
+async def _victim_locations(client, ctx: Context, rng, count: int) -> list:
+    import config
+    from sqlalchemy import select
+    from models.mysql_models import LocationMySQL
+
+    location_ids = []
+    for _ in range(count):
+        response = await client.post("/location/", json=_location(rng), headers=_auth(ctx, "admin"))
+        location_ids.append(response.json()["mysql_id"])
+    async with config.AsyncSessionLocal() as db:
+        rows = await db.execute(
+            select(LocationMySQL.location_id, LocationMySQL.mongo_id).where(LocationMySQL.location_id.in_(location_ids))
+        )
+        return [tuple(row) for row in rows]
+
+
+def _location(rng) -> dict:
+    return {
+        "name": f"Store {rng.randint(0, 10 ** 6)}", "address": "1 Bench Rd", "state": rng.choice(STATES),
+        "zip_code": rng.randint(10000, 99999), "capacity": 10 ** 6,
+    }
+
+
+def _auth(ctx: Context, role: str) -> dict:
+    return {"Authorization": f"Bearer {ctx.tokens[role]}"} if role in ctx.tokens else {}
+
+
+def _scenarios() -> List[Scenario]:
+    def item(ctx, rng):
+        return rng.choice(ctx.inventory)
+
+    def location(ctx, rng):
+        return rng.choice(ctx.locations)
+
+    def search(rng):
+        low = rng.randint(5, 300)
+        return f"min_price={low}&max_price={low + 50}&sort=price&limit=50"
+
+    scenarios = []
+    for backend, key in (("mysql", 0), ("mongodb", 1)):
+        scenarios += [
+            Scenario(f"list inventory {backend}", "GET", lambda rng, ctx, v, b=backend: (f"/inventory/{b}?limit=100", None)),
+            Scenario(
+                f"inventory by location {backend}", "GET",
+                lambda rng, ctx, v, b=backend: (f"/inventory/{b}/by_location/{location(ctx, rng)[0]}?limit=100", None),
+            ),
+            Scenario(
+                f"export inventory {backend}", "GET",
+                lambda rng, ctx, v, b=backend: (f"/inventory/{b}/export?format=ndjson", None), max_requests=20,
+            ),
+            Scenario(f"search inventory {backend}", "GET", lambda rng, ctx, v, b=backend: (f"/inventory/{b}/search?{search(rng)}", None)),
+            Scenario(
+                f"text search inventory {backend}", "GET",
+                lambda rng, ctx, v, b=backend: (f"/inventory/{b}/text_search?q={rng.choice(WORDS)}+{rng.choice(COLORS)}", None),
+            ),
+            Scenario(
+                f"inventory stats {backend}", "GET",
+                lambda rng, ctx, v, b=backend: (f"/inventory/{b}/stats?group_by={rng.choice(['location', 'user'])}", None),
+            ),
+            Scenario(
+                f"get inventory {backend}", "GET",
+                lambda rng, ctx, v, b=backend, k=key: (f"/inventory/{b}/{item(ctx, rng)[k]}", None),
+            ),
+            Scenario(
+                f"update inventory {backend}", "PUT",
+                # Every field, so most updates also move the item (stats/capacity path)
+                lambda rng, ctx, v, b=backend, k=key: (
+                    f"/inventory/{b}/{item(ctx, rng)[k]}", _item(rng, location(ctx, rng)[0])
+                ),
+            ),
+            Scenario(
+                f"patch inventory {backend}", "PATCH",
+                # One field that leaves stats and capacity alone: a single UPDATE
+                lambda rng, ctx, v, b=backend, k=key: (
+                    f"/inventory/{b}/{item(ctx, rng)[k]}", {"width": round(rng.uniform(120, 160), 1)}
+                ),
+            ),
+            Scenario(
+                f"adjust stock {backend}", "POST",
+                # Sales and restocks on a few hot items, like busy terminals
+                lambda rng, ctx, v, b=backend, k=key: (
+                    f"/inventory/{b}/{rng.choice(ctx.inventory[:10])[k]}/adjust", {"delta": rng.choice([-1, 2])}
+                ),
+            ),
+            Scenario(
+                f"adjust basket {backend}", "POST",
+                lambda rng, ctx, v, b=backend, k=key: (f"/inventory/{b}/adjust", [
+                    {"inventory_id": entry[k], "delta": rng.choice([-1, 2])} for entry in rng.sample(ctx.inventory[:10], 5)
+                ]),
+            ),
+            Scenario(
+                f"delete inventory {backend}", "DELETE",
+                lambda rng, ctx, v, b=backend, k=key: (f"/inventory/{b}/{v[k]}", None),
+                prepare=_victim_inventory,
+            ),
+            Scenario(
+                f"bulk update inventory {backend}", "PUT",
+                lambda rng, ctx, v, b=backend, k=key: (f"/inventory/{b}/bulk", [
+                    {"inventory_id": entry[k], "price": round(rng.uniform(5, 400), 2)}
+                    for entry in rng.sample(ctx.inventory, min(100, len(ctx.inventory)))
+                ]),
+                max_requests=200,
+            ),
+            Scenario(
+                f"bulk delete inventory {backend}", "DELETE",
+                lambda rng, ctx, v, b=backend, k=key: (f"/inventory/{b}/bulk", [entry[k] for entry in v]),
+                prepare=_victim_inventory, batch=100, max_requests=50,
+            ),
+            Scenario(
+                f"list locations {backend}", "GET", lambda rng, ctx, v, b=backend: (f"/location/{b}?limit=100", None), role="none",
+            ),
+            Scenario(
+                f"export locations {backend}", "GET",
+                lambda rng, ctx, v, b=backend: (f"/location/{b}/export?format=ndjson", None), role="none", max_requests=50,
+            ),
+            Scenario(
+                f"get location {backend}", "GET",
+                lambda rng, ctx, v, b=backend, k=key: (f"/location/{b}/{location(ctx, rng)[k]}", None), role="none",
+            ),
+            Scenario(
+                f"update location {backend}", "PUT",
+                lambda rng, ctx, v, b=backend, k=key: (f"/location/{b}/{location(ctx, rng)[k]}", _location(rng)),
+                role="admin", max_requests=500,
+            ),
+            Scenario(
+                f"delete location {backend}", "DELETE",
+                lambda rng, ctx, v, b=backend, k=key: (f"/location/{b}/{v[k]}", None),
+                role="admin", prepare=_victim_locations, max_requests=200,
+            ),
+        ]
+    scenarios += [
+        Scenario("create inventory", "POST", lambda rng, ctx, v: ("/inventory/", _item(rng, location(ctx, rng)[0]))),
+        Scenario(
+            "bulk create inventory", "POST",
+            lambda rng, ctx, v: ("/inventory/bulk", [_item(rng, location(ctx, rng)[0]) for _ in range(100)]),
+            max_requests=200,
+        ),
+        Scenario("hedged get inventory", "GET", lambda rng, ctx, v: (f"/inventory/{item(ctx, rng)[1]}", None)),
+        Scenario("hedged get location", "GET", lambda rng, ctx, v: (f"/location/{location(ctx, rng)[1]}", None), role="none"),
+        Scenario("create location", "POST", lambda rng, ctx, v: ("/location/", _location(rng)), role="admin", max_requests=200),
+        # bcrypt bound, see HASH_WORKERS / BCRYPT_ROUNDS
+        Scenario(
+            "register", "POST",
+            lambda rng, ctx, v: ("/auth/register", {
+                "username": f"u{rng.getrandbits(48):x}", "email": f"{rng.getrandbits(48):x}@example.com", "password": PASSWORD,
+            }),
+            role="none", max_requests=100,
+        ),
+        Scenario(
+            "login", "POST", lambda rng, ctx, v: ("/auth/login", {"username": "bench_user_1", "password": PASSWORD}),
+            role="none", max_requests=100, form=True,
+        ),
+        Scenario("me", "GET", lambda rng, ctx, v: ("/auth/me", None)),
+        Scenario("logout", "POST", lambda rng, ctx, v: ("/auth/logout", None)),
+        Scenario(
+            "change role", "PUT", lambda rng, ctx, v: (f"/auth/users/{ctx.spare_user_id}/role", {"role": "user"}),
+            role="admin", max_requests=500,
+        ),
+        Scenario("metrics", "GET", lambda rng, ctx, v: ("/metrics", None), role="none", max_requests=200),
+    ]
+    for path in ("replication", "auth-cache", "hashing", "location-cache", "read-latency", "pools", "slow-queries"):
+        scenarios.append(Scenario(
+            f"internal {path}", "GET", lambda rng, ctx, v, p=path: (f"/internal/{p}", None), role="admin", max_requests=200,
+        ))
+    return scenarios
+
+
+# Driver ======================================================================
+def _percentile(ordered: List[float], q: float) -> Optional[float]:
+    if not ordered:
+        return None
+    return ordered[min(len(ordered) - 1, int(q / 100 * len(ordered)))]
+
+
+async def _drive(client, scenario: Scenario, ctx: Context, rng, requests: int, concurrency: int) -> dict:
+    victims = []
+    if scenario.prepare is not None:
+        victims = await scenario.prepare(client, ctx, rng, requests * scenario.batch)
+        if scenario.batch > 1:
+            victims = [victims[n:n + scenario.batch] for n in range(0, len(victims), scenario.batch)]
+        requests = len(victims)
+    latencies = []
+    statuses = Counter()
+    next_request = 0
+
+    async def worker():
+        nonlocal next_request
+        while next_request < requests:
+            victim = victims[next_request] if victims else None
+            next_request += 1
+            path, body = scenario.request(rng, ctx, victim)
+            kwargs = {"headers": _auth(ctx, scenario.role)}
+            if body is not None:
+                kwargs["data" if scenario.form else "json"] = body
+            started = time.perf_counter()
+            response = await client.request(scenario.method, path, **kwargs)
+            await response.aread()
+            latencies.append(time.perf_counter() - started)
+            statuses[response.status_code] += 1
+
+    started = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(min(concurrency, requests))))
+    elapsed = time.perf_counter() - started
+
+    latencies.sort()
+    return {
+        "requests": requests,
+        "errors": sum(count for status, count in statuses.items() if status >= 400),
+        "statuses": {str(status): count for status, count in sorted(statuses.items())},
+        "req_per_s": round(requests / elapsed, 2) if elapsed else None,
+        "p50_ms": _ms(_percentile(latencies, 50)),
+        "p95_ms": _ms(_percentile(latencies, 95)),
+        "p99_ms": _ms(_percentile(latencies, 99)),
+    }
+
+
+def _ms(seconds: Optional[float]) -> Optional[float]:
+    return None if seconds is None else round(seconds * 1000, 3)
+
+
+async def _run(args) -> dict:
+    import httpx
+
+    config, main = _boot(args)
+    if args.mongo == "mongod":
+        await config.async_mongo_client.drop_database(args.mongo_db)
+    rng = random.Random(args.seed)
+
+    results = {}
+    async with main.lifespan(main.app):
+        ctx = await _seed(args, config, rng)
+        transport = httpx.ASGITransport(app=main.app, raise_app_exceptions=False)
+        async with httpx.AsyncClient(transport=transport, base_url="http://bench") as client:
+            for scenario in _scenarios():
+                if args.only and not any(part in scenario.name for part in args.only):
+                    continue
+                requests = min(args.requests, scenario.max_requests or args.requests)
+                results[scenario.name] = await _drive(client, scenario, ctx, rng, requests, args.concurrency)
+                _print_row(scenario.name, results[scenario.name])
+
+    return {
+        "created": datetime.now(timezone.utc).isoformat(),
+        "rows": args.rows,
+        "users": args.users,
+        "mongo": args.mongo,
+        "concurrency": args.concurrency,
+        "python": sys.version.split()[0],
+        "scenarios": results,
+    }
+
+
+def _print_row(name: str, result: dict) -> None:
+    print(
+        f"{name:<40} {result['req_per_s'] or 0:>9.1f} req/s  p50 {result['p50_ms'] or 0:>8.2f}  "
+        f"p95 {result['p95_ms'] or 0:>8.2f}  p99 {result['p99_ms'] or 0:>8.2f} ms  errors {result['errors']}"
+    )
+
+
+# Baselines ===================================================================
+def compare(baseline: dict, current: dict, threshold: float) -> List[str]:
+    if baseline.get("rows") != current.get("rows") or baseline.get("mongo") != current.get("mongo"):
+        print("warning: baseline was taken with different --rows or --mongo", file=sys.stderr)
+    regressions = []
+    for name, before in baseline["scenarios"].items():
+        after = current["scenarios"].get(name)
+        if after is None:
+            continue
+        if before["p95_ms"] and after["p95_ms"] and after["p95_ms"] > before["p95_ms"] * (1 + threshold):
+            regressions.append(f"{name}: p95 {before['p95_ms']} -> {after['p95_ms']} ms")
+        if before["req_per_s"] and after["req_per_s"] and after["req_per_s"] < before["req_per_s"] * (1 - threshold):
+            regressions.append(f"{name}: {before['req_per_s']} -> {after['req_per_s']} req/s")
+        if after["errors"] > before["errors"]:
+            regressions.append(f"{name}: errors {before['errors']} -> {after['errors']}")
+    return regressions
+
+
+def _load(path: str) -> dict:
+    with open(path, encoding="utf-8") as results_file:
+        return json.load(results_file)
+
+
+def _report(regressions: List[str], threshold: float) -> int:
+    for regression in regressions:
+        print(f"REGRESSION {regression}")
+    print(f"{len(regressions)} regression(s) beyond {threshold:.0%}")
+    return 1 if regressions else 0
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description="Benchmark the API against local database stand-ins")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    run = commands.add_parser("run", help="seed, benchmark every scenario and print the results")
+    run.add_argument("--rows", type=int, default=1000, help="inventory rows to seed (e.g. 1000, 100000, 1000000)")
+    run.add_argument("--users", type=int, default=10)
+    run.add_argument("--requests", type=int, default=1000, help="requests per scenario")
+    run.add_argument("--concurrency", type=int, default=32)
+    run.add_argument("--mongo", choices=["memory", "mongod"], default="memory",
+                     help="mongomock double, or the mongod at MONGO_DATABASE_URL")
+    run.add_argument("--mongo-db", default="glassview-bench", help="scratch database, dropped before seeding")
+    run.add_argument("--only", nargs="*", help="run scenarios whose name contains any of these")
+    run.add_argument("--seed", type=int, default=449)
+    run.add_argument("--workdir", help="directory for the SQLite file (default: a temporary one)")
+    run.add_argument("--save", help="write the results to this JSON file")
+    run.add_argument("--compare", help="baseline JSON to compare against")
+    run.add_argument("--threshold", type=float, default=0.10)
+
+    diff = commands.add_parser("compare", help="compare two saved results")
+    diff.add_argument("baseline")
+    diff.add_argument("current")
+    diff.add_argument("--threshold", type=float, default=0.10)
+
+    args = parser.parse_args()
+    if args.command == "compare":
+        return _report(compare(_load(args.baseline), _load(args.current), args.threshold), args.threshold)
+
+    temporary = args.workdir is None
+    args.workdir = os.path.abspath(args.workdir or tempfile.mkdtemp(prefix="glassview-bench-"))
+    os.makedirs(args.workdir, exist_ok=True)
+    if os.path.exists(os.path.join(args.workdir, "bench.db")):
+        os.remove(os.path.join(args.workdir, "bench.db"))
+    try:
+        results = asyncio.run(_run(args))
+    finally:
+        if temporary:
+            shutil.rmtree(args.workdir, ignore_errors=True)
+
+    if args.save:
+        os.makedirs(os.path.dirname(os.path.abspath(args.save)), exist_ok=True)
+        with open(args.save, "w", encoding="utf-8") as results_file:
+            json.dump(results, results_file, indent=2)
+    if args.compare:
+        return _report(compare(_load(args.compare), results, args.threshold), args.threshold)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
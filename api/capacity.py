@@ -0,0 +1,214 @@
+import argparse
+import asyncio
+import logging
+from collections import defaultdict
+from typing import Awaitable, Callable, Dict, Iterable, List, Set
+
+from bson import ObjectId
+from fastapi import HTTPException
+from pymongo import UpdateMany, UpdateOne
+from sqlalchemy import func, select, update
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from config import AsyncSessionLocal, get_async_mongo_collection
+from models.mysql_models import InventoryMySQL, LocationMySQL
+
+# Location capacity enforcement. Each location keeps a `used` counter (units
+# stocked there) next to its capacity, in the MySQL row and the Mongo
+# document. Inventory writes move the counter with one conditional update
+# per location touched, so a write that would overfill a location matches no
+# row and is rejected, without summing the location's inventory and without
+# a race between concurrent writers.
+#
+# `python capacity.py rebuild` recomputes the counters from inventory. On
+# MongoDB it first copies location_id onto location documents created before
+# the counters existed, which are matched through the MySQL row's mongo_id.
+
+CAPACITY_EXCEEDED = "Location capacity exceeded"
+
+logger = logging.getLogger(__name__)
+
+
+def capacity_exceeded() -> HTTPException:
+    return HTTPException(status_code=409, detail=CAPACITY_EXCEEDED)
+
+
+def occupancy_deltas(changes: Iterable) -> Dict[int, int]:
+    # changes: (before, after) pairs of inventory_stats.stats_row() dicts.
+    # Returns {location_id: units added}, in location_id order so concurrent
+    # writers always lock locations in the same order. A row without a
+    # location occupies nothing
+    deltas = defaultdict(int)
+    for before, after in changes:
+        if before is not None and before["location_id"] is not None:
+            deltas[before["location_id"]] -= before["quantity"] or 0
+        if after is not None and after["location_id"] is not None:
+            deltas[after["location_id"]] += after["quantity"] or 0
+    return {location_id: delta for location_id, delta in sorted(deltas.items()) if delta}
+
+
+def occupancy_from_stats(stats: List[dict]) -> Dict[int, int]:
+    # The same, from inventory_stats deltas
+    deltas = defaultdict(int)
+    for delta in stats:
+        deltas[delta["location_id"]] += delta["total_units"]
+    return {location_id: delta for location_id, delta in sorted(deltas.items()) if delta}
+
+
+def reversed_occupancy(deltas: Dict[int, int]) -> Dict[int, int]:
+    return {location_id: -delta for location_id, delta in deltas.items()}
+
+
+async def _reserve(changes: dict, apply: Callable[[Dict[int, int]], Awaitable[List[int]]]) -> Set:
+    # Bulk writes: changes maps an item key to its (before, after) pair.
+    # apply() applies the combined deltas all-or-nothing and returns the
+    # full locations; items adding units to one are dropped and the rest
+    # retried. Returns the keys of the dropped items
+    rejected = set()
+    while True:
+        occupancy = occupancy_deltas(
+            change for key, change in changes.items() if key not in rejected
+        )
+        full = await apply(occupancy)
+        if not full:
+            return rejected
+        for key, change in changes.items():
+            if key not in rejected:
+                item = occupancy_deltas([change])
+                if any(item.get(location_id, 0) > 0 for location_id in full):
+                    rejected.add(key)
+
+
+# MySQL =======================================================================
+async def adjust_sql(db: AsyncSession, deltas: Dict[int, int], enforce: bool = True) -> List[int]:
+    # Runs in the caller's transaction. Increases are only applied while they
+    # fit; returns the locations that had no room, whose deltas were not
+    # applied. Callers roll back (or drop those items) when it is non-empty.
+    # Unknown locations are left to the inventory foreign key
+    rejected = []
+    for location_id, delta in deltas.items():
+        stmt = (
+            update(LocationMySQL)
+            .where(LocationMySQL.location_id == location_id)
+            .values(used=LocationMySQL.used + delta)
+        )
+        if enforce and delta > 0:
+            stmt = stmt.where(LocationMySQL.used + delta <= LocationMySQL.capacity)
+        result = await db.execute(stmt)
+        if result.rowcount == 0 and enforce and delta > 0:
+            exists = await db.execute(
+                select(LocationMySQL.location_id).where(LocationMySQL.location_id == location_id)
+            )
+            if exists.first() is not None:
+                rejected.append(location_id)
+    return rejected
+
+
+async def reserve_sql(db: AsyncSession, changes: dict) -> Set:
+    async def apply(occupancy):
+        savepoint = await db.begin_nested()
+        full = await adjust_sql(db, occupancy)
+        if full:
+            await savepoint.rollback()
+        else:
+            await savepoint.commit()
+        return full
+    return await _reserve(changes, apply)
+
+
+async def rebuild_sql() -> None:
+    async with AsyncSessionLocal() as db:
+        used = (
+            select(func.coalesce(func.sum(InventoryMySQL.quantity), 0))
+            .where(InventoryMySQL.location_id == LocationMySQL.location_id)
+            .scalar_subquery()
+        )
+        await db.execute(update(LocationMySQL).values(used=used))
+        await db.commit()
+
+
+# MongoDB =====================================================================
+def _fits(delta: int) -> dict:
+    return {"$expr": {"$lte": [{"$add": [{"$ifNull": ["$used", 0]}, delta]}, "$capacity"]}}
+
+
+async def adjust_mongo(
+    deltas: Dict[int, int], enforce: bool = True, all_or_nothing: bool = True
+) -> List[int]:
+    # Location documents are matched on location_id, the key inventory
+    # documents refer to. Returns the locations that had no room; with
+    # all_or_nothing the deltas already applied are then undone
+    collection = get_async_mongo_collection("location")
+    applied, rejected = {}, []
+    for location_id, delta in deltas.items():
+        query = {"location_id": location_id}
+        if enforce and delta > 0:
+            query.update(_fits(delta))
+        result = await collection.update_one(query, {"$inc": {"used": delta}})
+        if result.matched_count:
+            applied[location_id] = delta
+        elif await collection.find_one({"location_id": location_id}, {"_id": 1}):
+            if enforce and delta > 0:
+                rejected.append(location_id)
+                if all_or_nothing:
+                    break
+        else:
+            logger.warning(
+                "No MongoDB location has location_id %s, run `python capacity.py rebuild`",
+                location_id,
+            )
+    if rejected and all_or_nothing:
+        await adjust_mongo(reversed_occupancy(applied), enforce=False)
+    return rejected
+
+
+async def reserve_mongo(changes: dict) -> Set:
+    return await _reserve(changes, adjust_mongo)
+
+
+async def _backfill_mongo_locations() -> list:
+    # Location documents written before capacity tracking have no
+    # location_id (nor used/version). Returns the bulk ops that add them
+    async with AsyncSessionLocal() as db:
+        result = await db.execute(
+            select(LocationMySQL.location_id, LocationMySQL.mongo_id)
+            .where(LocationMySQL.mongo_id.is_not(None))
+        )
+        rows = result.all()
+    ops = [
+        UpdateOne(
+            {"_id": ObjectId(mongo_id), "location_id": {"$ne": location_id}},
+            {"$set": {"location_id": location_id}},
+        )
+        for location_id, mongo_id in rows
+        if ObjectId.is_valid(mongo_id)
+    ]
+    ops.append(UpdateMany({"version": {"$exists": False}}, {"$set": {"version": 1}}))
+    return ops
+
+
+async def rebuild_mongo() -> None:
+    cursor = await get_async_mongo_collection("inventory").aggregate(
+        [{"$group": {"_id": "$location_id", "used": {"$sum": "$quantity"}}}]
+    )
+    ops = await _backfill_mongo_locations()
+    ops.append(UpdateMany({}, {"$set": {"used": 0}}))
+    ops += [
+        UpdateOne({"location_id": doc["_id"]}, {"$set": {"used": doc["used"]}})
+        async for doc in cursor
+    ]
+    await get_async_mongo_collection("location").bulk_write(ops, ordered=True)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Maintain location occupancy counters")
+    parser.add_argument("command", choices=["rebuild"])
+    parser.add_argument("--backend", choices=["mysql", "mongodb", "all"], default="all")
+    args = parser.parse_args()
+
+    if args.backend in ("mysql", "all"):
+        asyncio.run(rebuild_sql())
+        print("rebuilt MySQL location.used")
+    if args.backend in ("mongodb", "all"):
+        asyncio.run(rebuild_mongo())
+        print("rebuilt MongoDB location.used")
@@ -0,0 +1,87 @@
+import csv
+import io
+import json
+from typing import AsyncIterator, Type
+
+from fastapi import Query
+from fastapi.responses import StreamingResponse
+from pydantic import BaseModel
+from pymongo.asynchronous.collection import AsyncCollection
+from sqlalchemy import Select
+
+from config import AsyncSessionLocal
+
+# Streaming NDJSON/CSV exports. Rows are pulled from a server-side cursor in
+# batches of EXPORT_BATCH_SIZE and written out as they arrive, so memory use
+# does not depend on the size of the export.
+
+EXPORT_BATCH_SIZE = 1000
+
+MEDIA_TYPES = {"ndjson": "application/x-ndjson", "csv": "text/csv"}
+
+
+# Dependency that parses ?format=
+def export_format(format: str = Query("ndjson", pattern="^(ndjson|csv)$")) -> str:
+    return format
+
+
+async def _sql_records(stmt: Select) -> AsyncIterator:
+    # The request's session is closed before a StreamingResponse body runs,
+    # so the export opens its own
+    async with AsyncSessionLocal() as db:
+        result = await db.stream_scalars(stmt.execution_options(yield_per=EXPORT_BATCH_SIZE))
+        async for row in result:
+            yield row
+
+
+async def _mongo_records(collection: AsyncCollection, query: dict) -> AsyncIterator:
+    cursor = collection.find(query).sort("_id", 1).batch_size(EXPORT_BATCH_SIZE)
+    async for doc in cursor:
+        yield doc
+
+
+async def _encode(records: AsyncIterator, schema: Type[BaseModel], fmt: str) -> AsyncIterator[str]:
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    header_written = False
+    pending = 0
+
+    async for record in records:
+        # Same shape as the JSON read endpoints
+        data = schema.model_validate(record).model_dump(mode="json", by_alias=True)
+        if fmt == "ndjson":
+            buffer.write(json.dumps(data, separators=(",", ":")))
+            buffer.write("\n")
+        else:
+            if not header_written:
+                writer.writerow(data.keys())
+                header_written = True
+            writer.writerow(data.values())
+
+        pending += 1
+        if pending == EXPORT_BATCH_SIZE:
+            yield buffer.getvalue()
+            buffer.seek(0)
+            buffer.truncate()
+            pending = 0
+
+    if buffer.tell():
+        yield buffer.getvalue()
+
+
+def _response(records: AsyncIterator, schema: Type[BaseModel], fmt: str, name: str):
+    return StreamingResponse(
+        _encode(records, schema, fmt),
+        media_type=MEDIA_TYPES[fmt],
+        headers={"Content-Disposition": f'attachment; filename="{name}.{fmt}"'},
+    )
+
+
+def stream_sql_export(stmt: Select, schema: Type[BaseModel], fmt: str, name: str):
+    return _response(_sql_records(stmt), schema, fmt, name)
+
+
+def stream_mongo_export(
+    collection: AsyncCollection, query: dict, schema: Type[BaseModel], fmt: str, name: str
+):
+    return _response(_mongo_records(collection, query), schema, fmt, name)
@@ -0,0 +1,93 @@
+import asyncio
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from fastapi import HTTPException
+from passlib.context import CryptContext
+
+from config import BCRYPT_ROUNDS, HASH_MAX_QUEUE, HASH_WORKERS
+
+# bcrypt runs on its own small thread pool so a burst of logins cannot starve
+# the threadpool (and event loop) that serves everything else. When more than
+# HASH_WORKERS + HASH_MAX_QUEUE hashes are in flight, new ones are rejected
+# straight away with a 503 instead of queueing behind the burst.
+
+# min/max rounds pin the cost: hashes made with any other cost are flagged by
+# verify_and_update() and rehashed on the next successful login
+pwd_context = CryptContext(
+    schemes=["bcrypt"],
+    deprecated="auto",
+    bcrypt__default_rounds=BCRYPT_ROUNDS,
+    bcrypt__min_rounds=BCRYPT_ROUNDS,
+    bcrypt__max_rounds=BCRYPT_ROUNDS,
+)
+
+_executor = ThreadPoolExecutor(max_workers=HASH_WORKERS, thread_name_prefix="bcrypt")
+_in_flight = 0
+
+hashing_stats = {
+    "hashes": 0,
+    "rejected": 0,
+    "rehashed": 0,
+    "hash_seconds_total": 0.0,
+    "hash_seconds_max": 0.0,
+    "queue_wait_seconds_total": 0.0,
+    "queue_wait_seconds_max": 0.0,
+}
+
+
+async def _run(fn, *args):
+    global _in_flight
+    if _in_flight >= HASH_WORKERS + HASH_MAX_QUEUE:
+        hashing_stats["rejected"] += 1
+        raise HTTPException(
+            status_code=503,
+            detail="Authentication is busy, please retry",
+            headers={"Retry-After": "1"},
+        )
+
+    submitted = time.perf_counter()
+
+    def job():
+        started = time.perf_counter()
+        result = fn(*args)
+        return result, started - submitted, time.perf_counter() - started
+
+    _in_flight += 1
+    try:
+        result, waited, took = await asyncio.get_running_loop().run_in_executor(_executor, job)
+    finally:
+        _in_flight -= 1
+
+    hashing_stats["hashes"] += 1
+    hashing_stats["hash_seconds_total"] += took
+    hashing_stats["hash_seconds_max"] = max(hashing_stats["hash_seconds_max"], took)
+    hashing_stats["queue_wait_seconds_total"] += waited
+    hashing_stats["queue_wait_seconds_max"] = max(hashing_stats["queue_wait_seconds_max"], waited)
+    return result
+
+
+async def hash_password(password: str) -> str:
+    return await _run(pwd_context.hash, password)
+
+
+async def verify_and_update(password: str, hashed_password: str):
+    # Returns (matches, new_hash); new_hash is set when the stored hash used
+    # a different cost and should be replaced
+    matches, new_hash = await _run(pwd_context.verify_and_update, password, hashed_password)
+    if new_hash:
+        hashing_stats["rehashed"] += 1
+    return matches, new_hash
+
+
+def get_hashing_stats() -> dict:
+    hashes = hashing_stats["hashes"]
+    return {
+        **hashing_stats,
+        "in_flight": _in_flight,
+        "workers": HASH_WORKERS,
+        "max_queue": HASH_MAX_QUEUE,
+        "bcrypt_rounds": BCRYPT_ROUNDS,
+        "hash_seconds_avg": hashing_stats["hash_seconds_total"] / hashes if hashes else 0.0,
+        "queue_wait_seconds_avg": hashing_stats["queue_wait_seconds_total"] / hashes if hashes else 0.0,
+    }
@@ -0,0 +1,143 @@
+import asyncio
+import math
+import time
+from collections import deque
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Tuple
+
+from config import HEDGE_MAX_DELAY, HEDGE_MIN_DELAY, HEDGE_WINDOW
+
+# Hedged reads for entities stored in both MySQL and MongoDB (looked up by
+# mongo_id on both sides). The backend with the lower moving p95 is asked
+# first; if it has not answered after its own p95, the same read is sent to
+# the other backend and whichever answers first wins. A miss or an error on
+# one side falls through to the other, so replication lag does not turn into
+# a 404. Losing reads are left to finish in the background (each opens its
+# own session) and still feed the latency windows.
+
+
+class LatencyTracker:
+    def __init__(self, window: int):
+        self.window = window
+        self._samples = {}  # backend -> deque of seconds, inf for a failure
+        self.requests = 0
+        self.hedges = 0
+        self.hedge_wins = 0
+        self.served_by = {}
+
+    def record(self, backend: str, seconds: float) -> None:
+        self._samples.setdefault(backend, deque(maxlen=self.window)).append(seconds)
+
+    def percentile(self, backend: str, q: float) -> Optional[float]:
+        samples = self._samples.get(backend)
+        if not samples:
+            return None
+        ordered = sorted(samples)
+        return ordered[min(len(ordered) - 1, int(q / 100 * len(ordered)))]
+
+    def ranked(self, backends: List[str]) -> List[str]:
+        # Backends without samples go first so they get measured
+        return sorted(backends, key=lambda backend: self.percentile(backend, 95) or 0.0)
+
+    def hedge_delay(self, backend: str) -> float:
+        p95 = self.percentile(backend, 95)
+        if p95 is None:
+            return HEDGE_MAX_DELAY
+        return min(max(p95, HEDGE_MIN_DELAY), HEDGE_MAX_DELAY)
+
+    def stats(self) -> dict:
+        def seconds(value):
+            return None if value is None or math.isinf(value) else value
+
+        return {
+            "requests": self.requests,
+            "hedges": self.hedges,
+            "hedge_wins": self.hedge_wins,
+            "served_by": dict(self.served_by),
+            "backends": {
+                backend: {
+                    "samples": len(samples),
+                    "failures": sum(math.isinf(sample) for sample in samples),
+                    "p50": seconds(self.percentile(backend, 50)),
+                    "p95": seconds(self.percentile(backend, 95)),
+                    "p99": seconds(self.percentile(backend, 99)),
+                }
+                for backend, samples in self._samples.items()
+            },
+        }
+
+
+read_latency = LatencyTracker(HEDGE_WINDOW)
+
+# Strong references to reads still running after another backend answered
+_background = set()
+
+
+async def _timed(tracker: LatencyTracker, backend: str, loader: Callable[[], Awaitable]):
+    started = time.perf_counter()
+    try:
+        result = await loader()
+    except Exception:
+        tracker.record(backend, math.inf)
+        raise
+    tracker.record(backend, time.perf_counter() - started)
+    return result
+
+
+async def hedged_read(
+    loaders: Dict[str, Callable[[], Awaitable]], tracker: LatencyTracker = read_latency
+) -> Tuple[Optional[str], Any]:
+    # loaders: backend name -> coroutine function returning the entity or
+    # None. Returns (backend, entity), or (None, None) when no backend has it.
+    # Raises the last error if every backend failed
+    tracker.requests += 1
+    order = tracker.ranked(list(loaders))
+    primary = order[0]
+    waiting = order[1:]
+    tasks = {}
+
+    def start(backend: str) -> None:
+        tasks[asyncio.create_task(_timed(tracker, backend, loaders[backend]))] = backend
+
+    start(primary)
+    pending = set(tasks)
+    hedged = False
+    error = None
+    while pending:
+        done, pending = await asyncio.wait(
+            pending,
+            timeout=tracker.hedge_delay(primary) if waiting else None,
+            return_when=asyncio.FIRST_COMPLETED,
+        )
+        if not done:
+            # The primary is slower than its p95: hedge
+            tracker.hedges += 1
+            hedged = True
+            start(waiting.pop(0))
+            pending = {task for task in tasks if not task.done()}
+            continue
+        for task in done:
+            if task.exception() is not None:
+                error = task.exception()
+            elif task.result() is not None:
+                backend = tasks[task]
+                if hedged and backend != primary:
+                    tracker.hedge_wins += 1
+                tracker.served_by[backend] = tracker.served_by.get(backend, 0) + 1
+                for other in pending:
+                    _background.add(other)
+                    other.add_done_callback(_discard)
+                return backend, task.result()
+        # A miss or an error: ask the next backend right away
+        if waiting:
+            start(waiting.pop(0))
+            pending = {task for task in tasks if not task.done()}
+
+    if error is not None and all(task.exception() is not None for task in tasks):
+        raise error
+    return None, None
+
+
+def _discard(task: asyncio.Task) -> None:
+    _background.discard(task)
+    if not task.cancelled():
+        task.exception()  # retrieved, so it is not logged as never retrieved
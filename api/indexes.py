@@ -0,0 +1,256 @@
+import argparse
+import asyncio
+import sys
+from typing import List
+
+from bson import ObjectId
+from pymongo import ASCENDING, TEXT, IndexModel
+from sqlalchemy import func, inspect, select
+from sqlalchemy.dialects.mysql import match
+
+from config import async_engine, async_mongo_db
+from inventory_search import InventoryFilters, mongo_query, mongo_sort, sql_conditions, sql_order
+from models.mysql_models import (
+    Base, InventoryMySQL, InventoryStatsMySQL, LocationMySQL, OutboxMySQL, UserMySql,
+)
+from principal_cache import Principal
+
+# Registry of the indexes both backends need, and the query shapes they serve.
+# MySQL indexes are declared on the models (index=True / __table_args__);
+# MongoDB indexes are declared in MONGO_INDEXES below. Nothing is created at
+# import time; run the migration once per deploy instead (from api/):
+#
+#   python indexes.py migrate [--prune]  # create missing indexes (and drop
+#                                        # Mongo indexes not in the registry)
+#   python indexes.py check              # EXPLAIN every query shape, exit 1
+#                                        # if any of them is a full scan
+#
+# Unfiltered admin listings and exports walk the primary key / _id under a
+# LIMIT or as a stream and are not checked.
+
+MONGO_INDEXES = {
+    "inventory": [
+        # Compound indexes end in _id so keyset pages (sorted by _id) are index scans
+        IndexModel([("user_id", ASCENDING), ("_id", ASCENDING)]),
+        IndexModel([("location_id", ASCENDING), ("_id", ASCENDING)]),
+        IndexModel([("location_id", ASCENDING), ("user_id", ASCENDING), ("_id", ASCENDING)]),
+        # Search: equality on owner/location, then price range/sort. Searches
+        # sort on (field, _id), so the keys end in _id too
+        IndexModel([("user_id", ASCENDING), ("price", ASCENDING), ("_id", ASCENDING)]),
+        IndexModel([("user_id", ASCENDING), ("width", ASCENDING), ("_id", ASCENDING)]),
+        IndexModel([("user_id", ASCENDING), ("quantity", ASCENDING), ("_id", ASCENDING)]),
+        IndexModel([("user_id", ASCENDING), ("name", ASCENDING), ("_id", ASCENDING)]),
+        IndexModel([("location_id", ASCENDING), ("price", ASCENDING), ("_id", ASCENDING)]),
+        IndexModel([("price", ASCENDING), ("_id", ASCENDING)]),
+        # Full-text search, name matches weigh more than description matches
+        IndexModel([("name", TEXT), ("description", TEXT)], weights={"name": 2, "description": 1}),
+    ],
+    "location": [
+        IndexModel([("zip_code", ASCENDING)]),
+        # Capacity counters are matched on the MySQL location_id
+        IndexModel([("location_id", ASCENDING)]),
+    ],
+    "inventory_stats": [
+        # Summary totals, one document per (location, user)
+        IndexModel([("location_id", ASCENDING), ("user_id", ASCENDING)], unique=True),
+        IndexModel([("user_id", ASCENDING)]),
+    ],
+}
+
+
+# Migration ===================================================================
+def _create_missing_sql(conn) -> List[str]:
+    # create_all() adds missing tables but not indexes added to existing ones
+    Base.metadata.create_all(conn)
+    inspector = inspect(conn)
+    created = []
+    for table in Base.metadata.sorted_tables:
+        existing = {index["name"] for index in inspector.get_indexes(table.name)}
+        for index in table.indexes:
+            if index.name not in existing:
+                index.create(conn)
+                created.append(f"{table.name}.{index.name}")
+    return created
+
+
+async def migrate_sql() -> List[str]:
+    async with async_engine.begin() as conn:
+        return await conn.run_sync(_create_missing_sql)
+
+
+async def migrate_mongo(prune: bool = False) -> List[str]:
+    changes = []
+    for name, models in MONGO_INDEXES.items():
+        collection = async_mongo_db[name]
+        created = await collection.create_indexes(models)
+        changes += [f"{name}.{index} (ensured)" for index in created]
+        if prune:
+            wanted = {model.document["name"] for model in models} | {"_id_"}
+            async for index in await collection.list_indexes():
+                if index["name"] not in wanted:
+                    await collection.drop_index(index["name"])
+                    changes.append(f"{name}.{index['name']} (dropped)")
+    return changes
+
+
+# Query shapes ================================================================
+# Sample principals and filters; only the shape of each query matters
+_USER = Principal(user_id=1, username="explain", role="user")
+_ADMIN = Principal(user_id=1, username="explain", role="admin")
+
+
+def _filters(**overrides) -> InventoryFilters:
+    values = dict(
+        min_price=None, max_price=None, min_width=None, max_width=None, location_id=None,
+        tinted=None, polarized=None, anti_glare=None, prescription_avail=None,
+        sort="price", limit=50,
+    )
+    values.update(overrides)
+    return InventoryFilters(**values)
+
+
+# Sort fields with their own (user_id, field) index, besides price
+_SORTED_BY_USER = ("width", "quantity", "name")
+
+
+def _sql_search(filters: InventoryFilters, principal: Principal):
+    return (
+        select(InventoryMySQL)
+        .where(*sql_conditions(filters, principal)).order_by(*sql_order(filters)).limit(50)
+    )
+
+
+def _mongo_search(filters: InventoryFilters, principal: Principal) -> tuple:
+    return "inventory", mongo_query(filters, principal), mongo_sort(filters)
+
+
+def sql_query_shapes() -> dict:
+    page = 101
+    shapes = {
+        "inventory page by user": select(InventoryMySQL)
+            .where(InventoryMySQL.user_id == 1).order_by(InventoryMySQL.inventory_id).limit(page),
+        "inventory page by location": select(InventoryMySQL)
+            .where(InventoryMySQL.location_id == 1).order_by(InventoryMySQL.inventory_id).limit(page),
+        "inventory page by location and user": select(InventoryMySQL)
+            .where(InventoryMySQL.location_id == 1, InventoryMySQL.user_id == 1)
+            .order_by(InventoryMySQL.inventory_id).limit(page),
+        "inventory by id and user": select(InventoryMySQL)
+            .where(InventoryMySQL.inventory_id == 1, InventoryMySQL.user_id == 1),
+        "inventory by mongo_id": select(InventoryMySQL.mongo_id, InventoryMySQL.inventory_id)
+            .where(InventoryMySQL.mongo_id.in_([str(ObjectId())])),
+        "search by user": _sql_search(_filters(min_price=10, max_price=50), _USER),
+        "search by location": _sql_search(_filters(location_id=1, max_price=50, sort="-price"), _ADMIN),
+        "search by price": _sql_search(_filters(min_price=10, max_price=50), _ADMIN),
+        **{
+            f"search by user sorted by {field}": _sql_search(_filters(sort=field), _USER)
+            for field in _SORTED_BY_USER
+        },
+        "search facets by user": select(func.count())
+            .where(*sql_conditions(_filters(tinted=True), _USER)),
+        "location by id": select(LocationMySQL).where(LocationMySQL.location_id == 1),
+        "user by username": select(UserMySql).where(UserMySql.username == "explain"),
+        "stats by user": select(InventoryStatsMySQL.location_id, func.sum(InventoryStatsMySQL.total_units))
+            .where(InventoryStatsMySQL.user_id == 1).group_by(InventoryStatsMySQL.location_id),
+        "outbox pending": select(OutboxMySQL)
+            .where(OutboxMySQL.applied_at.is_(None)).order_by(OutboxMySQL.outbox_id).limit(500),
+    }
+    if async_engine.dialect.name == "mysql":
+        score = match(InventoryMySQL.name, InventoryMySQL.description, against="explain")
+        shapes["text search"] = select(InventoryMySQL).where(score > 0, InventoryMySQL.user_id == 1)
+    return shapes
+
+
+def mongo_query_shapes() -> dict:
+    # name -> (collection, filter, sort)
+    by_id = [("_id", ASCENDING)]
+    return {
+        "inventory page by user": ("inventory", {"user_id": 1}, by_id),
+        "inventory page by location": ("inventory", {"location_id": 1}, by_id),
+        "inventory page by location and user": ("inventory", {"location_id": 1, "user_id": 1}, by_id),
+        "inventory by id and user": ("inventory", {"_id": ObjectId(), "user_id": 1}, None),
+        "search by user": _mongo_search(_filters(min_price=10, max_price=50), _USER),
+        "search by location": _mongo_search(_filters(location_id=1, max_price=50, sort="-price"), _ADMIN),
+        "search by price": _mongo_search(_filters(min_price=10, max_price=50), _ADMIN),
+        **{
+            f"search by user sorted by {field}": _mongo_search(_filters(sort=field), _USER)
+            for field in _SORTED_BY_USER
+        },
+        "text search": ("inventory", {"$text": {"$search": "explain"}, "user_id": 1}, None),
+        "location by location_id": ("location", {"location_id": 1}, None),
+        "stats by user": ("inventory_stats", {"user_id": 1}, None),
+        "stats by location and user": ("inventory_stats", {"location_id": 1, "user_id": 1}, None),
+    }
+
+
+# Explain checks ==============================================================
+def _sql_full_scans(dialect: str, plan: List[dict]) -> List[str]:
+    if dialect == "mysql":
+        return [f"type=ALL on {row['table']}" for row in plan if row.get("type") == "ALL"]
+    if dialect == "sqlite":
+        return [row["detail"] for row in plan if row["detail"].startswith("SCAN ")]
+    return []
+
+
+async def check_sql() -> List[str]:
+    dialect = async_engine.dialect.name
+    explain = "EXPLAIN QUERY PLAN " if dialect == "sqlite" else "EXPLAIN "
+    failures = []
+    async with async_engine.connect() as conn:
+        for name, stmt in sql_query_shapes().items():
+            sql = str(stmt.compile(async_engine, compile_kwargs={"literal_binds": True}))
+            plan = (await conn.exec_driver_sql(explain + sql)).mappings().all()
+            failures += [f"sql: {name}: {scan}" for scan in _sql_full_scans(dialect, plan)]
+    return failures
+
+
+def _collscans(node) -> List[str]:
+    # Every COLLSCAN stage in an explain() document, ignoring rejected plans
+    found = []
+    if isinstance(node, dict):
+        if node.get("stage") == "COLLSCAN":
+            found.append("COLLSCAN")
+        for key, value in node.items():
+            if key != "rejectedPlans":
+                found += _collscans(value)
+    elif isinstance(node, list):
+        for value in node:
+            found += _collscans(value)
+    return found
+
+
+async def check_mongo() -> List[str]:
+    failures = []
+    for name, (collection, query, sort) in mongo_query_shapes().items():
+        cursor = async_mongo_db[collection].find(query).limit(101)
+        if sort:
+            cursor = cursor.sort(sort)
+        plan = await cursor.explain()
+        failures += [f"mongodb: {name}: {scan}" for scan in _collscans(plan)]
+    return failures
+
+
+async def check() -> List[str]:
+    return await check_sql() + await check_mongo()
+
+
+async def _migrate(prune: bool) -> None:
+    for change in await migrate_sql():
+        print(f"created {change}")
+    for change in await migrate_mongo(prune):
+        print(change)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Create and verify database indexes")
+    parser.add_argument("command", choices=["migrate", "check"])
+    parser.add_argument("--prune", action="store_true", help="drop Mongo indexes not in the registry")
+    args = parser.parse_args()
+
+    if args.command == "migrate":
+        asyncio.run(_migrate(args.prune))
+    elif args.command == "check":
+        failures = asyncio.run(check())
+        for failure in failures:
+            print(failure)
+        print(f"{len(failures)} full scan(s)")
+        sys.exit(1 if failures else 0)
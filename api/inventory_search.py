@@ -0,0 +1,257 @@
+from dataclasses import dataclass
+from typing import Literal, Optional
+
+from fastapi import Query
+from pymongo.asynchronous.collection import AsyncCollection
+from sqlalchemy import case, func, select
+from sqlalchemy.dialects.mysql import match
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from models.mysql_models import InventoryMySQL
+from text_index import inventory_text_index, text_index_enabled
+
+# Faceted inventory search, pushed down to the database on both backends.
+# Query shapes and their indexes:
+#   user (or location) equality + price range/sort -> (user_id, price),
+#   (location_id, price), (price)
+#   user equality + width/quantity/name sort -> (user_id, <field>)
+# Ties are broken by the id in the sort's direction, so either order is one
+# index walk (InnoDB keys end in the primary key, the MongoDB keys end in
+# _id). Location and admin searches sorted by width/quantity/name sort their
+# matches.
+# Boolean attributes are too unselective to index on their own; they are
+# applied as residual filters on the index range.
+
+BOOLEAN_FACETS = ("tinted", "polarized", "anti_glare", "prescription_avail")
+
+# Fields returned by mongodb_inventory.InventoryRead
+MONGO_PROJECTION = {
+    field: 1
+    for field in (
+        "name", "location_id", "quantity", "description", "price", "width",
+        "prescription_avail", "tinted", "polarized", "anti_glare", "version",
+    )
+}
+
+MAX_SEARCH_LIMIT = 200
+MAX_TEXT_SEARCH_LIMIT = 100
+
+
+@dataclass
+class InventoryFilters:
+    min_price: Optional[float]
+    max_price: Optional[float]
+    min_width: Optional[float]
+    max_width: Optional[float]
+    location_id: Optional[int]
+    tinted: Optional[bool]
+    polarized: Optional[bool]
+    anti_glare: Optional[bool]
+    prescription_avail: Optional[bool]
+    sort: str
+    limit: int
+
+    @property
+    def sort_field(self) -> str:
+        return self.sort.lstrip("-")
+
+    @property
+    def descending(self) -> bool:
+        return self.sort.startswith("-")
+
+
+# Dependency that parses the search query string
+def search_filters(
+    min_price: Optional[float] = Query(None, ge=0),
+    max_price: Optional[float] = Query(None, ge=0),
+    min_width: Optional[float] = Query(None, ge=0),
+    max_width: Optional[float] = Query(None, ge=0),
+    location_id: Optional[int] = None,
+    tinted: Optional[bool] = None,
+    polarized: Optional[bool] = None,
+    anti_glare: Optional[bool] = None,
+    prescription_avail: Optional[bool] = None,
+    sort: Literal[
+        "price", "-price", "width", "-width", "quantity", "-quantity", "name", "-name"
+    ] = "price",
+    limit: int = Query(50, ge=1, le=MAX_SEARCH_LIMIT),
+) -> InventoryFilters:
+    return InventoryFilters(
+        min_price=min_price, max_price=max_price,
+        min_width=min_width, max_width=max_width,
+        location_id=location_id,
+        tinted=tinted, polarized=polarized,
+        anti_glare=anti_glare, prescription_avail=prescription_avail,
+        sort=sort, limit=limit,
+    )
+
+
+def _facets(total: int, true_counts: dict) -> dict:
+    return {
+        name: {"true": int(true_counts[name] or 0), "false": total - int(true_counts[name] or 0)}
+        for name in BOOLEAN_FACETS
+    }
+
+
+# MySQL =======================================================================
+def sql_conditions(filters: InventoryFilters, current_user) -> list:
+    conditions = []
+    if not current_user.role == "admin":
+        conditions.append(InventoryMySQL.user_id == current_user.user_id)
+    if filters.location_id is not None:
+        conditions.append(InventoryMySQL.location_id == filters.location_id)
+    if filters.min_price is not None:
+        conditions.append(InventoryMySQL.price >= filters.min_price)
+    if filters.max_price is not None:
+        conditions.append(InventoryMySQL.price <= filters.max_price)
+    if filters.min_width is not None:
+        conditions.append(InventoryMySQL.width >= filters.min_width)
+    if filters.max_width is not None:
+        conditions.append(InventoryMySQL.width <= filters.max_width)
+    for name in BOOLEAN_FACETS:
+        value = getattr(filters, name)
+        if value is not None:
+            conditions.append(getattr(InventoryMySQL, name) == value)
+    return conditions
+
+
+def sql_order(filters: InventoryFilters) -> list:
+    columns = [getattr(InventoryMySQL, filters.sort_field), InventoryMySQL.inventory_id]
+    return [column.desc() if filters.descending else column.asc() for column in columns]
+
+
+async def search_sql(db: AsyncSession, filters: InventoryFilters, current_user) -> dict:
+    conditions = sql_conditions(filters, current_user)
+
+    items = await db.execute(
+        select(InventoryMySQL)
+        .where(*conditions)
+        .order_by(*sql_order(filters))
+        .limit(filters.limit)
+    )
+
+    # Total and one true-count per boolean attribute in a single scan
+    facet_columns = [
+        func.sum(case((getattr(InventoryMySQL, name) == True, 1), else_=0)).label(name)
+        for name in BOOLEAN_FACETS
+    ]
+    counts = (
+        await db.execute(select(func.count().label("total"), *facet_columns).where(*conditions))
+    ).one()._mapping
+
+    return {
+        "items": items.scalars().all(),
+        "total": counts["total"],
+        "facets": _facets(counts["total"], counts),
+    }
+
+
+# Full-text search over name/description. MySQL uses the FULLTEXT index,
+# other SQL backends the in-process index in text_index.py
+async def text_search_sql(
+    db: AsyncSession, q: str, page: int, limit: int, current_user
+) -> dict:
+    user_id = None if current_user.role == "admin" else current_user.user_id
+
+    if text_index_enabled():
+        ranked, has_more = inventory_text_index.search(q, user_id, limit, page * limit)
+        rows = {}
+        if ranked:
+            result = await db.execute(
+                select(InventoryMySQL).where(
+                    InventoryMySQL.inventory_id.in_([doc_id for doc_id, _ in ranked])
+                )
+            )
+            rows = {row.inventory_id: row for row in result.scalars()}
+        hits = [
+            {"score": score, "item": rows[doc_id]} for doc_id, score in ranked if doc_id in rows
+        ]
+    else:
+        score = match(InventoryMySQL.name, InventoryMySQL.description, against=q)
+        stmt = select(InventoryMySQL, score.label("score")).where(score > 0)
+        if user_id is not None:
+            stmt = stmt.where(InventoryMySQL.user_id == user_id)
+        result = await db.execute(
+            stmt.order_by(score.desc(), InventoryMySQL.inventory_id)
+            .offset(page * limit)
+            .limit(limit + 1)
+        )
+        rows = result.all()
+        has_more = len(rows) > limit
+        hits = [{"score": row_score, "item": row} for row, row_score in rows[:limit]]
+
+    return {"hits": hits, "page": page, "next_page": page + 1 if has_more else None}
+
+
+# MongoDB =====================================================================
+def mongo_query(filters: InventoryFilters, current_user) -> dict:
+    query = {}
+    if not current_user.role == "admin":
+        query["user_id"] = current_user.user_id
+    if filters.location_id is not None:
+        query["location_id"] = filters.location_id
+    for field, low, high in (
+        ("price", filters.min_price, filters.max_price),
+        ("width", filters.min_width, filters.max_width),
+    ):
+        bounds = {}
+        if low is not None:
+            bounds["$gte"] = low
+        if high is not None:
+            bounds["$lte"] = high
+        if bounds:
+            query[field] = bounds
+    for name in BOOLEAN_FACETS:
+        value = getattr(filters, name)
+        if value is not None:
+            query[name] = value
+    return query
+
+
+def mongo_sort(filters: InventoryFilters) -> list:
+    direction = -1 if filters.descending else 1
+    return [(filters.sort_field, direction), ("_id", direction)]
+
+
+async def search_mongo(collection: AsyncCollection, filters: InventoryFilters, current_user) -> dict:
+    query = mongo_query(filters, current_user)
+
+    items = (
+        await collection.find(query, MONGO_PROJECTION)
+        .sort(mongo_sort(filters))
+        .limit(filters.limit)
+        .to_list()
+    )
+
+    group = {"_id": None, "total": {"$sum": 1}}
+    for name in BOOLEAN_FACETS:
+        group[name] = {"$sum": {"$cond": [f"${name}", 1, 0]}}
+    cursor = await collection.aggregate([{"$match": query}, {"$group": group}])
+    counts = await cursor.to_list()
+    counts = counts[0] if counts else {"total": 0, **{name: 0 for name in BOOLEAN_FACETS}}
+
+    return {
+        "items": items,
+        "total": counts["total"],
+        "facets": _facets(counts["total"], counts),
+    }
+
+
+# Full-text search backed by the {name: text, description: text} index
+async def text_search_mongo(
+    collection: AsyncCollection, q: str, page: int, limit: int, current_user
+) -> dict:
+    query = {"$text": {"$search": q}}
+    if not current_user.role == "admin":
+        query["user_id"] = current_user.user_id
+    score = {"$meta": "textScore"}
+    docs = (
+        await collection.find(query, {**MONGO_PROJECTION, "score": score})
+        .sort([("score", score), ("_id", 1)])
+        .skip(page * limit)
+        .limit(limit + 1)
+        .to_list()
+    )
+    has_more = len(docs) > limit
+    hits = [{"score": doc["score"], "item": doc} for doc in docs[:limit]]
+    return {"hits": hits, "page": page, "next_page": page + 1 if has_more else None}
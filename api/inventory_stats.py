@@ -0,0 +1,234 @@
+import argparse
+import asyncio
+import json
+import logging
+from collections import defaultdict
+from typing import Iterable, List, Optional
+
+from bson import ObjectId
+from pymongo import UpdateOne
+from pymongo.asynchronous.collection import AsyncCollection
+from sqlalchemy import delete, func, insert, select
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from config import AsyncSessionLocal, async_engine, get_async_mongo_collection
+from models.mysql_models import InventoryMySQL, InventoryStatsMySQL
+
+# Per (location, user) inventory totals: SKU count, units and retail value
+# (quantity * price). The inventory write handlers keep them current by
+# applying deltas, so the /stats endpoints read O(locations) summary rows
+# instead of scanning inventory. `python inventory_stats.py rebuild`
+# recomputes them from scratch, e.g. after a Mongo stats write failed.
+
+logger = logging.getLogger(__name__)
+
+STATS_FIELDS = ("location_id", "user_id", "quantity", "price")
+
+
+def stats_row(source) -> Optional[dict]:
+    # The fields that feed the totals, from an ORM row or a dict
+    if source is None:
+        return None
+    if isinstance(source, dict):
+        return {field: source[field] for field in STATS_FIELDS}
+    return {field: getattr(source, field) for field in STATS_FIELDS}
+
+
+def stats_deltas(changes: Iterable) -> List[dict]:
+    # changes: (before, after) pairs of stats_row() dicts, None for a
+    # create's before or a delete's after. Deltas are merged per
+    # (location, user) and zero deltas dropped
+    merged = defaultdict(lambda: {"sku_count": 0, "total_units": 0, "total_value": 0.0})
+    for before, after in changes:
+        for row, sign in ((before, -1), (after, 1)):
+            if row is None:
+                continue
+            delta = merged[(row["location_id"], row["user_id"])]
+            quantity, price = row["quantity"] or 0, row["price"] or 0
+            delta["sku_count"] += sign
+            delta["total_units"] += sign * quantity
+            delta["total_value"] += sign * quantity * price
+    return [
+        {"location_id": location_id, "user_id": user_id, **delta}
+        for (location_id, user_id), delta in merged.items()
+        if delta["sku_count"] or delta["total_units"] or delta["total_value"]
+    ]
+
+
+def reverse_deltas(deltas: List[dict]) -> List[dict]:
+    return [
+        {**delta, **{key: -delta[key] for key in ("sku_count", "total_units", "total_value")}}
+        for delta in deltas
+    ]
+
+
+# MySQL =======================================================================
+def _upsert_statement(deltas: List[dict]):
+    # One multi-row INSERT ... ON DUPLICATE KEY UPDATE / ON CONFLICT DO UPDATE
+    # that adds each delta to the existing totals
+    table = InventoryStatsMySQL.__table__
+    dialect = async_engine.dialect.name
+    if dialect == "mysql":
+        from sqlalchemy.dialects.mysql import insert as dialect_insert
+
+        stmt = dialect_insert(table).values(deltas)
+        return stmt.on_duplicate_key_update(
+            sku_count=table.c.sku_count + stmt.inserted.sku_count,
+            total_units=table.c.total_units + stmt.inserted.total_units,
+            total_value=table.c.total_value + stmt.inserted.total_value,
+        )
+    if dialect == "postgresql":
+        from sqlalchemy.dialects.postgresql import insert as dialect_insert
+    else:
+        from sqlalchemy.dialects.sqlite import insert as dialect_insert
+    stmt = dialect_insert(table).values(deltas)
+    return stmt.on_conflict_do_update(
+        index_elements=[table.c.location_id, table.c.user_id],
+        set_={
+            "sku_count": table.c.sku_count + stmt.excluded.sku_count,
+            "total_units": table.c.total_units + stmt.excluded.total_units,
+            "total_value": table.c.total_value + stmt.excluded.total_value,
+        },
+    )
+
+
+async def apply_sql_deltas(db: AsyncSession, deltas: List[dict]) -> None:
+    # Runs in the caller's transaction, so totals commit with the change
+    if deltas:
+        await db.execute(_upsert_statement(deltas))
+
+
+async def read_sql_stats(db: AsyncSession, group_by: str, current_user) -> list:
+    key = getattr(InventoryStatsMySQL, group_by + "_id")
+    stmt = select(
+        key.label(group_by + "_id"),
+        func.sum(InventoryStatsMySQL.sku_count).label("sku_count"),
+        func.sum(InventoryStatsMySQL.total_units).label("total_units"),
+        func.sum(InventoryStatsMySQL.total_value).label("total_value"),
+    ).group_by(key).order_by(key)
+    if not current_user.role == "admin":
+        stmt = stmt.where(InventoryStatsMySQL.user_id == current_user.user_id)
+    return [dict(row._mapping) for row in await db.execute(stmt)]
+
+
+async def rebuild_sql() -> None:
+    async with AsyncSessionLocal() as db:
+        await db.execute(delete(InventoryStatsMySQL))
+        await db.execute(
+            insert(InventoryStatsMySQL).from_select(
+                ["location_id", "user_id", "sku_count", "total_units", "total_value"],
+                select(
+                    InventoryMySQL.location_id,
+                    InventoryMySQL.user_id,
+                    func.count(),
+                    func.sum(InventoryMySQL.quantity),
+                    func.sum(InventoryMySQL.quantity * InventoryMySQL.price),
+                ).group_by(InventoryMySQL.location_id, InventoryMySQL.user_id),
+            )
+        )
+        await db.commit()
+
+
+# MongoDB =====================================================================
+def get_mongo_stats_collection() -> AsyncCollection:
+    return get_async_mongo_collection("inventory_stats")
+
+
+def mongo_delta_ops(deltas: List[dict]) -> list:
+    return [
+        UpdateOne(
+            {"location_id": delta["location_id"], "user_id": delta["user_id"]},
+            {"$inc": {key: delta[key] for key in ("sku_count", "total_units", "total_value")}},
+            upsert=True,
+        )
+        for delta in deltas
+    ]
+
+
+async def apply_mongo_deltas(deltas: List[dict]) -> None:
+    # Applied after the inventory write it belongs to. A failure here is
+    # logged rather than failing the request; the totals drift until the
+    # next rebuild
+    if not deltas:
+        return
+    try:
+        await get_mongo_stats_collection().bulk_write(mongo_delta_ops(deltas), ordered=False)
+    except Exception:
+        logger.exception("Failed to apply inventory stats deltas")
+
+
+async def replicated_deltas(events: list) -> List[dict]:
+    # Deltas for a batch of outbox events, computed against the documents
+    # currently in MongoDB, so re-applying a batch yields zero deltas.
+    # Must run before the batch itself is written
+    changes = [
+        (event.op, json.loads(event.payload)) for event in events if event.entity == "inventory"
+    ]
+    if not changes:
+        return []
+    ids = list({ObjectId(payload["mongo_id"]) for _, payload in changes})
+    docs = await get_async_mongo_collection("inventory").find(
+        {"_id": {"$in": ids}}, {field: 1 for field in STATS_FIELDS}
+    ).to_list()
+    current = {str(doc["_id"]): stats_row(doc) for doc in docs}
+
+    pairs = []
+    for op, payload in changes:
+        after = None if op == "delete" else stats_row(payload)
+        pairs.append((current.get(payload["mongo_id"]), after))
+        current[payload["mongo_id"]] = after
+    return stats_deltas(pairs)
+
+
+async def read_mongo_stats(group_by: str, current_user) -> list:
+    key = group_by + "_id"
+    pipeline = []
+    if not current_user.role == "admin":
+        pipeline.append({"$match": {"user_id": current_user.user_id}})
+    pipeline += [
+        {"$group": {
+            "_id": "$" + key,
+            "sku_count": {"$sum": "$sku_count"},
+            "total_units": {"$sum": "$total_units"},
+            "total_value": {"$sum": "$total_value"},
+        }},
+        {"$sort": {"_id": 1}},
+    ]
+    cursor = await get_mongo_stats_collection().aggregate(pipeline)
+    return [{key: doc.pop("_id"), **doc} async for doc in cursor]
+
+
+async def rebuild_mongo() -> None:
+    # $out swaps the result in atomically and keeps the target's indexes
+    cursor = await get_async_mongo_collection("inventory").aggregate([
+        {"$group": {
+            "_id": {"location_id": "$location_id", "user_id": "$user_id"},
+            "sku_count": {"$sum": 1},
+            "total_units": {"$sum": "$quantity"},
+            "total_value": {"$sum": {"$multiply": ["$quantity", "$price"]}},
+        }},
+        {"$project": {
+            "_id": 0,
+            "location_id": "$_id.location_id",
+            "user_id": "$_id.user_id",
+            "sku_count": 1,
+            "total_units": 1,
+            "total_value": 1,
+        }},
+        {"$out": "inventory_stats"},
+    ])
+    await cursor.to_list()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Maintain the inventory summary tables")
+    parser.add_argument("command", choices=["rebuild"])
+    parser.add_argument("--backend", choices=["mysql", "mongodb", "all"], default="all")
+    args = parser.parse_args()
+
+    if args.backend in ("mysql", "all"):
+        asyncio.run(rebuild_sql())
+        print("rebuilt MySQL inventory_stats")
+    if args.backend in ("mongodb", "all"):
+        asyncio.run(rebuild_mongo())
+        print("rebuilt MongoDB inventory_stats")
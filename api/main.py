@@ -1,20 +1,75 @@
+import asyncio
+from contextlib import asynccontextmanager, suppress
+
 from fastapi import FastAPI
-from config import engine
+from fastapi.responses import PlainTextResponse
+from config import async_engine, OUTBOX_REPLICATOR_ENABLED, THREADPOOL_SIZE
+from metrics import MetricsMiddleware, render_metrics
 from models.mysql_models import Base
-from routers import inventory, auth, location
+from outbox import outbox_enabled
+from profiling import ProfilerMiddleware
+from query_budget import QueryBudgetMiddleware
+from admission import LoadSheddingMiddleware
+from pools import set_threadpool_limit
+from replicator import run_replicator
+from routers import inventory, inventory_bulk, inventory_stock, auth, location, internal
+from text_index import build_text_index
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Caps sync dependencies and run_in_threadpool calls
+    set_threadpool_limit(THREADPOOL_SIZE)
+    # Generate the tables of the db automatically
+    async with async_engine.begin() as conn:
+        await conn.run_sync(Base.metadata.create_all)
+    # In-process full-text index, only built when the SQL backend is not MySQL
+    await build_text_index()
+
+    replicator_task = None
+    if outbox_enabled() and OUTBOX_REPLICATOR_ENABLED:
+        replicator_task = asyncio.create_task(run_replicator())
+    yield
+    if replicator_task is not None:
+        replicator_task.cancel()
+        with suppress(asyncio.CancelledError):
+            await replicator_task
+    await async_engine.dispose()
+
 
-app = FastAPI(title="GlassView")
+app = FastAPI(title="GlassView", lifespan=lifespan)
 
-# Generate the tables of the db automatically
-Base.metadata.create_all(bind=engine)
+# X-Profile: 1 from an admin runs the request under cProfile. Added first so
+# it sits inside MetricsMiddleware and can read the route
+app.add_middleware(ProfilerMiddleware)
+# Per-route query budgets (QUERY_BUDGET_MODE), also inside MetricsMiddleware
+app.add_middleware(QueryBudgetMiddleware)
+# 503 + Retry-After while the MySQL pool or the threadpool is saturated,
+# before any handler runs (rate limits are in admission.py too)
+app.add_middleware(LoadSheddingMiddleware)
+# Route, SQL and MongoDB latency histograms, scraped from /metrics
+app.add_middleware(MetricsMiddleware)
+
+# Registered first so /inventory/{backend}/bulk wins over /{inventory_id}
+app.include_router(inventory_bulk.router, tags=["Inventory"])
 
 app.include_router(inventory.router, tags=["Inventory"])
 
+app.include_router(inventory_stock.router, tags=["Inventory"])
+
 app.include_router(location.router, tags=["Location"])
 
 app.include_router(auth.router, tags=["Authentication"])
 
+app.include_router(internal.router, tags=["Internal"])
+
 
 @app.get("/")
-def root():
+async def root():
     return {"message": "GlassView API"}
+
+
+# Prometheus text exposition format
+@app.get("/metrics", include_in_schema=False)
+async def metrics():
+    return PlainTextResponse(render_metrics(), media_type="text/plain; version=0.0.4")
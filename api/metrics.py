@@ -0,0 +1,226 @@
+import bisect
+import threading
+import time
+from contextvars import ContextVar
+from typing import Dict, Optional, Tuple
+
+from pymongo import monitoring
+from sqlalchemy import event
+from starlette.routing import Match
+
+# Latency metrics in the Prometheus text format, served at GET /metrics.
+#
+#   http_request_duration_seconds{route,method,status}  whole request
+#   http_request_db_seconds{route,backend}              time spent in queries
+#   db_query_duration_seconds{route,backend,operation}  each SQL statement or
+#                                                       MongoDB command
+#
+# route is the route template (/inventory/mysql/{inventory_id}), never the raw
+# path, so ids do not blow up the series count. MetricsMiddleware puts the
+# route in a context variable; the SQLAlchemy cursor events and the pymongo
+# CommandListener read it from there. Route time minus db time is what was
+# spent in validation, serialization and the handler itself.
+
+BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+
+class Histogram:
+    def __init__(self, name: str, help: str, labels: Tuple[str, ...], buckets=BUCKETS):
+        self.name = name
+        self.help = help
+        self.labels = labels
+        self.buckets = buckets
+        self._series: Dict[tuple, list] = {}  # labels -> [bucket counts..., sum, count]
+        self._lock = threading.Lock()
+
+    def observe(self, seconds: float, *label_values) -> None:
+        index = bisect.bisect_left(self.buckets, seconds)
+        with self._lock:
+            series = self._series.get(label_values)
+            if series is None:
+                series = self._series[label_values] = [0] * len(self.buckets) + [0.0, 0]
+            if index < len(self.buckets):
+                series[index] += 1
+            series[-2] += seconds
+            series[-1] += 1
+
+    def render(self) -> str:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} histogram"]
+        with self._lock:
+            series = {labels: list(values) for labels, values in self._series.items()}
+        for label_values, values in sorted(series.items()):
+            labels = ",".join(
+                f'{name}="{_escape(value)}"' for name, value in zip(self.labels, label_values)
+            )
+            prefix = labels + "," if labels else ""
+            cumulative = 0
+            for bound, count in zip(self.buckets, values):
+                cumulative += count
+                lines.append(f'{self.name}_bucket{{{prefix}le="{bound}"}} {cumulative}')
+            lines.append(f'{self.name}_bucket{{{prefix}le="+Inf"}} {values[-1]}')
+            lines.append(f"{self.name}_sum{{{labels}}} {values[-2]}")
+            lines.append(f"{self.name}_count{{{labels}}} {values[-1]}")
+        return "\n".join(lines)
+
+
+def _escape(value) -> str:
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+request_duration = Histogram(
+    "http_request_duration_seconds", "HTTP request latency", ("route", "method", "status")
+)
+request_db_time = Histogram(
+    "http_request_db_seconds", "Database time per HTTP request", ("route", "backend")
+)
+query_duration = Histogram(
+    "db_query_duration_seconds", "SQL statement and MongoDB command latency", ("route", "backend", "operation")
+)
+HISTOGRAMS = [request_duration, request_db_time, query_duration]
+
+
+def render_metrics() -> str:
+    return "\n".join(histogram.render() for histogram in HISTOGRAMS) + "\n"
+
+
+# Request context =============================================================
+class RequestMetrics:
+    def __init__(self, route: str, endpoint=None):
+        self.route = route
+        self.endpoint = endpoint  # the route's handler function
+        self.user: Optional[str] = None  # set by get_current_user
+        self.db_time: Dict[str, float] = {}
+        self.queries: Dict[str, int] = {}  # backend -> statements/commands
+        self.budget_items = 0  # items in the request, see query_budget.count_items
+
+
+# Mutable, so queries run in child tasks still add to the request's totals
+current_request: ContextVar[Optional[RequestMetrics]] = ContextVar("current_request", default=None)
+
+
+def current_route() -> str:
+    request = current_request.get()
+    return request.route if request is not None else "none"
+
+
+def set_current_user(username: str) -> None:
+    request = current_request.get()
+    if request is not None:
+        request.user = username
+
+
+# Called as observer(backend, operation, seconds, query) for every statement
+# and command, where query is {"statement", "parameters"} for SQL and
+# {"command"} for MongoDB (see slow_queries.py)
+query_observers = []
+
+
+def record_query(backend: str, operation: str, seconds: float, query: Optional[dict] = None) -> None:
+    request = current_request.get()
+    route = "none"
+    if request is not None:
+        route = request.route
+        request.db_time[backend] = request.db_time.get(backend, 0.0) + seconds
+        request.queries[backend] = request.queries.get(backend, 0) + 1
+    query_duration.observe(seconds, route, backend, operation)
+    for observer in query_observers:
+        observer(backend, operation, seconds, query)
+
+
+def _match_route(scope) -> Tuple[str, object]:
+    # Routing happens after the middleware runs, so match the route here.
+    # Returns the route template and its handler
+    app = scope.get("app")
+    for route in getattr(getattr(app, "router", None), "routes", []):
+        match, _ = route.matches(scope)
+        if match == Match.FULL:
+            return route.path, getattr(route, "endpoint", None)
+    return "unmatched", None
+
+
+class MetricsMiddleware:
+    # Plain ASGI middleware, so streamed responses are timed until their last chunk
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        request = RequestMetrics(*_match_route(scope))
+        token = current_request.set(request)
+        status = 500
+        started = time.perf_counter()
+
+        async def send_wrapper(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            request_duration.observe(
+                time.perf_counter() - started, request.route, scope["method"], str(status)
+            )
+            for backend, seconds in request.db_time.items():
+                request_db_time.observe(seconds, request.route, backend)
+            current_request.reset(token)
+
+
+# SQL statements ==============================================================
+def _sql_operation(statement: str) -> str:
+    words = statement.lstrip().split(None, 1)
+    return words[0].upper() if words else "UNKNOWN"
+
+
+def instrument_engine(engine, backend: str = "mysql") -> None:
+    # engine is a sync Engine (async_engine.sync_engine for the async one)
+    @event.listens_for(engine, "before_cursor_execute")
+    def _before(conn, cursor, statement, parameters, context, executemany):
+        conn.info.setdefault("query_started", []).append(time.perf_counter())
+
+    @event.listens_for(engine, "after_cursor_execute")
+    def _after(conn, cursor, statement, parameters, context, executemany):
+        started = conn.info["query_started"].pop()
+        record_query(
+            backend, _sql_operation(statement), time.perf_counter() - started,
+            {"statement": statement, "parameters": None if executemany else parameters},
+        )
+
+    @event.listens_for(engine, "handle_error")
+    def _error(context):
+        # A failed statement never reaches after_cursor_execute
+        stack = context.connection.info.get("query_started") if context.connection else None
+        if stack:
+            record_query(backend, "ERROR", time.perf_counter() - stack.pop())
+
+
+# MongoDB commands ============================================================
+class MongoCommandMetrics(monitoring.CommandListener):
+    def __init__(self):
+        # Command documents are only in the started event; keep them for the
+        # observers until the matching succeeded/failed event
+        self._commands = {}
+
+    def started(self, event):
+        if query_observers:
+            self._commands[(event.connection_id, event.request_id)] = event.command
+
+    def _finished(self, event):
+        command = self._commands.pop((event.connection_id, event.request_id), None)
+        record_query(
+            "mongodb", event.command_name, event.duration_micros / 1e6,
+            {"command": command} if command is not None else None,
+        )
+
+    def succeeded(self, event):
+        self._finished(event)
+
+    def failed(self, event):
+        self._finished(event)
+
+
+mongo_command_metrics = MongoCommandMetrics()
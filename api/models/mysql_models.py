@@ -1,4 +1,6 @@
-from sqlalchemy import Column, Integer, String, ForeignKey, Boolean, Float
+from datetime import datetime, timezone
+
+from sqlalchemy import Column, Integer, String, ForeignKey, Boolean, Float, Text, DateTime, Index
 from config import engine
 from sqlalchemy.ext.declarative import declarative_base
 
@@ -16,15 +18,37 @@ class LocationMySQL(Base):
     state = Column(String(2), nullable=False)
     zip_code = Column(Integer, nullable=False)
     capacity = Column(Integer, nullable=False)
+    # Units currently stocked here, kept by capacity.py
+    used = Column(Integer, nullable=False, default=0, server_default="0")
+    # _id of the matching MongoDB document
+    mongo_id = Column(String(24), unique=True, nullable=True)
+    # Bumped by every update, see versioning.py
+    version = Column(Integer, nullable=False, default=1, server_default="1")
 
 
 class InventoryMySQL(Base):
     __tablename__ = "inventory"
+    # Serve the search endpoint: equality on owner/location, then price range/sort.
+    # A user's search can also sort by width, quantity or name, with
+    # inventory_id breaking ties (InnoDB appends it to every secondary index).
+    # indexes.py creates these on existing tables and checks the query plans
+    __table_args__ = (
+        Index("ix_inventory_user_price", "user_id", "price"),
+        Index("ix_inventory_user_width", "user_id", "width"),
+        Index("ix_inventory_user_quantity", "user_id", "quantity"),
+        Index("ix_inventory_user_name", "user_id", "name"),
+        Index("ix_inventory_location_price", "location_id", "price"),
+        Index("ix_inventory_price", "price"),
+        # Full-text search over name/description (MySQL only, other dialects
+        # ignore the prefix and use text_index.py instead)
+        Index("ix_inventory_fulltext", "name", "description", mysql_prefix="FULLTEXT"),
+    )
 
     inventory_id = Column(Integer, primary_key=True, index=True)
     name = Column(String(255), nullable=False)
-    # Link to location
-    location_id = Column(Integer, ForeignKey("location.location_id"), nullable=False)
+    # Link to location. The single-column indexes on location_id and user_id
+    # serve keyset pages, which are ordered by inventory_id
+    location_id = Column(Integer, ForeignKey("location.location_id"), nullable=False, index=True)
     quantity = Column(Integer, nullable=False)
     description = Column(String(255), nullable=False)
     price = Column(Float, nullable=False)
@@ -33,7 +57,23 @@ class InventoryMySQL(Base):
     tinted = Column(Boolean, nullable=False)
     polarized = Column(Boolean, nullable=False)
     anti_glare = Column(Boolean, nullable=False)
-    user_id = Column(Integer, ForeignKey("user.user_id"), nullable=False)
+    user_id = Column(Integer, ForeignKey("user.user_id"), nullable=False, index=True)
+    # _id of the matching MongoDB document
+    mongo_id = Column(String(24), unique=True, nullable=True)
+    # Bumped by every update, see versioning.py
+    version = Column(Integer, nullable=False, default=1, server_default="1")
+
+
+# Inventory totals per (location, user), kept current by the inventory write
+# handlers (see inventory_stats.py)
+class InventoryStatsMySQL(Base):
+    __tablename__ = "inventory_stats"
+
+    location_id = Column(Integer, primary_key=True)
+    user_id = Column(Integer, primary_key=True, index=True)
+    sku_count = Column(Integer, nullable=False, default=0)
+    total_units = Column(Integer, nullable=False, default=0)
+    total_value = Column(Float, nullable=False, default=0.0)
 
 
 class UserMySql(Base):
@@ -44,3 +84,31 @@ class UserMySql(Base):
     email = Column(String(120), unique=True, nullable=False)
     hashed_password = Column(String(255), nullable=False)
     role = Column(String(20), default="user", nullable=False)  # 'user' or 'admin'
+
+
+# Row changes waiting to be replicated to MongoDB. Written in the same
+# transaction as the change itself (see outbox.py / replicator.py)
+class OutboxMySQL(Base):
+    __tablename__ = "outbox"
+
+    outbox_id = Column(Integer, primary_key=True, autoincrement=True)
+    entity = Column(String(20), nullable=False)  # 'location' or 'inventory'
+    op = Column(String(10), nullable=False)  # 'upsert' or 'delete'
+    payload = Column(Text, nullable=False)  # JSON copy of the row
+    created_at = Column(
+        DateTime, nullable=False, default=lambda: datetime.now(timezone.utc).replace(tzinfo=None)
+    )
+    # Set once the event is in MongoDB. Transactions commit out of outbox_id
+    # order, so each event is marked rather than tracked by a high-water mark
+    applied_at = Column(DateTime, nullable=True)
+
+    __table_args__ = (Index("ix_outbox_applied_at_outbox_id", "applied_at", "outbox_id"),)
+
+
+# Highest outbox_id applied to MongoDB by each replicator
+class ReplicationCheckpointMySQL(Base):
+    __tablename__ = "replication_checkpoint"
+
+    name = Column(String(50), primary_key=True)
+    last_outbox_id = Column(Integer, nullable=False, default=0)
+    updated_at = Column(DateTime, nullable=True)
@@ -0,0 +1,166 @@
+import asyncio
+import time
+from typing import Optional
+
+import mongomock
+
+from metrics import record_query
+
+# In-process stand-in for the async PyMongo database, backed by mongomock.
+# Install it before the routers are imported:
+#
+#   import config
+#   config.async_mongo_db = InMemoryMongoDatabase("glassview-bench")
+#
+# It covers the calls the app makes (find/sort/limit/to_list, find_one,
+# inserts, updates, deletes, bulk_write, aggregate). Anything mongomock does
+# not implement, such as $text search, raises from the call, so endpoints
+# that need it fail with a 500 instead of returning wrong results. Each call
+# is recorded as the command a real server would get (see COMMANDS), so
+# request metrics, @query_budget and count_queries() see MongoDB round trips
+# as with pymongo's command listener; a cursor counts once, however many
+# batches it would take. Used by the tests (tests/conftest.py) and
+# benchmark.py; dev dependency only (req-dev.txt).
+
+# Collection method -> server command, for methods not named after theirs
+COMMANDS = {
+    "find_one": "find",
+    "insert_one": "insert",
+    "insert_many": "insert",
+    "update_one": "update",
+    "update_many": "update",
+    "replace_one": "update",
+    "delete_one": "delete",
+    "delete_many": "delete",
+    "find_one_and_update": "findAndModify",
+    "find_one_and_delete": "findAndModify",
+    "find_one_and_replace": "findAndModify",
+    "count_documents": "aggregate",
+    "estimated_document_count": "count",
+    "create_index": "createIndexes",
+    "create_indexes": "createIndexes",
+    "drop_index": "dropIndexes",
+    "list_indexes": "listIndexes",
+    "index_information": "listIndexes",
+}
+
+# bulk_write sends one command per run of operations of the same kind
+_BULK_COMMANDS = {
+    "InsertOne": "insert", "UpdateOne": "update", "UpdateMany": "update", "ReplaceOne": "update",
+    "DeleteOne": "delete", "DeleteMany": "delete",
+}
+
+
+def _run(command: str, call):
+    started = time.perf_counter()
+    try:
+        return call()
+    finally:
+        record_query("mongodb", command, time.perf_counter() - started)
+
+
+class InMemoryCursor:
+    def __init__(self, cursor, command: Optional[str] = "find"):
+        # command is recorded when the cursor is first read; None when the
+        # call that made it was already recorded
+        self._cursor = cursor
+        self._command = command
+
+    def _read(self) -> list:
+        command, self._command = self._command, None
+        if command is None:
+            return list(self._cursor)
+        return _run(command, lambda: list(self._cursor))
+
+    def sort(self, *args, **kwargs) -> "InMemoryCursor":
+        self._cursor = self._cursor.sort(*args, **kwargs)
+        return self
+
+    def limit(self, limit: int) -> "InMemoryCursor":
+        self._cursor = self._cursor.limit(limit)
+        return self
+
+    def skip(self, skip: int) -> "InMemoryCursor":
+        self._cursor = self._cursor.skip(skip)
+        return self
+
+    def batch_size(self, batch_size: int) -> "InMemoryCursor":
+        return self
+
+    async def to_list(self, length: Optional[int] = None) -> list:
+        docs = self._read()
+        return docs if length is None else docs[:length]
+
+    async def explain(self) -> dict:
+        return {}
+
+    def __aiter__(self):
+        return self._iterate()
+
+    async def _iterate(self):
+        for doc in self._read():
+            yield doc
+            # Let other requests run between documents, like a real cursor would
+            await asyncio.sleep(0)
+
+
+class InMemoryCollection:
+    def __init__(self, collection, database: "InMemoryMongoDatabase"):
+        self._collection = collection
+        self.database = database
+        self.name = collection.name
+
+    def find(self, *args, **kwargs) -> InMemoryCursor:
+        return InMemoryCursor(self._collection.find(*args, **kwargs))
+
+    async def aggregate(self, pipeline: list, **kwargs) -> InMemoryCursor:
+        docs = _run("aggregate", lambda: list(self._collection.aggregate(pipeline, **kwargs)))
+        return InMemoryCursor(iter(docs), command=None)
+
+    async def bulk_write(self, requests: list, ordered: bool = True, **kwargs) -> None:
+        # mongomock's bulk_write rejects options newer pymongo operations
+        # pass along (sort), so the operations are applied one by one
+        previous = None
+        for request in requests:
+            kind = type(request).__name__
+            command = _BULK_COMMANDS.get(kind)
+            if command is not None and command != previous:
+                record_query("mongodb", command, 0.0)
+                previous = command
+            if kind == "InsertOne":
+                self._collection.insert_one(request._doc)
+            elif kind in ("UpdateOne", "UpdateMany", "ReplaceOne"):
+                method = {"UpdateOne": "update_one", "UpdateMany": "update_many", "ReplaceOne": "replace_one"}[kind]
+                getattr(self._collection, method)(request._filter, request._doc, upsert=request._upsert)
+            elif kind in ("DeleteOne", "DeleteMany"):
+                getattr(self._collection, "delete_one" if kind == "DeleteOne" else "delete_many")(request._filter)
+            else:
+                raise NotImplementedError(f"{kind} is not supported by the in-memory double")
+
+    def __getattr__(self, name: str):
+        # Every other collection method: same signature, awaitable
+        method = getattr(self._collection, name)
+
+        async def call(*args, **kwargs):
+            return _run(COMMANDS.get(name, name), lambda: method(*args, **kwargs))
+
+        return call
+
+
+class InMemoryMongoDatabase:
+    def __init__(self, name: str):
+        self._database = mongomock.MongoClient()[name]
+        self._collections = {}
+        self.name = name
+
+    def __getitem__(self, name: str) -> InMemoryCollection:
+        if name not in self._collections:
+            self._collections[name] = InMemoryCollection(self._database[name], self)
+        return self._collections[name]
+
+    def get_collection(self, name: str) -> InMemoryCollection:
+        return self[name]
+
+    async def command(self, command, **kwargs) -> dict:
+        record_query("mongodb", command if isinstance(command, str) else next(iter(command)), 0.0)
+        return {"ok": 1.0}
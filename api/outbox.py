@@ -0,0 +1,44 @@
+import json
+from typing import List
+
+from sqlalchemy import insert
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from config import REPLICATION_MODE
+from models.mysql_models import OutboxMySQL
+
+# Write side of the transactional outbox. Routers call record_change() after
+# flushing a LocationMySQL/InventoryMySQL change and before committing, so the
+# outbox row is committed (or rolled back) together with the change itself.
+# replicator.py drains the table into MongoDB.
+
+
+def outbox_enabled() -> bool:
+    return REPLICATION_MODE == "outbox"
+
+
+def row_to_dict(row) -> dict:
+    return {column.name: getattr(row, column.name) for column in row.__table__.columns}
+
+
+def record_change(db: AsyncSession, entity: str, op: str, row) -> None:
+    # op is 'upsert' for inserts and updates, 'delete' for deletes.
+    # The row must already have a mongo_id, which becomes the Mongo _id
+    db.add(
+        OutboxMySQL(
+            entity=entity,
+            op=op,
+            payload=json.dumps(row_to_dict(row), default=str),
+        )
+    )
+
+
+async def record_changes(db: AsyncSession, entity: str, op: str, rows: List[dict]) -> None:
+    # Same as record_change() for many rows (given as column dicts), written
+    # with a single executemany INSERT
+    if not rows:
+        return
+    await db.execute(
+        insert(OutboxMySQL),
+        [{"entity": entity, "op": op, "payload": json.dumps(row, default=str)} for row in rows],
+    )
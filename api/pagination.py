@@ -0,0 +1,76 @@
+import base64
+import json
+from dataclasses import dataclass
+from typing import Any, Optional
+
+from bson import ObjectId
+from bson.errors import InvalidId
+from fastapi import HTTPException, Query
+from pymongo.asynchronous.collection import AsyncCollection
+from sqlalchemy import Select
+from sqlalchemy.ext.asyncio import AsyncSession
+
+# Keyset (cursor) pagination. Pages seek past the last key of the previous
+# page (inventory_id/location_id in MySQL, _id in MongoDB) instead of using
+# OFFSET/skip, so every page is an index range scan of `limit` rows.
+
+DEFAULT_PAGE_SIZE = 100
+MAX_PAGE_SIZE = 1000
+
+
+@dataclass
+class PageParams:
+    limit: int
+    after: Optional[Any]  # last key of the previous page
+
+
+def encode_cursor(key) -> str:
+    raw = json.dumps({"k": key}, separators=(",", ":")).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip("=")
+
+
+def decode_cursor(cursor: str):
+    padded = cursor + "=" * (-len(cursor) % 4)
+    return json.loads(base64.urlsafe_b64decode(padded))["k"]
+
+
+# Dependency that parses ?limit=&cursor=
+def page_params(
+    limit: int = Query(DEFAULT_PAGE_SIZE, ge=1, le=MAX_PAGE_SIZE),
+    cursor: Optional[str] = Query(None),
+) -> PageParams:
+    if cursor is None:
+        return PageParams(limit=limit, after=None)
+    try:
+        return PageParams(limit=limit, after=decode_cursor(cursor))
+    except (ValueError, KeyError, TypeError):
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+
+
+def _page(rows: list, limit: int, key_of) -> dict:
+    # One extra row is fetched to know whether another page exists
+    has_more = len(rows) > limit
+    rows = rows[:limit]
+    next_cursor = encode_cursor(key_of(rows[-1])) if has_more else None
+    return {"items": rows, "next_cursor": next_cursor}
+
+
+async def paginate_sql(db: AsyncSession, stmt: Select, key_column, page: PageParams) -> dict:
+    if page.after is not None:
+        if not isinstance(page.after, int):
+            raise HTTPException(status_code=400, detail="Invalid cursor")
+        stmt = stmt.where(key_column > page.after)
+    stmt = stmt.order_by(key_column).limit(page.limit + 1)
+    rows = (await db.execute(stmt)).scalars().all()
+    return _page(list(rows), page.limit, lambda row: getattr(row, key_column.key))
+
+
+async def paginate_mongo(collection: AsyncCollection, query: dict, page: PageParams) -> dict:
+    if page.after is not None:
+        try:
+            query = {**query, "_id": {"$gt": ObjectId(page.after)}}
+        except (InvalidId, TypeError):
+            raise HTTPException(status_code=400, detail="Invalid cursor")
+    cursor = collection.find(query).sort("_id", 1).limit(page.limit + 1)
+    rows = await cursor.to_list()
+    return _page(rows, page.limit, lambda doc: str(doc["_id"]))
@@ -0,0 +1,218 @@
+import itertools
+import threading
+import time
+from collections import defaultdict
+from typing import Optional
+
+import anyio.to_thread
+from pymongo import monitoring
+from sqlalchemy.exc import TimeoutError as PoolTimeoutError
+from sqlalchemy.pool import AsyncAdaptedQueuePool, QueuePool
+
+# Instrumented connection pools. The SQLAlchemy pools time every checkout
+# (how long a request waited for a connection) and count overflow
+# connections and timeouts; the pymongo listener does the same for each
+# MongoDB server pool. Reported by GET /internal/pools. The SQLAlchemy pools
+# also expose how long checkouts are waiting right now, which admission.py
+# uses to shed load.
+
+# Weight of the newest checkout in the recent wait average, and how fast
+# that average fades while nothing is checked out
+RECENT_WAIT_WEIGHT = 0.2
+RECENT_WAIT_HALF_LIFE = 1.0
+
+
+class PoolStats:
+    def __init__(self):
+        self.checkouts = 0
+        self.wait_total = 0.0
+        self.wait_max = 0.0
+        self.overflow_events = 0
+        self.timeouts = 0
+        self._recent_wait = 0.0
+        self._recent_at = 0.0
+
+    def record_wait(self, seconds: float) -> None:
+        self.checkouts += 1
+        self.wait_total += seconds
+        self.wait_max = max(self.wait_max, seconds)
+        now = time.monotonic()
+        self._recent_wait = self.recent_wait(now) * (1 - RECENT_WAIT_WEIGHT) + seconds * RECENT_WAIT_WEIGHT
+        self._recent_at = now
+
+    def recent_wait(self, now: Optional[float] = None) -> float:
+        now = time.monotonic() if now is None else now
+        return self._recent_wait * 0.5 ** ((now - self._recent_at) / RECENT_WAIT_HALF_LIFE)
+
+    def as_dict(self) -> dict:
+        return {
+            "checkouts": self.checkouts,
+            "wait_avg": self.wait_total / self.checkouts if self.checkouts else 0.0,
+            "wait_max": self.wait_max,
+            "wait_recent": self.recent_wait(),
+            "overflow_events": self.overflow_events,
+            "timeouts": self.timeouts,
+        }
+
+
+class _MonitoredPoolMixin:
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.stats = PoolStats()
+        # checkouts in progress -> when they started
+        self._waiting = {}
+        self._waiter_ids = itertools.count()
+
+    def _do_get(self):
+        overflow = self._overflow
+        started = time.perf_counter()
+        waiter = next(self._waiter_ids)
+        self._waiting[waiter] = started
+        try:
+            connection = super()._do_get()
+        except PoolTimeoutError:
+            self.stats.timeouts += 1
+            raise
+        finally:
+            del self._waiting[waiter]
+        self.stats.record_wait(time.perf_counter() - started)
+        if self._overflow > overflow and self._overflow > 0:
+            self.stats.overflow_events += 1
+        return connection
+
+    def recreate(self):
+        # engine.dispose() swaps in a new pool; keep the counters
+        pool = super().recreate()
+        pool.stats = self.stats
+        return pool
+
+    def current_wait(self) -> float:
+        # The longer of the recent checkout wait and the oldest checkout still
+        # waiting, so a pool that hands out nothing at all counts as well
+        oldest = min(list(self._waiting.values()), default=None)
+        waiting = time.perf_counter() - oldest if oldest is not None else 0.0
+        return max(self.stats.recent_wait(), waiting)
+
+    def report(self) -> dict:
+        return {
+            "size": self.size(),
+            "checked_out": self.checkedout(),
+            "idle": self.checkedin(),
+            "overflow": max(self.overflow(), 0),
+            "max_overflow": self._max_overflow,
+            "waiting": len(self._waiting),
+            **self.stats.as_dict(),
+        }
+
+
+class MonitoredQueuePool(_MonitoredPoolMixin, QueuePool):
+    pass
+
+
+class MonitoredAsyncQueuePool(_MonitoredPoolMixin, AsyncAdaptedQueuePool):
+    pass
+
+
+def sql_pool_report(engine) -> dict:
+    pool = engine.pool
+    if isinstance(pool, _MonitoredPoolMixin):
+        return pool.report()
+    return {"pool": type(pool).__name__}
+
+
+def sql_pool_wait(engine) -> float:
+    pool = engine.pool
+    if isinstance(pool, _MonitoredPoolMixin):
+        return pool.current_wait()
+    return 0.0
+
+
+class MongoPoolListener(monitoring.ConnectionPoolListener):
+    # One set of counters per server address. pymongo calls these from its
+    # own threads as well as the event loop
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._stats = defaultdict(PoolStats)
+        self._checked_out = defaultdict(int)
+        self._open = defaultdict(int)
+        self._failures = defaultdict(lambda: defaultdict(int))
+
+    def _key(self, event) -> str:
+        return "%s:%s" % event.address
+
+    def pool_created(self, event):
+        pass
+
+    def pool_ready(self, event):
+        pass
+
+    def pool_cleared(self, event):
+        pass
+
+    def pool_closed(self, event):
+        pass
+
+    def connection_created(self, event):
+        with self._lock:
+            self._open[self._key(event)] += 1
+
+    def connection_ready(self, event):
+        pass
+
+    def connection_closed(self, event):
+        with self._lock:
+            self._open[self._key(event)] -= 1
+
+    def connection_check_out_started(self, event):
+        pass
+
+    def connection_check_out_failed(self, event):
+        with self._lock:
+            self._failures[self._key(event)][str(event.reason)] += 1
+            if event.reason == monitoring.ConnectionCheckOutFailedReason.TIMEOUT:
+                self._stats[self._key(event)].timeouts += 1
+
+    def connection_checked_out(self, event):
+        with self._lock:
+            key = self._key(event)
+            # duration (seconds) is reported by pymongo >= 4.7
+            self._stats[key].record_wait(getattr(event, "duration", 0.0) or 0.0)
+            self._checked_out[key] += 1
+
+    def connection_checked_in(self, event):
+        with self._lock:
+            self._checked_out[self._key(event)] -= 1
+
+    def report(self, max_pool_size: int, min_pool_size: int) -> dict:
+        with self._lock:
+            return {
+                "max_pool_size": max_pool_size,
+                "min_pool_size": min_pool_size,
+                "servers": {
+                    key: {
+                        "open": self._open[key],
+                        "checked_out": self._checked_out[key],
+                        "failures": dict(self._failures[key]),
+                        **stats.as_dict(),
+                    }
+                    for key, stats in self._stats.items()
+                },
+            }
+
+
+mongo_pool_listener = MongoPoolListener()
+
+
+def set_threadpool_limit(limit: int) -> None:
+    # Must run inside the event loop (called from the app lifespan)
+    anyio.to_thread.current_default_thread_limiter().total_tokens = limit
+
+
+def threadpool_report() -> dict:
+    limiter = anyio.to_thread.current_default_thread_limiter()
+    statistics = limiter.statistics()
+    return {
+        "limit": limiter.total_tokens,
+        "busy": statistics.borrowed_tokens,
+        "waiting": statistics.tasks_waiting,
+    }
@@ -0,0 +1,68 @@
+import time
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Optional
+
+from config import PRINCIPAL_CACHE_SIZE, PRINCIPAL_CACHE_TTL
+
+# In-process cache of authenticated principals, keyed by the token subject
+# (username). get_current_user() serves hits without touching MySQL.
+# Entries are dropped on register, role change and logout in this process;
+# the TTL bounds how long other worker processes can serve a stale role.
+
+
+@dataclass(frozen=True)
+class Principal:
+    user_id: int
+    username: str
+    role: str
+
+
+class PrincipalCache:
+    def __init__(self, maxsize: int, ttl: float):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._entries = OrderedDict()  # username -> (expires_at, Principal)
+        self.hits = 0
+        self.misses = 0
+        self.invalidations = 0
+
+    def get(self, username: str) -> Optional[Principal]:
+        entry = self._entries.get(username)
+        if entry is None or entry[0] < time.monotonic():
+            if entry is not None:
+                del self._entries[username]
+            self.misses += 1
+            return None
+        self._entries.move_to_end(username)
+        self.hits += 1
+        return entry[1]
+
+    def put(self, principal: Principal) -> None:
+        self._entries[principal.username] = (time.monotonic() + self.ttl, principal)
+        self._entries.move_to_end(principal.username)
+        # Evict least recently used entries beyond maxsize
+        while len(self._entries) > self.maxsize:
+            self._entries.popitem(last=False)
+
+    def invalidate(self, username: str) -> None:
+        if self._entries.pop(username, None) is not None:
+            self.invalidations += 1
+
+    def clear(self) -> None:
+        self._entries.clear()
+
+    def stats(self) -> dict:
+        lookups = self.hits + self.misses
+        return {
+            "size": len(self._entries),
+            "maxsize": self.maxsize,
+            "ttl_seconds": self.ttl,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_ratio": self.hits / lookups if lookups else 0.0,
+            "invalidations": self.invalidations,
+        }
+
+
+principal_cache = PrincipalCache(PRINCIPAL_CACHE_SIZE, PRINCIPAL_CACHE_TTL)
@@ -0,0 +1,164 @@
+import asyncio
+import cProfile
+import json
+import os
+import pstats
+import re
+import time
+from datetime import datetime, timezone
+from typing import List, Optional
+
+from starlette.requests import HTTPConnection
+
+from config import AsyncSessionLocal, PROFILE_DIR, PROFILE_MAX_FILES
+from metrics import current_request
+from routers.auth import get_token_data, resolve_principal
+
+# Opt-in request profiler. An admin sends `X-Profile: 1` with any request and
+# the request (dependencies such as get_current_user, the handler, its DB
+# calls, response validation and serialization) runs under cProfile. The
+# capture is saved to PROFILE_DIR as <id>.prof (pstats, opens in snakeviz)
+# plus <id>.json with the request details; only the newest PROFILE_MAX_FILES
+# are kept. The response carries X-Profile-Id. Listed at GET /internal/profiles.
+#
+# cProfile hooks the event loop thread, so other requests running at the same
+# moment show up in the capture too, and only one request is profiled at a
+# time (a second one gets X-Profile-Id: busy). Requests without the header
+# only pay for one scan of their headers.
+
+PROFILE_HEADER = b"x-profile"
+PROFILE_ID = re.compile(r"^[0-9]{8}T[0-9]{6}-[0-9a-f]{6}$")
+
+_lock = asyncio.Lock()
+
+
+def _wants_profile(scope) -> bool:
+    return any(name == PROFILE_HEADER and value not in (b"", b"0") for name, value in scope["headers"])
+
+
+async def _is_admin(scope) -> bool:
+    connection = HTTPConnection(scope)
+    token = connection.cookies.get("session_token")
+    authorization = connection.headers.get("authorization", "")
+    if authorization.lower().startswith("bearer "):
+        token = authorization[7:]
+    token_data = get_token_data(token) if token else None
+    if token_data is None:
+        return False
+    async with AsyncSessionLocal() as db:
+        principal = await resolve_principal(db, token_data.username)
+    return principal is not None and principal.role == "admin"
+
+
+class ProfilerMiddleware:
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or not _wants_profile(scope) or not await _is_admin(scope):
+            await self.app(scope, receive, send)
+            return
+        if _lock.locked():
+            await self.app(scope, receive, _with_header(send, "busy"))
+            return
+
+        async with _lock:
+            profile_id = datetime.now(timezone.utc).strftime("%Y%m%dT%H%M%S-") + os.urandom(3).hex()
+            status = 500
+
+            async def send_wrapper(message):
+                nonlocal status
+                if message["type"] == "http.response.start":
+                    status = message["status"]
+                await _with_header(send, profile_id)(message)
+
+            profiler = cProfile.Profile()
+            started = time.perf_counter()
+            profiler.enable()
+            try:
+                await self.app(scope, receive, send_wrapper)
+            finally:
+                profiler.disable()
+                request = current_request.get()
+                # Dumping and pruning the files would block the event loop
+                await asyncio.to_thread(_save, profile_id, profiler, {
+                    "id": profile_id,
+                    "time": datetime.now(timezone.utc).isoformat(),
+                    "method": scope["method"],
+                    "path": scope["path"],
+                    "route": request.route if request is not None else None,
+                    "user": request.user if request is not None else None,
+                    "status": status,
+                    "duration_ms": round((time.perf_counter() - started) * 1000, 3),
+                })
+
+
+def _with_header(send, profile_id: str):
+    async def send_with_header(message):
+        if message["type"] == "http.response.start":
+            message["headers"] = list(message.get("headers", [])) + [
+                (b"x-profile-id", profile_id.encode())
+            ]
+        await send(message)
+
+    return send_with_header
+
+
+# Profiles directory ==========================================================
+def _path(profile_id: str, extension: str) -> str:
+    return os.path.join(PROFILE_DIR, f"{profile_id}.{extension}")
+
+
+def _save(profile_id: str, profiler: cProfile.Profile, details: dict) -> None:
+    os.makedirs(PROFILE_DIR, exist_ok=True)
+    profiler.dump_stats(_path(profile_id, "prof"))
+    with open(_path(profile_id, "json"), "w", encoding="utf-8") as details_file:
+        json.dump(details, details_file)
+    # Ids sort by time, drop the oldest
+    for old_id in list_profile_ids()[PROFILE_MAX_FILES:]:
+        for extension in ("prof", "json"):
+            try:
+                os.remove(_path(old_id, extension))
+            except FileNotFoundError:
+                pass
+
+
+def list_profile_ids() -> List[str]:
+    # Newest first
+    if not os.path.isdir(PROFILE_DIR):
+        return []
+    ids = {name.rsplit(".", 1)[0] for name in os.listdir(PROFILE_DIR) if name.endswith(".prof")}
+    return sorted((profile_id for profile_id in ids if PROFILE_ID.match(profile_id)), reverse=True)
+
+
+def profile_path(profile_id: str) -> Optional[str]:
+    if not PROFILE_ID.match(profile_id) or not os.path.exists(_path(profile_id, "prof")):
+        return None
+    return _path(profile_id, "prof")
+
+
+def top_functions(profile_id: str, top: int) -> List[dict]:
+    stats = pstats.Stats(_path(profile_id, "prof"))
+    # stats.stats: (file, line, function) -> (primitive calls, calls, tottime, cumtime, callers)
+    ranked = sorted(stats.stats.items(), key=lambda item: item[1][3], reverse=True)[:top]
+    return [
+        {
+            "function": pstats.func_std_string(function),
+            "calls": calls,
+            "tottime": round(tottime, 6),
+            "cumtime": round(cumtime, 6),
+        }
+        for function, (_, calls, tottime, cumtime, _) in ranked
+    ]
+
+
+def profile_summary(profile_id: str, top: int) -> Optional[dict]:
+    if profile_path(profile_id) is None:
+        return None
+    try:
+        with open(_path(profile_id, "json"), encoding="utf-8") as details_file:
+            details = json.load(details_file)
+    except FileNotFoundError:
+        details = {"id": profile_id}
+    details["top"] = top_functions(profile_id, top)
+    return details
@@ -0,0 +1,157 @@
+import logging
+from contextlib import contextmanager
+from typing import Dict, Optional
+
+from config import QUERY_BUDGET_MODE
+from metrics import current_request, query_observers
+
+# Round-trip budgets per route. A handler declares how many SQL statements
+# and MongoDB commands one request may issue:
+#
+#   @router.get("/mysql/{inventory_id}")
+#   @query_budget(mysql=2)
+#   async def get_inventory_sql(...):
+#
+# QueryBudgetMiddleware compares the counts MetricsMiddleware collected with
+# the budget when the handler starts its response, and again once a
+# streamed body is done. QUERY_BUDGET_MODE picks what happens when a route
+# goes over: "off" (no check), "warn" (log a warning) or "raise" (raise
+# QueryBudgetExceeded before the status line is sent, so the request fails
+# with a 500, or with the exception itself under an ASGI test client).
+# Backends the budget does not name are not checked.
+#
+# Routes that take a list of items can add a budget per item; the handler
+# reports the count with count_items():
+#
+#   @query_budget(mysql=5, per_item={"mysql": 1})
+#   async def adjust_basket_sql(adjustments, ...):
+#       count_items(len(adjustments))
+#
+# Overruns are counted per route and listed at GET /internal/query-budgets.
+# The tests in tests/test_query_budgets.py hold every route to its budget.
+
+logger = logging.getLogger(__name__)
+
+BUDGET_MODES = ("off", "warn", "raise")
+budget_mode = QUERY_BUDGET_MODE
+# "METHOD /route" -> number of requests over budget
+budget_violations: Dict[str, int] = {}
+
+
+class QueryBudgetExceeded(Exception):
+    pass
+
+
+def query_budget(per_item: Optional[Dict[str, int]] = None, **limits: int):
+    def decorate(endpoint):
+        endpoint.__query_budget__ = limits
+        endpoint.__query_budget_per_item__ = per_item or {}
+        return endpoint
+
+    return decorate
+
+
+def get_query_budget(endpoint, items: int = 0):
+    # The limits for a request carrying items items, or None without a budget
+    limits = getattr(endpoint, "__query_budget__", None)
+    if limits is None:
+        return None
+    per_item = getattr(endpoint, "__query_budget_per_item__", {})
+    return {
+        backend: limits.get(backend, 0) + per_item.get(backend, 0) * items
+        for backend in {**limits, **per_item}
+    }
+
+
+def count_items(items: int) -> None:
+    request = current_request.get()
+    if request is not None:
+        request.budget_items = items
+
+
+def set_budget_mode(mode: str) -> None:
+    global budget_mode
+    if mode not in BUDGET_MODES:
+        raise ValueError(f"QUERY_BUDGET_MODE must be one of {BUDGET_MODES}")
+    budget_mode = mode
+
+
+def over_budget(budget: Dict[str, int], counts: Dict[str, int]) -> Dict[str, int]:
+    return {backend: counts.get(backend, 0) for backend, limit in budget.items() if counts.get(backend, 0) > limit}
+
+
+class QueryBudgetMiddleware:
+    # Must sit inside MetricsMiddleware, which owns the per-request counts
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if budget_mode == "off" or scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        reported = False
+
+        async def checked_send(message):
+            # Handlers have issued their queries by the time the response
+            # starts, except a streamed body, which is checked again below
+            nonlocal reported
+            if message["type"] == "http.response.start":
+                reported = _check(scope)
+            await send(message)
+
+        await self.app(scope, receive, checked_send)
+        if not reported:
+            _check(scope)
+
+
+def _check(scope) -> bool:
+    # Returns whether the request went over its budget
+    request = current_request.get()
+    budget = get_query_budget(request.endpoint, request.budget_items) if request is not None else None
+    if budget is None:
+        return False
+    exceeded = over_budget(budget, request.queries)
+    if not exceeded:
+        return False
+    route = f"{scope['method']} {request.route}"
+    budget_violations[route] = budget_violations.get(route, 0) + 1
+    message = f"{route} issued {exceeded}, budget {budget}"
+    if budget_mode == "raise":
+        raise QueryBudgetExceeded(message)
+    logger.warning("Query budget exceeded: %s", message)
+    return True
+
+
+def budget_report(app) -> dict:
+    routes = {}
+    for route in app.routes:
+        endpoint = getattr(route, "endpoint", None)
+        budget = get_query_budget(endpoint)
+        if budget is None:
+            continue
+        for method in sorted(route.methods):
+            key = f"{method} {route.path}"
+            routes[key] = {"budget": budget, "violations": budget_violations.get(key, 0)}
+            if endpoint.__query_budget_per_item__:
+                routes[key]["per_item"] = endpoint.__query_budget_per_item__
+    return {"mode": budget_mode, "routes": routes}
+
+
+@contextmanager
+def count_queries():
+    # Test helper: counts statements/commands per backend issued inside the
+    # block, e.g.
+    #
+    #   with count_queries() as counts:
+    #       client.get("/inventory/mysql/1")
+    #   assert counts.get("mysql", 0) <= 2
+    counts: Dict[str, int] = {}
+
+    def observe(backend, operation, seconds, query):
+        counts[backend] = counts.get(backend, 0) + 1
+
+    query_observers.append(observe)
+    try:
+        yield counts
+    finally:
+        query_observers.remove(observe)
@@ -0,0 +1,398 @@
+import argparse
+import asyncio
+import hashlib
+import json
+import math
+import struct
+import sys
+from collections import deque
+from dataclasses import dataclass
+from datetime import datetime, timezone
+from typing import AsyncIterator, Callable, List, Optional, Tuple
+
+from bson import ObjectId
+from sqlalchemy import Float, delete, insert, select, update
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from config import AsyncSessionLocal, get_async_mongo_collection
+from models.mysql_models import InventoryMySQL, LocationMySQL
+from outbox import row_to_dict
+from replicator import mongo_op
+
+# Consistency check between the MySQL rows and MongoDB documents of an entity,
+# matched on mongo_id / _id. The key space is cut into chunks of
+# --chunk-size MySQL rows. Each side streams a chunk in key order and
+# fingerprints it (row count and a SHA-256 over every row's key and compared
+# fields), so any change to a row, renames and swaps included, shows up,
+# while a matching chunk is read once and never held in memory. A
+# mismatching chunk is split into FANOUT smaller chunks and so on down to
+# LEAF_SIZE rows, where both sides are compared row by row to name the
+# fields that differ. Memory stays bounded by LEAF_SIZE, whatever the table
+# size.
+#
+# Usage (from the api/ directory):
+#   python reconcile.py inventory                 # NDJSON diff report on stdout
+#   python reconcile.py all --repair              # make MongoDB match MySQL
+#   python reconcile.py location --repair --source mongodb
+#   python reconcile.py inventory --after <mongo_id>  # resume a run
+#
+# Progress goes to stderr (and to GET /internal/reconcile for runs started
+# with POST /internal/reconcile). Rows written while the check runs can show
+# up as transient diffs; run it again to confirm before repairing. After a
+# repair, rebuild the derived data with `python inventory_stats.py rebuild`
+# and `python capacity.py rebuild`.
+
+DEFAULT_CHUNK_SIZE = 10000
+FANOUT = 16
+LEAF_SIZE = 500
+REPAIR_BATCH_SIZE = 500
+
+
+@dataclass(frozen=True)
+class Entity:
+    name: str
+    model: type
+    numbers: Tuple[str, ...]
+    strings: Tuple[str, ...]
+    flags: Tuple[str, ...] = ()
+
+    @property
+    def fields(self) -> Tuple[str, ...]:
+        return self.numbers + self.strings + self.flags
+
+    @property
+    def floats(self) -> Tuple[str, ...]:
+        return tuple(
+            field for field in self.numbers if isinstance(self.model.__table__.c[field].type, Float)
+        )
+
+
+ENTITIES = {
+    "inventory": Entity(
+        "inventory", InventoryMySQL,
+        numbers=("location_id", "user_id", "quantity", "price", "width"),
+        strings=("name", "description"),
+        flags=("prescription_avail", "tinted", "polarized", "anti_glare"),
+    ),
+    # used is a counter maintained per store, see capacity.py
+    "location": Entity(
+        "location", LocationMySQL,
+        numbers=("location_id", "zip_code", "capacity"),
+        strings=("name", "address", "state"),
+    ),
+}
+
+# Progress of the current (or last) run in this process
+reconcile_progress = {
+    "running": False,
+    "entity": None,
+    "position": None,
+    "chunks": 0,
+    "chunks_matched": 0,
+    "rows_compared": 0,
+    "diffs": 0,
+    "repaired": 0,
+    "started_at": None,
+    "finished_at": None,
+    "error": None,
+    "recent_diffs": deque(maxlen=100),
+}
+
+
+def _now() -> str:
+    return datetime.now(timezone.utc).isoformat()
+
+
+def _same(a, b) -> bool:
+    # MySQL FLOAT columns are single precision, MongoDB stores doubles
+    if isinstance(a, float) or isinstance(b, float):
+        return a is not None and b is not None and math.isclose(a, b, rel_tol=1e-6, abs_tol=1e-6)
+    return a == b
+
+
+def _normalize(entity: Entity, source: dict) -> dict:
+    values = {field: source.get(field) for field in entity.fields}
+    for field in entity.flags:
+        if values[field] is not None:
+            values[field] = bool(values[field])
+    return values
+
+
+# Fingerprints ================================================================
+def _sql_range(entity: Entity, low: Optional[str], high: Optional[str]) -> list:
+    key = entity.model.mongo_id
+    conditions = [key.is_not(None)]
+    if low is not None:
+        conditions.append(key > low)
+    if high is not None:
+        conditions.append(key <= high)
+    return conditions
+
+
+def _mongo_range(low: Optional[str], high: Optional[str]) -> dict:
+    bounds = {}
+    if low is not None:
+        bounds["$gt"] = ObjectId(low)
+    if high is not None:
+        bounds["$lte"] = ObjectId(high)
+    return {"_id": bounds} if bounds else {}
+
+
+def _canonical(entity: Entity, key: str, source) -> bytes:
+    # The same bytes for a MySQL row and a MongoDB document holding the same
+    # values. FLOAT columns are single precision, so floats are compared at
+    # that precision; whole numbers stored as doubles count as integers
+    values = _normalize(entity, source)
+    for field in entity.numbers:
+        value = values[field]
+        if field in entity.floats and value is not None:
+            values[field] = struct.unpack("f", struct.pack("f", value))[0]
+        elif isinstance(value, float) and value.is_integer():
+            values[field] = int(value)
+    return json.dumps([key, *(values[field] for field in entity.fields)], default=str).encode()
+
+
+class _Fingerprint:
+    def __init__(self, entity: Entity):
+        self.entity = entity
+        self.count = 0
+        self.digest = hashlib.sha256()
+
+    def add(self, key: str, source) -> None:
+        self.count += 1
+        self.digest.update(_canonical(self.entity, key, source))
+        self.digest.update(b"\n")
+
+    def result(self) -> dict:
+        return {"count": self.count, "digest": self.digest.hexdigest()}
+
+
+async def fingerprint_sql(db: AsyncSession, entity: Entity, low, high) -> dict:
+    model = entity.model
+    rows = await db.stream(
+        select(model.mongo_id, *(getattr(model, field) for field in entity.fields))
+        .where(*_sql_range(entity, low, high)).order_by(model.mongo_id)
+        .execution_options(yield_per=LEAF_SIZE)
+    )
+    fingerprint = _Fingerprint(entity)
+    async for row in rows:
+        fingerprint.add(row.mongo_id, row._mapping)
+    return fingerprint.result()
+
+
+async def fingerprint_mongo(entity: Entity, low, high) -> dict:
+    cursor = get_async_mongo_collection(entity.name).find(
+        _mongo_range(low, high), {field: 1 for field in entity.fields}, batch_size=LEAF_SIZE
+    ).sort("_id", 1)
+    fingerprint = _Fingerprint(entity)
+    async for doc in cursor:
+        fingerprint.add(str(doc["_id"]), doc)
+    return fingerprint.result()
+
+
+async def boundaries(db: AsyncSession, entity: Entity, low, high, step: int) -> AsyncIterator[str]:
+    # Every step-th MySQL key in (low, high], read from the mongo_id index
+    key = entity.model.mongo_id
+    while True:
+        result = await db.execute(
+            select(key).where(*_sql_range(entity, low, high)).order_by(key).offset(step - 1).limit(1)
+        )
+        boundary = result.scalar()
+        if boundary is None:
+            return
+        yield boundary
+        low = boundary
+
+
+# Row level ===================================================================
+async def diff_rows(db: AsyncSession, entity: Entity, low, high) -> AsyncIterator[dict]:
+    # Merge join of both sides in key order
+    model = entity.model
+    sql_rows = await db.stream(
+        select(model).where(*_sql_range(entity, low, high)).order_by(model.mongo_id)
+        .execution_options(yield_per=LEAF_SIZE)
+    )
+    sql_iter = sql_rows.scalars().__aiter__()
+    mongo_iter = get_async_mongo_collection(entity.name).find(
+        _mongo_range(low, high), batch_size=LEAF_SIZE
+    ).sort("_id", 1).__aiter__()
+
+    async def next_or_none(iterator):
+        try:
+            return await iterator.__anext__()
+        except StopAsyncIteration:
+            return None
+
+    row, doc = await next_or_none(sql_iter), await next_or_none(mongo_iter)
+    while row is not None or doc is not None:
+        reconcile_progress["rows_compared"] += 1
+        row_key = row.mongo_id if row is not None else None
+        doc_key = str(doc["_id"]) if doc is not None else None
+        if doc_key is None or (row_key is not None and row_key < doc_key):
+            yield {"entity": entity.name, "mongo_id": row_key, "kind": "missing_in_mongodb", "row": row}
+            row = await next_or_none(sql_iter)
+        elif row_key is None or doc_key < row_key:
+            yield {"entity": entity.name, "mongo_id": doc_key, "kind": "missing_in_mysql", "doc": doc}
+            doc = await next_or_none(mongo_iter)
+        else:
+            sql_values, mongo_values = _normalize(entity, row_to_dict(row)), _normalize(entity, doc)
+            fields = [field for field in entity.fields if not _same(sql_values[field], mongo_values[field])]
+            if fields:
+                yield {
+                    "entity": entity.name, "mongo_id": row_key, "kind": "mismatch",
+                    "fields": fields, "row": row, "doc": doc,
+                }
+            row, doc = await next_or_none(sql_iter), await next_or_none(mongo_iter)
+
+
+async def reconcile_chunk(db: AsyncSession, entity: Entity, low, high) -> AsyncIterator[dict]:
+    reconcile_progress["chunks"] += 1
+    sql_print = await fingerprint_sql(db, entity, low, high)
+    mongo_print = await fingerprint_mongo(entity, low, high)
+    if sql_print == mongo_print:
+        reconcile_progress["chunks_matched"] += 1
+        return
+
+    if sql_print["count"] <= LEAF_SIZE:
+        async for diff in diff_rows(db, entity, low, high):
+            yield diff
+        return
+
+    # Descend into FANOUT sub-chunks; the last one is open up to high
+    step = math.ceil(sql_print["count"] / FANOUT)
+    sub_low = low
+    async for boundary in boundaries(db, entity, low, high, step):
+        async for diff in reconcile_chunk(db, entity, sub_low, boundary):
+            yield diff
+        sub_low = boundary
+    if sub_low != high:
+        async for diff in reconcile_chunk(db, entity, sub_low, high):
+            yield diff
+
+
+# Repair ======================================================================
+async def _repair(entity: Entity, diffs: List[dict], source: str) -> None:
+    # MySQL repairs use their own session: the comparison's session may be
+    # in the middle of streaming the chunk
+    if source == "mysql":
+        ops = []
+        for diff in diffs:
+            if diff["kind"] == "missing_in_mysql":
+                ops.append(mongo_op(entity.name, "delete", {"mongo_id": diff["mongo_id"]}))
+            else:
+                ops.append(mongo_op(entity.name, "upsert", row_to_dict(diff["row"])))
+        await get_async_mongo_collection(entity.name).bulk_write(ops, ordered=True)
+    else:
+        model = entity.model
+        async with AsyncSessionLocal() as db:
+            for diff in diffs:
+                if diff["kind"] == "missing_in_mongodb":
+                    await db.execute(delete(model).where(model.mongo_id == diff["mongo_id"]))
+                    continue
+                values = {field: diff["doc"].get(field) for field in entity.fields}
+                if diff["kind"] == "missing_in_mysql":
+                    await db.execute(insert(model).values(**values, mongo_id=diff["mongo_id"]))
+                else:
+                    await db.execute(update(model).where(model.mongo_id == diff["mongo_id"]).values(**values))
+            await db.commit()
+    reconcile_progress["repaired"] += len(diffs)
+
+
+def _report(diff: dict) -> dict:
+    return {key: diff[key] for key in ("entity", "mongo_id", "kind", "fields") if key in diff}
+
+
+async def reconcile(
+    entity_name: str,
+    chunk_size: int = DEFAULT_CHUNK_SIZE,
+    after: Optional[str] = None,
+    repair: bool = False,
+    source: str = "mysql",
+    on_chunk: Optional[Callable[[dict], None]] = None,
+) -> AsyncIterator[dict]:
+    # Yields one report dict per diff; on_chunk(reconcile_progress) is called
+    # after each top-level chunk
+    entity = ENTITIES[entity_name]
+    reconcile_progress.update(entity=entity_name, position=after)
+
+    async with AsyncSessionLocal() as db:
+        async def check(low, high):
+            pending = []
+            async for diff in reconcile_chunk(db, entity, low, high):
+                reconcile_progress["diffs"] += 1
+                reconcile_progress["recent_diffs"].append(_report(diff))
+                yield _report(diff)
+                if repair:
+                    pending.append(diff)
+                    if len(pending) >= REPAIR_BATCH_SIZE:
+                        await _repair(entity, pending, source)
+                        pending = []
+            if pending:
+                await _repair(entity, pending, source)
+            # End the read transaction so the next chunk sees fresh data
+            await db.commit()
+            reconcile_progress["position"] = high
+            if on_chunk is not None:
+                on_chunk(reconcile_progress)
+
+        low = after
+        async for boundary in boundaries(db, entity, after, None, chunk_size):
+            async for report in check(low, boundary):
+                yield report
+            low = boundary
+        # Everything after the last boundary, including MongoDB-only keys
+        async for report in check(low, None):
+            yield report
+
+
+async def run(entities: List[str], **options) -> None:
+    # Drives reconcile() for a background run (see routers/internal.py)
+    reconcile_progress.update(
+        running=True, chunks=0, chunks_matched=0, rows_compared=0, diffs=0, repaired=0,
+        started_at=_now(), finished_at=None, error=None,
+    )
+    reconcile_progress["recent_diffs"].clear()
+    try:
+        for entity_name in entities:
+            async for _ in reconcile(entity_name, **options):
+                pass
+    except Exception as exc:
+        reconcile_progress["error"] = repr(exc)
+    finally:
+        reconcile_progress.update(running=False, finished_at=_now())
+
+
+def progress_snapshot() -> dict:
+    return {**reconcile_progress, "recent_diffs": list(reconcile_progress["recent_diffs"])}
+
+
+def _print_progress(progress: dict) -> None:
+    print(
+        json.dumps({key: value for key, value in progress.items() if key != "recent_diffs"}),
+        file=sys.stderr, flush=True,
+    )
+
+
+async def _main(args) -> None:
+    entities = list(ENTITIES) if args.entity == "all" else [args.entity]
+    reconcile_progress.update(running=True, started_at=_now())
+    for entity_name in entities:
+        async for report in reconcile(
+            entity_name, args.chunk_size, args.after, args.repair, args.source, _print_progress
+        ):
+            print(json.dumps(report), flush=True)
+    reconcile_progress.update(running=False, finished_at=_now())
+    _print_progress(reconcile_progress)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Compare (and repair) MySQL and MongoDB copies")
+    parser.add_argument("entity", choices=[*ENTITIES, "all"])
+    parser.add_argument("--chunk-size", type=int, default=DEFAULT_CHUNK_SIZE)
+    parser.add_argument("--after", help="resume after this mongo_id")
+    parser.add_argument("--repair", action="store_true", help="fix every diff found")
+    parser.add_argument(
+        "--source", choices=["mysql", "mongodb"], default="mysql",
+        help="store whose copy wins when repairing",
+    )
+    asyncio.run(_main(parser.parse_args()))
@@ -0,0 +1,222 @@
+import argparse
+import asyncio
+import json
+import logging
+from datetime import datetime, timezone
+
+from bson import ObjectId
+from pymongo import DeleteOne, ReplaceOne, UpdateOne
+from sqlalchemy import delete, func, select, update
+
+from capacity import adjust_mongo, occupancy_from_stats
+from config import (
+    AsyncSessionLocal,
+    OUTBOX_BATCH_SIZE,
+    OUTBOX_POLL_INTERVAL,
+    get_async_mongo_collection,
+)
+from inventory_stats import apply_mongo_deltas, replicated_deltas
+from models.mysql_models import OutboxMySQL, ReplicationCheckpointMySQL
+from response_cache import location_cache
+
+# Read side of the transactional outbox: drains OutboxMySQL into MongoDB in
+# batches. Every operation is an idempotent replace/delete keyed by the Mongo
+# _id, so re-applying a batch (after a crash, or through replay) is safe.
+# Each applied event is marked with applied_at instead of tracking a
+# high-water mark: outbox_ids are handed out when a transaction inserts its
+# row, not when it commits, so a lower id can become visible after a higher
+# one has already been replicated.
+# Inventory events also update the Mongo inventory_stats totals and the
+# location used counters.
+#
+# Usage (from the api/ directory):
+#   python replicator.py run                 # drain forever
+#   python replicator.py once                # drain one batch
+#   python replicator.py status              # checkpoint, backlog and lag
+#   python replicator.py replay --from-id N  # re-apply events from N onwards
+#   python replicator.py prune               # delete already applied events
+
+CHECKPOINT_NAME = "mongo"
+
+# Outbox entity -> MongoDB collection
+COLLECTIONS = {"location": "location", "inventory": "inventory"}
+
+logger = logging.getLogger(__name__)
+
+# Counters for the running process, reported by replication_status()
+replication_stats = {
+    "events_replicated": 0,
+    "batches": 0,
+    "last_batch_at": None,
+    "last_lag_seconds": None,
+}
+
+
+def _utcnow() -> datetime:
+    # Naive UTC, matching how OutboxMySQL.created_at is stored
+    return datetime.now(timezone.utc).replace(tzinfo=None)
+
+
+def to_mongo_op(event: OutboxMySQL):
+    return mongo_op(event.entity, event.op, json.loads(event.payload))
+
+
+def mongo_op(entity: str, op: str, payload: dict):
+    # payload is a row_to_dict() copy of the MySQL row
+    payload = dict(payload)
+    mongo_id = ObjectId(payload.pop("mongo_id"))
+    if op == "delete":
+        return DeleteOne({"_id": mongo_id})
+    if entity == "location":
+        # The Mongo used counter follows the replicated inventory events
+        # below, so the MySQL value in the payload is not copied over
+        payload.pop("used", None)
+        return UpdateOne(
+            {"_id": mongo_id}, {"$set": payload, "$setOnInsert": {"used": 0}}, upsert=True
+        )
+    return ReplaceOne({"_id": mongo_id}, {"_id": mongo_id, **payload}, upsert=True)
+
+
+async def _lock_checkpoint(db) -> ReplicationCheckpointMySQL:
+    # The row lock serializes replicators running in several workers, so
+    # batches are always applied to MongoDB in outbox order
+    result = await db.execute(
+        select(ReplicationCheckpointMySQL)
+        .where(ReplicationCheckpointMySQL.name == CHECKPOINT_NAME)
+        .with_for_update()
+    )
+    checkpoint = result.scalars().first()
+    if checkpoint is None:
+        checkpoint = ReplicationCheckpointMySQL(name=CHECKPOINT_NAME, last_outbox_id=0)
+        db.add(checkpoint)
+        await db.flush()
+    return checkpoint
+
+
+async def replicate_batch(batch_size: int = OUTBOX_BATCH_SIZE) -> int:
+    async with AsyncSessionLocal() as db:
+        checkpoint = await _lock_checkpoint(db)
+        result = await db.execute(
+            select(OutboxMySQL)
+            .where(OutboxMySQL.applied_at.is_(None))
+            .order_by(OutboxMySQL.outbox_id)
+            .limit(batch_size)
+        )
+        events = result.scalars().all()
+        if not events:
+            await db.commit()
+            return 0
+
+        stats_deltas = await replicated_deltas(events)
+
+        # One ordered bulk_write per collection
+        ops = {}
+        for event in events:
+            ops.setdefault(COLLECTIONS[event.entity], []).append(to_mongo_op(event))
+        for name, collection_ops in ops.items():
+            await get_async_mongo_collection(name).bulk_write(collection_ops, ordered=True)
+        await apply_mongo_deltas(stats_deltas)
+        # Capacity was already enforced when the events were written to MySQL
+        await adjust_mongo(occupancy_from_stats(stats_deltas), enforce=False)
+        if "location" in ops:
+            location_cache.invalidate()
+
+        now = _utcnow()
+        await db.execute(
+            update(OutboxMySQL)
+            .where(OutboxMySQL.outbox_id.in_([event.outbox_id for event in events]))
+            .values(applied_at=now)
+        )
+        checkpoint.last_outbox_id = max(checkpoint.last_outbox_id, events[-1].outbox_id)
+        checkpoint.updated_at = now
+        await db.commit()
+
+    replication_stats["events_replicated"] += len(events)
+    replication_stats["batches"] += 1
+    replication_stats["last_batch_at"] = now.isoformat()
+    replication_stats["last_lag_seconds"] = (now - min(event.created_at for event in events)).total_seconds()
+    return len(events)
+
+
+async def run_replicator(
+    poll_interval: float = OUTBOX_POLL_INTERVAL, batch_size: int = OUTBOX_BATCH_SIZE
+):
+    while True:
+        try:
+            count = await replicate_batch(batch_size)
+        except asyncio.CancelledError:
+            raise
+        except Exception:
+            logger.exception("Outbox replication failed, retrying")
+            count = 0
+        # Keep draining without sleeping while there is a backlog
+        if count < batch_size:
+            await asyncio.sleep(poll_interval)
+
+
+async def replay(from_outbox_id: int):
+    async with AsyncSessionLocal() as db:
+        checkpoint = await _lock_checkpoint(db)
+        await db.execute(
+            update(OutboxMySQL)
+            .where(OutboxMySQL.outbox_id >= from_outbox_id)
+            .values(applied_at=None)
+        )
+        checkpoint.last_outbox_id = max(from_outbox_id - 1, 0)
+        checkpoint.updated_at = _utcnow()
+        await db.commit()
+
+
+async def prune() -> int:
+    async with AsyncSessionLocal() as db:
+        await _lock_checkpoint(db)
+        result = await db.execute(delete(OutboxMySQL).where(OutboxMySQL.applied_at.is_not(None)))
+        await db.commit()
+        return result.rowcount
+
+
+async def replication_status() -> dict:
+    async with AsyncSessionLocal() as db:
+        result = await db.execute(
+            select(ReplicationCheckpointMySQL).where(
+                ReplicationCheckpointMySQL.name == CHECKPOINT_NAME
+            )
+        )
+        checkpoint = result.scalars().first()
+        last_outbox_id = checkpoint.last_outbox_id if checkpoint else 0
+
+        result = await db.execute(
+            select(func.count(), func.min(OutboxMySQL.created_at)).where(
+                OutboxMySQL.applied_at.is_(None)
+            )
+        )
+        pending, oldest_pending = result.one()
+
+    return {
+        "checkpoint": last_outbox_id,
+        "pending": pending,
+        # Age of the oldest event not yet in MongoDB
+        "lag_seconds": (_utcnow() - oldest_pending).total_seconds() if oldest_pending else 0.0,
+        **replication_stats,
+    }
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Replicate the MySQL outbox to MongoDB")
+    parser.add_argument("command", choices=["run", "once", "status", "replay", "prune"])
+    parser.add_argument("--from-id", type=int, default=1, help="first outbox_id to replay")
+    parser.add_argument("--batch-size", type=int, default=OUTBOX_BATCH_SIZE)
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO)
+
+    if args.command == "run":
+        asyncio.run(run_replicator(batch_size=args.batch_size))
+    elif args.command == "once":
+        print(f"replicated {asyncio.run(replicate_batch(args.batch_size))} events")
+    elif args.command == "status":
+        print(json.dumps(asyncio.run(replication_status()), indent=2))
+    elif args.command == "replay":
+        asyncio.run(replay(args.from_id))
+        print(f"checkpoint reset, replaying from outbox_id {args.from_id}")
+    elif args.command == "prune":
+        print(f"pruned {asyncio.run(prune())} events")
@@ -0,0 +1,94 @@
+import hashlib
+import json
+import time
+from collections import OrderedDict
+from typing import Awaitable, Callable, Optional
+from urllib.parse import urlencode
+
+from fastapi import Request, Response
+from fastapi.encoders import jsonable_encoder
+
+from config import LOCATION_CACHE_SIZE, LOCATION_CACHE_TTL
+
+# Read-through cache of serialized JSON responses with ETags. Used for the
+# public location reads: a hit is answered from memory, and a client whose
+# If-None-Match matches gets a 304 without either store being queried.
+# Writers call invalidate(); the generation counter stops a read that started
+# before an invalidation from caching what it loaded.
+
+
+class CachedResponse:
+    __slots__ = ("expires_at", "etag", "body")
+
+    def __init__(self, expires_at: float, etag: str, body: bytes):
+        self.expires_at = expires_at
+        self.etag = etag
+        self.body = body
+
+
+class ResponseCache:
+    def __init__(self, maxsize: int, ttl: float):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.generation = 0
+        self._entries = OrderedDict()  # key -> CachedResponse
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key: str) -> Optional[CachedResponse]:
+        entry = self._entries.get(key)
+        if entry is None or entry.expires_at < time.monotonic():
+            self.misses += 1
+            return None
+        self._entries.move_to_end(key)
+        self.hits += 1
+        return entry
+
+    def put(self, key: str, body: bytes, generation: int) -> CachedResponse:
+        entry = CachedResponse(
+            time.monotonic() + self.ttl, '"' + hashlib.sha1(body).hexdigest() + '"', body
+        )
+        if generation == self.generation:
+            self._entries[key] = entry
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+        return entry
+
+    def invalidate(self) -> None:
+        self.generation += 1
+        self._entries.clear()
+
+    def stats(self) -> dict:
+        return {"size": len(self._entries), "hits": self.hits, "misses": self.misses}
+
+
+location_cache = ResponseCache(LOCATION_CACHE_SIZE, LOCATION_CACHE_TTL)
+
+
+def _etag_matches(if_none_match: Optional[str], etag: str) -> bool:
+    if not if_none_match:
+        return False
+    if if_none_match.strip() == "*":
+        return True
+    # Weak comparison, as for GET
+    tags = [tag.strip().removeprefix("W/") for tag in if_none_match.split(",")]
+    return etag in tags
+
+
+async def cached_response(
+    request: Request, cache: ResponseCache, loader: Callable[[], Awaitable]
+) -> Response:
+    # loader() returns the response data, already in the response_model shape
+    key = request.url.path + "?" + urlencode(sorted(request.query_params.multi_items()))
+    entry = cache.get(key)
+    if entry is None:
+        generation = cache.generation
+        data = await loader()
+        body = json.dumps(jsonable_encoder(data), separators=(",", ":")).encode()
+        entry = cache.put(key, body, generation)
+
+    headers = {"ETag": entry.etag, "Cache-Control": "no-cache"}
+    if _etag_matches(request.headers.get("if-none-match"), entry.etag):
+        return Response(status_code=304, headers=headers)
+    return Response(content=entry.body, media_type="application/json", headers=headers)
@@ -3,20 +3,24 @@ from fastapi.security import OAuth2PasswordBearer, OAuth2PasswordRequestForm
 from fastapi.responses import JSONResponse
 from schemas.mysql import user
 from models.mysql_models import UserMySql
-from config import get_db, SECRET_KEY, ALGORITHM, ACCESS_TOKEN_EXPIRE_MINUTES
-from sqlalchemy.orm import Session
+from config import get_async_db, SECRET_KEY, ALGORITHM, ACCESS_TOKEN_EXPIRE_MINUTES
+from principal_cache import Principal, principal_cache
+from hashing import hash_password, verify_and_update
+from metrics import set_current_user
+from admission import limit_user
+from query_budget import query_budget
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.exc import IntegrityError
-from passlib.context import CryptContext
 from jose import JWTError, jwt
 from datetime import datetime, timedelta, timezone
 from typing import Optional
 from pydantic import BaseModel
 
-# Password hashing
-pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
-
 # OAuth2 scheme for token authentication - used for Swagger UI
 oauth2_scheme = OAuth2PasswordBearer(tokenUrl="auth/login")
+# Same, but without rejecting requests that carry no header
+optional_oauth2_scheme = OAuth2PasswordBearer(tokenUrl="auth/login", auto_error=False)
 
 router = APIRouter(prefix="/auth")
 
@@ -32,18 +36,32 @@ class TokenData(BaseModel):
     username: Optional[str] = None
 
 
-def verify_password(plain_password, hashed_password):
-    return pwd_context.verify(plain_password, hashed_password)
+# bcrypt runs on the dedicated executor in hashing.py
+async def verify_password(plain_password, hashed_password):
+    matches, _ = await verify_and_update(plain_password, hashed_password)
+    return matches
+
+
+async def get_password_hash(password):
+    return await hash_password(password)
 
 
-def get_password_hash(password):
-    return pwd_context.hash(password)
+async def get_user_by_username(db: AsyncSession, username: str):
+    result = await db.execute(select(UserMySql).where(UserMySql.username == username))
+    return result.scalars().first()
 
 
-def authenticate_user(db: Session, username: str, password: str):
-    user_db = db.query(UserMySql).filter(UserMySql.username == username).first()
-    if not user_db or not verify_password(password, user_db.hashed_password):
+async def authenticate_user(db: AsyncSession, username: str, password: str):
+    user_db = await get_user_by_username(db, username)
+    if not user_db:
+        return False
+    matches, new_hash = await verify_and_update(password, user_db.hashed_password)
+    if not matches:
         return False
+    # The stored hash used an old bcrypt cost, replace it while we have the password
+    if new_hash:
+        user_db.hashed_password = new_hash
+        await db.commit()
     return user_db
 
 
@@ -70,9 +88,25 @@ def get_token_data(token: str):
         return None
 
 
+# Principal for a username, from the cache or MySQL; None if the user is gone
+async def resolve_principal(db: AsyncSession, username: str) -> Optional[Principal]:
+    principal = principal_cache.get(username)
+    if principal is None:
+        user_db = await get_user_by_username(db, username)
+        if user_db is None:
+            return None
+        principal = Principal(
+            user_id=user_db.user_id, username=user_db.username, role=user_db.role
+        )
+        principal_cache.put(principal)
+    return principal
+
+
 # Dependency that checks both cookie and header
-def get_current_user(
-    db: Session = Depends(get_db),
+# Returns a Principal (user_id, username, role); the MySQL lookup is skipped
+# while the principal is in principal_cache
+async def get_current_user(
+    db: AsyncSession = Depends(get_async_db),
     token: Optional[str] = Depends(oauth2_scheme),
     session_token: Optional[str] = Cookie(None),
 ):
@@ -91,32 +125,33 @@ def get_current_user(
     if token_data is None:
         raise credentials_exception
 
-    user_db = (
-        db.query(UserMySql).filter(UserMySql.username == token_data.username).first()
-    )
-    if user_db is None:
+    principal = await resolve_principal(db, token_data.username)
+    if principal is None:
         raise credentials_exception
 
-    return user_db
+    set_current_user(principal.username)
+    # Per-user token bucket, see admission.py
+    limit_user(principal.user_id)
+    return principal
 
 
-def get_admin_user(current_user: UserMySql = Depends(get_current_user)):
+async def get_admin_user(current_user: Principal = Depends(get_current_user)):
     if current_user.role != "admin":
         raise HTTPException(status_code=403, detail="Admin access required.")
     return current_user
 
 
 @router.post("/register", response_model=user.UserRead)
-def register(user_create: user.UserCreate, db: Session = Depends(get_db)):
+@query_budget(mysql=3)
+async def register(user_create: user.UserCreate, db: AsyncSession = Depends(get_async_db)):
     # Check if username or email already exists
-    db_user = (
-        db.query(UserMySql)
-        .filter(
+    result = await db.execute(
+        select(UserMySql).where(
             (UserMySql.username == user_create.username)
             | (UserMySql.email == user_create.email)
         )
-        .first()
     )
+    db_user = result.scalars().first()
 
     if db_user:
         raise HTTPException(
@@ -127,26 +162,28 @@ def register(user_create: user.UserCreate, db: Session = Depends(get_db)):
     db_user = UserMySql(
         username=user_create.username,
         email=user_create.email,
-        hashed_password=get_password_hash(user_create.password),
+        hashed_password=await get_password_hash(user_create.password),
     )
 
     try:
         db.add(db_user)
-        db.commit()
-        db.refresh(db_user)
+        await db.commit()
+        await db.refresh(db_user)
+        principal_cache.invalidate(db_user.username)
         return db_user
     except IntegrityError:
-        db.rollback()
+        await db.rollback()
         raise HTTPException(status_code=400, detail="Registration failed")
 
 
 @router.post("/login", response_model=Token)
-def login(
+@query_budget(mysql=2)
+async def login(
     response: Response,  # Add response parameter
     form_data: OAuth2PasswordRequestForm = Depends(),
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_async_db),
 ):
-    user_db = authenticate_user(db, form_data.username, form_data.password)
+    user_db = await authenticate_user(db, form_data.username, form_data.password)
     if not user_db:
         raise HTTPException(
             status_code=401,
@@ -175,11 +212,46 @@ def login(
 
 
 @router.post("/logout")
-def logout(response: Response):
+@query_budget(mysql=0)
+async def logout(
+    response: Response,
+    token: Optional[str] = Depends(optional_oauth2_scheme),
+    session_token: Optional[str] = Cookie(None),
+):
+    auth_token = token or session_token
+    token_data = get_token_data(auth_token) if auth_token else None
+    if token_data is not None:
+        principal_cache.invalidate(token_data.username)
     response.delete_cookie(key="session_token")
     return {"message": "Logged out successfully"}
 
 
 @router.get("/me", response_model=user.UserRead)
-def get_current_user_profile(current_user: UserMySql = Depends(get_current_user)):
-    return current_user
+@query_budget(mysql=2)
+async def get_current_user_profile(
+    current_user: Principal = Depends(get_current_user),
+    db: AsyncSession = Depends(get_async_db),
+):
+    user_db = await db.get(UserMySql, current_user.user_id)
+    if user_db is None:
+        raise HTTPException(status_code=404, detail="User not found")
+    return user_db
+
+
+# Change a user's role (admin only)
+@router.put("/users/{user_id}/role", response_model=user.UserRead)
+@query_budget(mysql=4)
+async def update_user_role(
+    user_id: int,
+    role_update: user.UserRoleUpdate,
+    db: AsyncSession = Depends(get_async_db),
+    current_user: Principal = Depends(get_admin_user),
+):
+    user_db = await db.get(UserMySql, user_id)
+    if user_db is None:
+        raise HTTPException(status_code=404, detail="User not found")
+    user_db.role = role_update.role
+    await db.commit()
+    # The cached principal still has the old role
+    principal_cache.invalidate(user_db.username)
+    return user_db
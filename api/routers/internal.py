@@ -0,0 +1,145 @@
+import asyncio
+from typing import Literal, Optional
+
+from fastapi import APIRouter, Depends, HTTPException, Query, Request
+from fastapi.responses import FileResponse
+
+from routers.auth import get_admin_user
+from replicator import replication_status
+from principal_cache import principal_cache
+from hashing import get_hashing_stats
+from response_cache import location_cache
+from hedging import read_latency
+from config import MONGO_MAX_POOL_SIZE, MONGO_MIN_POOL_SIZE, async_engine, engine
+from pools import mongo_pool_listener, sql_pool_report, threadpool_report
+from profiling import list_profile_ids, profile_path, profile_summary
+from query_budget import budget_report
+from admission import admission_report
+from slow_queries import recent as recent_slow_queries, slow_queries
+from reconcile import ENTITIES, progress_snapshot, reconcile_progress, run as run_reconcile
+
+# Operational endpoints, admin only
+
+router = APIRouter(prefix="/internal", dependencies=[Depends(get_admin_user)])
+
+
+# Outbox backlog and MongoDB replication lag
+@router.get("/replication")
+async def get_replication_status():
+    return await replication_status()
+
+
+# Hit/miss counters of the get_current_user principal cache
+@router.get("/auth-cache")
+async def get_auth_cache_stats():
+    return principal_cache.stats()
+
+
+# bcrypt executor load, latency and queue wait
+@router.get("/hashing")
+async def get_hashing_metrics():
+    return get_hashing_stats()
+
+
+# Location read cache hits/misses
+@router.get("/location-cache")
+async def get_location_cache_stats():
+    return location_cache.stats()
+
+
+# Per-backend latency percentiles and hedging counters of the unified reads
+@router.get("/read-latency")
+async def get_read_latency():
+    return read_latency.stats()
+
+
+# Connection pool occupancy, checkout waits and overflow, plus the worker
+# threadpool, for sizing DB_POOL_SIZE / MONGO_MAX_POOL_SIZE / THREADPOOL_SIZE
+@router.get("/pools")
+async def get_pool_stats():
+    return {
+        "mysql": sql_pool_report(async_engine),
+        "mysql_sync": sql_pool_report(engine),
+        "mongodb": mongo_pool_listener.report(MONGO_MAX_POOL_SIZE, MONGO_MIN_POOL_SIZE),
+        "threadpool": threadpool_report(),
+    }
+
+
+# Rate limiter buckets and load shedding, see admission.py
+@router.get("/admission")
+async def get_admission_stats():
+    return admission_report()
+
+
+# Declared per-route query budgets and how often each was exceeded
+@router.get("/query-budgets")
+async def get_query_budgets(request: Request):
+    return budget_report(request.app)
+
+
+# Statements and commands over SLOW_QUERY_THRESHOLD, newest first, with their plans
+@router.get("/slow-queries")
+async def get_slow_queries(
+    backend: Optional[Literal["mysql", "mongodb"]] = None,
+    limit: int = Query(50, ge=1, le=1000),
+):
+    return recent_slow_queries(limit, backend)
+
+
+@router.delete("/slow-queries", status_code=204)
+async def clear_slow_queries():
+    slow_queries.clear()
+
+
+# Requests captured with X-Profile: 1, newest first, each with its top
+# functions by cumulative time
+@router.get("/profiles")
+async def get_profiles(limit: int = Query(20, ge=1, le=200), top: int = Query(10, ge=1, le=200)):
+    # Reading the profile files is blocking I/O, done off the event loop
+    summaries = await asyncio.to_thread(
+        lambda: [profile_summary(profile_id, top) for profile_id in list_profile_ids()[:limit]]
+    )
+    return [summary for summary in summaries if summary is not None]
+
+
+@router.get("/profiles/{profile_id}")
+async def get_profile(profile_id: str, top: int = Query(50, ge=1, le=1000)):
+    summary = await asyncio.to_thread(profile_summary, profile_id, top)
+    if summary is None:
+        raise HTTPException(status_code=404, detail="Profile not found")
+    return summary
+
+
+# Raw pstats file, for snakeviz or `python -m pstats`
+@router.get("/profiles/{profile_id}/download")
+async def download_profile(profile_id: str):
+    path = profile_path(profile_id)
+    if path is None:
+        raise HTTPException(status_code=404, detail="Profile not found")
+    return FileResponse(path, media_type="application/octet-stream", filename=f"{profile_id}.prof")
+
+
+# Start a MySQL/MongoDB consistency check in the background (see
+# reconcile.py); one run at a time per process
+_reconcile_task = None
+
+
+@router.post("/reconcile", status_code=202)
+async def start_reconcile(
+    entity: Literal["inventory", "location", "all"] = "all",
+    repair: bool = False,
+    source: Literal["mysql", "mongodb"] = "mysql",
+):
+    global _reconcile_task
+    if reconcile_progress["running"]:
+        raise HTTPException(status_code=409, detail="A reconcile run is already in progress")
+    entities = list(ENTITIES) if entity == "all" else [entity]
+    reconcile_progress["running"] = True
+    _reconcile_task = asyncio.create_task(run_reconcile(entities, repair=repair, source=source))
+    return progress_snapshot()
+
+
+# Progress and most recent diffs of the current or last run
+@router.get("/reconcile")
+async def get_reconcile_progress():
+    return progress_snapshot()
@@ -1,125 +1,313 @@
-from fastapi import APIRouter, FastAPI, HTTPException, Depends
-from sqlalchemy.orm import Session
-from typing import List, Dict
+import asyncio
+import logging
+
+from fastapi import APIRouter, FastAPI, HTTPException, Depends, Query, Response
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+from typing import List, Dict, Literal
 
 from schemas.mysql import mysql_inventory
 from schemas.mongodb import mongodb_inventory
+from schemas.pagination import Page
+from schemas.search import SearchResult, TextSearchResult
+from schemas.stats import InventoryStats
 
 from models.mysql_models import InventoryMySQL
 from models.mongodb_models import InventoryMongo
-from pymongo.collection import Collection
+from pymongo.asynchronous.collection import AsyncCollection
 
 from routers.auth import get_current_user, get_admin_user
-from config import get_db, get_mongo_inventory_collection
+from config import AsyncSessionLocal, get_async_db, get_async_mongo_collection, get_async_mongo_inventory_collection
+from outbox import outbox_enabled, record_change, row_to_dict
+from pagination import PageParams, page_params, paginate_mongo, paginate_sql
+from export import export_format, stream_mongo_export, stream_sql_export
+from inventory_search import (
+    InventoryFilters, MAX_TEXT_SEARCH_LIMIT, search_filters, search_mongo, search_sql,
+    text_search_mongo, text_search_sql,
+)
+from text_index import index_inventory, unindex_inventory
+from hedging import hedged_read
+from query_budget import query_budget
+from capacity import adjust_mongo, adjust_sql, capacity_exceeded, occupancy_deltas, reversed_occupancy
+from inventory_stats import (
+    apply_mongo_deltas, apply_sql_deltas, read_mongo_stats, read_sql_stats, reverse_deltas,
+    STATS_FIELDS, stats_deltas, stats_row,
+)
+from versioning import (
+    mongo_patch, mongo_patch_error, patch_changes, sql_patch, sql_patch_error, versioned, with_pinned_retries,
+)
 from bson import ObjectId
 
 router = APIRouter(prefix="/inventory")
 
+logger = logging.getLogger(__name__)
+
 # Post inventory entry
+# The Mongo _id is generated up front and stored on the MySQL row as mongo_id.
+# In dual_write mode the Mongo and MySQL writes are sent concurrently, the
+# response is built without reading either row back, and a failed write on one
+# side is undone on the other. In outbox mode only MySQL is written here.
+# Each side also reserves room at the location (see capacity.py) and adds
+# the item to its inventory_stats totals.
+async def _insert_inventory_mongo(mongo: AsyncCollection, doc: dict):
+    occupancy = occupancy_deltas([(None, stats_row(doc))])
+    if await adjust_mongo(occupancy):
+        raise capacity_exceeded()
+    try:
+        await mongo.insert_one(doc)
+    except:
+        await adjust_mongo(reversed_occupancy(occupancy), enforce=False)
+        raise
+    await apply_mongo_deltas(stats_deltas([(None, stats_row(doc))]))
+    return doc
+
+async def _insert_inventory_sql(db: AsyncSession, row: dict):
+    if await adjust_sql(db, occupancy_deltas([(None, stats_row(row))])):
+        raise capacity_exceeded()
+    sql_inventory = InventoryMySQL(**row)
+    db.add(sql_inventory)
+    await apply_sql_deltas(db, stats_deltas([(None, stats_row(row))]))
+    # Flushing assigns the primary key, so no refresh is needed after commit
+    await db.commit()
+    return sql_inventory
+
 @router.post("/", response_model=Dict[str, mysql_inventory.InventoryRead | mongodb_inventory.InventoryRead])
-def get_all_inventory(
+@query_budget(mysql=4, mongodb=3)
+async def get_all_inventory(
     inventory_item: mysql_inventory.InventoryCreate,
-    db: Session = Depends(get_db), mongo: Collection = Depends(get_mongo_inventory_collection),
+    db: AsyncSession = Depends(get_async_db), mongo: AsyncCollection = Depends(get_async_mongo_inventory_collection),
     current_user=Depends(get_current_user)
-):  
+):
     copy = inventory_item.model_dump()
-    
-    try :
-        copy["user_id"] = current_user.user_id
-
-        mongo.insert_one(copy.copy())
-        mongo_item = mongo.find_one(copy.copy())
-    
-        sql_inventory = InventoryMySQL(**copy)
-        db.add(sql_inventory)
-        db.commit()
-        db.refresh(sql_inventory)
-    except :
-        raise HTTPException(status_code=400, detail="Invalid Form")
+    copy["user_id"] = current_user.user_id
+    mongo_id = ObjectId()
+    mongo_doc = {**copy, "_id": mongo_id, "version": 1}
+    sql_row = {**copy, "mongo_id": str(mongo_id)}
 
+    if outbox_enabled():
+        sql_inventory = InventoryMySQL(**sql_row)
+        try:
+            if await adjust_sql(db, occupancy_deltas([(None, stats_row(sql_row))])):
+                raise capacity_exceeded()
+            db.add(sql_inventory)
+            await db.flush()
+            await apply_sql_deltas(db, stats_deltas([(None, stats_row(sql_row))]))
+            record_change(db, "inventory", "upsert", sql_inventory)
+            await db.commit()
+        except HTTPException:
+            await db.rollback()
+            raise
+        except:
+            await db.rollback()
+            raise HTTPException(status_code=400, detail="Invalid Form")
+        index_inventory(sql_inventory.inventory_id, sql_inventory.user_id, name=copy["name"], description=copy["description"])
+        # The Mongo document is written by the replicator
+        return {'mongo':mongo_doc, 'mysql':sql_inventory}
 
+    mongo_result, sql_result = await asyncio.gather(
+        _insert_inventory_mongo(mongo, mongo_doc),
+        _insert_inventory_sql(db, sql_row),
+        return_exceptions=True,
+    )
+    mongo_failed = isinstance(mongo_result, BaseException)
+    sql_failed = isinstance(sql_result, BaseException)
 
-    return {'mongo':mongo_item, 'mysql':sql_inventory}
+    if not mongo_failed and not sql_failed:
+        index_inventory(sql_result.inventory_id, sql_result.user_id, name=copy["name"], description=copy["description"])
+        return {'mongo':mongo_result, 'mysql':sql_result}
+
+    # Compensate the side that succeeded so the stores do not diverge
+    undo_stats = reverse_deltas(stats_deltas([(None, stats_row(copy))]))
+    undo_occupancy = reversed_occupancy(occupancy_deltas([(None, stats_row(copy))]))
+    try:
+        if sql_failed:
+            await db.rollback()
+        else:
+            await db.delete(sql_result)
+            await apply_sql_deltas(db, undo_stats)
+            await adjust_sql(db, undo_occupancy, enforce=False)
+            await db.commit()
+        if not mongo_failed:
+            await mongo.delete_one({'_id': mongo_id})
+            await apply_mongo_deltas(undo_stats)
+            await adjust_mongo(undo_occupancy, enforce=False)
+    except Exception:
+        logger.exception("Failed to compensate inventory create (mongo _id=%s)", mongo_id)
+    # A full location is reported as such, anything else as a bad form
+    for result in (sql_result, mongo_result):
+        if isinstance(result, HTTPException):
+            raise result
+    raise HTTPException(status_code=400, detail="Invalid Form")
 
 # Get all inventory entries
-@router.get("/mysql", response_model=List[mysql_inventory.InventoryRead])
-def get_all_inventory_sql(
-    db: Session = Depends(get_db), 
+# List endpoints are keyset paginated, see pagination.py
+@router.get("/mysql", response_model=Page[mysql_inventory.InventoryRead])
+@query_budget(mysql=2)
+async def get_all_inventory_sql(
+    page: PageParams = Depends(page_params),
+    db: AsyncSession = Depends(get_async_db),
     current_user=Depends(get_current_user)
 ):
     if(current_user.role == "admin"):
-        return db.query(InventoryMySQL).all()
+        stmt = select(InventoryMySQL)
     else:
-        return db.query(InventoryMySQL).filter(
+        stmt = select(InventoryMySQL).where(
             InventoryMySQL.user_id == current_user.user_id
             )
+    return await paginate_sql(db, stmt, InventoryMySQL.inventory_id, page)
 
-@router.get("/mongodb", response_model=List[mongodb_inventory.InventoryRead])
-def get_all_inventory_mongo(
-    mongo: Collection = Depends(get_mongo_inventory_collection), current_user=Depends(get_current_user)
+@router.get("/mongodb", response_model=Page[mongodb_inventory.InventoryRead])
+@query_budget(mysql=1, mongodb=1)
+async def get_all_inventory_mongo(
+    page: PageParams = Depends(page_params),
+    mongo: AsyncCollection = Depends(get_async_mongo_inventory_collection), current_user=Depends(get_current_user)
 ):
     if(current_user.role == "admin"):
-        return mongo.find()
+        return await paginate_mongo(mongo, {}, page)
     else:
-        return mongo.find(
-            {"user_id": current_user.user_id})
+        return await paginate_mongo(mongo, {"user_id": current_user.user_id}, page)
 
 # Get inventory at location_id
-@router.get("/mysql/by_location/{location_id}", response_model=List[mysql_inventory.InventoryRead])
-def get_inventory_by_location_sql(
+@router.get("/mysql/by_location/{location_id}", response_model=Page[mysql_inventory.InventoryRead])
+@query_budget(mysql=2)
+async def get_inventory_by_location_sql(
     location_id: int,
-    db: Session = Depends(get_db), current_user=Depends(get_current_user)
+    page: PageParams = Depends(page_params),
+    db: AsyncSession = Depends(get_async_db), current_user=Depends(get_current_user)
 ):
     if(current_user.role == "admin"):
-        return db.query(InventoryMySQL).filter(InventoryMySQL.location_id == location_id).all()
+        stmt = select(InventoryMySQL).where(InventoryMySQL.location_id == location_id)
     else:
-        return db.query(InventoryMySQL).filter(
+        stmt = select(InventoryMySQL).where(
             InventoryMySQL.location_id == location_id,
-            InventoryMySQL.user_id == current_user.user_id).all()
-    
-@router.get("/mongodb/by_location/{location_id}", response_model=List[mongodb_inventory.InventoryRead])
-def get_inventory_by_location_mongo(
+            InventoryMySQL.user_id == current_user.user_id)
+    return await paginate_sql(db, stmt, InventoryMySQL.inventory_id, page)
+
+@router.get("/mongodb/by_location/{location_id}", response_model=Page[mongodb_inventory.InventoryRead])
+@query_budget(mysql=1, mongodb=1)
+async def get_inventory_by_location_mongo(
     location_id: int,
-    mongo: Collection = Depends(get_mongo_inventory_collection), current_user=Depends(get_current_user)
+    page: PageParams = Depends(page_params),
+    mongo: AsyncCollection = Depends(get_async_mongo_inventory_collection), current_user=Depends(get_current_user)
 ):
     if(current_user.role == "admin"):
-        return mongo.find({"location_id": location_id})
+        return await paginate_mongo(mongo, {"location_id": location_id}, page)
     else:
-        return mongo.find(
-            {"location_id": location_id, "user_id": current_user.user_id})
+        return await paginate_mongo(
+            mongo, {"location_id": location_id, "user_id": current_user.user_id}, page)
+
+# Stream every inventory entry the user can see as NDJSON or CSV
+# (declared before the /{inventory_id} routes so "export" is not taken as an id)
+@router.get("/mysql/export")
+@query_budget(mysql=2)
+async def export_inventory_sql(
+    format: str = Depends(export_format), current_user=Depends(get_current_user)
+):
+    stmt = select(InventoryMySQL).order_by(InventoryMySQL.inventory_id)
+    if not current_user.role == "admin":
+        stmt = stmt.where(InventoryMySQL.user_id == current_user.user_id)
+    return stream_sql_export(stmt, mysql_inventory.InventoryRead, format, "inventory")
+
+@router.get("/mongodb/export")
+@query_budget(mysql=1, mongodb=1)
+async def export_inventory_mongo(
+    format: str = Depends(export_format),
+    mongo: AsyncCollection = Depends(get_async_mongo_inventory_collection), current_user=Depends(get_current_user)
+):
+    query = {} if current_user.role == "admin" else {"user_id": current_user.user_id}
+    return stream_mongo_export(mongo, query, mongodb_inventory.InventoryRead, format, "inventory")
+
+# Faceted search: filters, sort and limit are pushed down to the database
+# and facet counts cover every match (see inventory_search.py)
+@router.get("/mysql/search", response_model=SearchResult[mysql_inventory.InventoryRead])
+@query_budget(mysql=3)
+async def search_inventory_sql(
+    filters: InventoryFilters = Depends(search_filters),
+    db: AsyncSession = Depends(get_async_db), current_user=Depends(get_current_user)
+):
+    return await search_sql(db, filters, current_user)
+
+@router.get("/mongodb/search", response_model=SearchResult[mongodb_inventory.InventoryRead])
+@query_budget(mysql=1, mongodb=2)
+async def search_inventory_mongo(
+    filters: InventoryFilters = Depends(search_filters),
+    mongo: AsyncCollection = Depends(get_async_mongo_inventory_collection), current_user=Depends(get_current_user)
+):
+    return await search_mongo(mongo, filters, current_user)
+
+# Ranked full-text search over name and description
+@router.get("/mysql/text_search", response_model=TextSearchResult[mysql_inventory.InventoryRead])
+@query_budget(mysql=3)
+async def text_search_inventory_sql(
+    q: str = Query(..., min_length=1, max_length=200),
+    page: int = Query(0, ge=0), limit: int = Query(20, ge=1, le=MAX_TEXT_SEARCH_LIMIT),
+    db: AsyncSession = Depends(get_async_db), current_user=Depends(get_current_user)
+):
+    return await text_search_sql(db, q, page, limit, current_user)
+
+@router.get("/mongodb/text_search", response_model=TextSearchResult[mongodb_inventory.InventoryRead])
+@query_budget(mysql=1, mongodb=1)
+async def text_search_inventory_mongo(
+    q: str = Query(..., min_length=1, max_length=200),
+    page: int = Query(0, ge=0), limit: int = Query(20, ge=1, le=MAX_TEXT_SEARCH_LIMIT),
+    mongo: AsyncCollection = Depends(get_async_mongo_inventory_collection), current_user=Depends(get_current_user)
+):
+    return await text_search_mongo(mongo, q, page, limit, current_user)
+
+# Units, retail value and SKU counts per location or per user, read from the
+# inventory_stats summaries (see inventory_stats.py). Users only see totals
+# for their own inventory
+@router.get("/mysql/stats", response_model=List[InventoryStats])
+@query_budget(mysql=2)
+async def get_inventory_stats_sql(
+    group_by: Literal["location", "user"] = "location",
+    db: AsyncSession = Depends(get_async_db), current_user=Depends(get_current_user)
+):
+    return await read_sql_stats(db, group_by, current_user)
+
+@router.get("/mongodb/stats", response_model=List[InventoryStats])
+@query_budget(mysql=1, mongodb=1)
+async def get_inventory_stats_mongo(
+    group_by: Literal["location", "user"] = "location",
+    current_user=Depends(get_current_user)
+):
+    return await read_mongo_stats(group_by, current_user)
 
 # Get inventory by inventory_id
 @router.get("/mysql/{inventory_id}", response_model=mysql_inventory.InventoryRead)
-def get_inventory_sql(
+@query_budget(mysql=2)
+async def get_inventory_sql(
     inventory_id: int,
-    db: Session = Depends(get_db), current_user=Depends(get_current_user)
+    db: AsyncSession = Depends(get_async_db), current_user=Depends(get_current_user)
 ):
     obj = None
     if(current_user.role == "admin"):
-        obj = db.query(InventoryMySQL).filter(InventoryMySQL.inventory_id == inventory_id).first()
+        stmt = select(InventoryMySQL).where(InventoryMySQL.inventory_id == inventory_id)
     else:
-        obj = db.query(InventoryMySQL).filter(
+        stmt = select(InventoryMySQL).where(
             InventoryMySQL.inventory_id == inventory_id,
-            InventoryMySQL.user_id == current_user.user_id).first()
+            InventoryMySQL.user_id == current_user.user_id)
+    obj = (await db.execute(stmt)).scalars().first()
     if obj == None:
         raise HTTPException(status_code=404, detail="Not found")
     return obj
-    
+
 @router.get("/mongodb/{inventory_id}", response_model=mongodb_inventory.InventoryRead)
-def get_inventory_mongo(
+@query_budget(mysql=1, mongodb=1)
+async def get_inventory_mongo(
     inventory_id: str,
-    mongo: Collection = Depends(get_mongo_inventory_collection), current_user=Depends(get_current_user)
+    mongo: AsyncCollection = Depends(get_async_mongo_inventory_collection), current_user=Depends(get_current_user)
 ):
     if(current_user.role == "admin"):
         try:
-            obj = mongo.find_one({"_id": ObjectId(inventory_id)})
+            obj = await mongo.find_one({"_id": ObjectId(inventory_id)})
         except:
             raise HTTPException(status_code=404, detail="Not found")
         if obj != None:
             return obj
     else:
         try:
-            obj = mongo.find_one({
+            obj = await mongo.find_one({
             "_id": ObjectId(inventory_id),
             "user_id": current_user.user_id})
         except:
@@ -127,83 +315,162 @@ def get_inventory_mongo(
         if obj != None:
             return obj
     raise HTTPException(status_code=404,detail="Not Found")
-    
+
 # Edit inventory at certain location
+# PUT and PATCH both only write the fields that were sent, with a single
+# conditional UPDATE / find_one_and_update (see versioning.py). When the
+# quantity, price or location changes, the stats fields are read first so the
+# location capacity and inventory_stats can be adjusted, and the write is then
+# pinned to the version that was read.
+async def _patch_inventory_sql(db: AsyncSession, inventory_id: int, changes: dict, version, owner):
+    conditions = [InventoryMySQL.inventory_id == inventory_id]
+    if owner is not None:
+        conditions.append(InventoryMySQL.user_id == owner)
+    item = None
+    if changes.keys() & set(STATS_FIELDS):
+        stmt = select(InventoryMySQL).where(*conditions).with_for_update()
+        if version is not None:
+            stmt = stmt.where(InventoryMySQL.version == version)
+        item = (await db.execute(stmt)).scalars().first()
+        if item is None:
+            raise await sql_patch_error(
+                db, InventoryMySQL, InventoryMySQL.inventory_id, inventory_id, "Inventory not found",
+                InventoryMySQL.user_id, owner,
+            )
+        version = item.version
+        before = stats_row(item)
+        after = stats_row({**before, **changes})
+        # Quantity changes and moves must fit the (new) location
+        if await adjust_sql(db, occupancy_deltas([(before, after)])):
+            raise capacity_exceeded()
+        await apply_sql_deltas(db, stats_deltas([(before, after)]))
+    # The session applies the UPDATE to item as well, so it needs no reload
+    if not await sql_patch(db, InventoryMySQL, conditions, changes, version):
+        raise await sql_patch_error(
+            db, InventoryMySQL, InventoryMySQL.inventory_id, inventory_id, "Inventory not found",
+            InventoryMySQL.user_id, owner,
+        )
+    if item is None:
+        stmt = select(InventoryMySQL).where(InventoryMySQL.inventory_id == inventory_id)
+        item = (await db.execute(stmt)).scalars().first()
+    return item
+
+async def _patch_inventory_mongo(mongo: AsyncCollection, query: dict, changes: dict, version, owner):
+    before, occupancy = None, {}
+    if changes.keys() & set(STATS_FIELDS):
+        item = await mongo.find_one(query if version is None else versioned(query, version))
+        if item is None:
+            raise await mongo_patch_error(mongo, query["_id"], "Inventory not found", "user_id", owner)
+        version = item.get("version", 1)
+        before = stats_row(item)
+        # Quantity changes and moves must fit the (new) location
+        occupancy = occupancy_deltas([(before, stats_row({**before, **changes}))])
+        if await adjust_mongo(occupancy):
+            raise capacity_exceeded()
+    try:
+        item = await mongo_patch(mongo, query, changes, version)
+    except:
+        await adjust_mongo(reversed_occupancy(occupancy), enforce=False)
+        raise HTTPException(status_code=400, detail="Invalid Form")
+    if item is None:
+        # Changed since it was read above
+        await adjust_mongo(reversed_occupancy(occupancy), enforce=False)
+        raise await mongo_patch_error(mongo, query["_id"], "Inventory not found", "user_id", owner)
+    if before is not None:
+        await apply_mongo_deltas(stats_deltas([(before, stats_row(item))]))
+    return item
+
 @router.put("/mysql/{inventory_id}", response_model=mysql_inventory.InventoryRead)
-def put_inventory_sql(
+@router.patch("/mysql/{inventory_id}", response_model=mysql_inventory.InventoryRead)
+@query_budget(mysql=11)  # a move, plus one retry after a concurrent write
+async def put_inventory_sql(
     inventory_id: int,
     inventory_item: mysql_inventory.InventoryUpdate,
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_async_db),
     current_user=Depends(get_current_user)
-):  
-    item = db.query(InventoryMySQL).get(inventory_id)
-    if not item:
-        raise HTTPException(status_code=404,detail="Inventory not found")
-    if not item.user_id == current_user.user_id and not current_user.role == "admin":
-        raise HTTPException(status_code=401, detail="Not Authorized")
-
-    for key, value in inventory_item.model_dump().items():
-        setattr(item, key, value)
+):
+    changes, version = patch_changes(inventory_item)
+    owner = None if current_user.role == "admin" else current_user.user_id
     try:
-        db.commit()
-        db.refresh(item)
+        item = await with_pinned_retries(
+            lambda: _patch_inventory_sql(db, inventory_id, changes, version, owner), version, db.rollback
+        )
+        if outbox_enabled():
+            if item.mongo_id is None:
+                item.mongo_id = str(ObjectId())
+                await db.flush()
+            record_change(db, "inventory", "upsert", item)
+        await db.commit()
+    except HTTPException:
+        await db.rollback()
+        raise
     except :
+        await db.rollback()
         raise HTTPException(status_code=400, detail="Invalid Form")
+    if "name" in changes or "description" in changes:
+        index_inventory(item.inventory_id, item.user_id, name=item.name, description=item.description)
     return item
 
 @router.put("/mongodb/{inventory_id}", response_model=mongodb_inventory.InventoryRead)
-def put_inventory_mongo(
+@router.patch("/mongodb/{inventory_id}", response_model=mongodb_inventory.InventoryRead)
+@query_budget(mysql=1, mongodb=11)  # a move, plus one retry after a concurrent write
+async def put_inventory_mongo(
     inventory_id: str,
     inventory_item: mongodb_inventory.InventoryUpdate,
-    mongo: Collection = Depends(get_mongo_inventory_collection),
+    mongo: AsyncCollection = Depends(get_async_mongo_inventory_collection),
     current_user=Depends(get_current_user)
-):  
-    try :
-        item = mongo.find_one({'_id': ObjectId(inventory_id)})
-    except:
-        raise HTTPException(status_code=404,detail="Inventory not found")
-    if not item:
+):
+    if not ObjectId.is_valid(inventory_id):
         raise HTTPException(status_code=404,detail="Inventory not found")
-    if not item["user_id"] == current_user.user_id and not current_user.role == "admin":
-        raise HTTPException(status_code=401, detail="Not Authorized")
-    
-    for key, value in inventory_item.model_dump().items():
-        item[key] = value
-    #try:
-
-        mongo.update_one({'_id': ObjectId(inventory_id)}, {'$set':item})
-    #except :
-    #    raise HTTPException(status_code=400, detail="Invalid Form")
-    return item
-    
+    changes, version = patch_changes(inventory_item)
+    owner = None if current_user.role == "admin" else current_user.user_id
+    query = {"_id": ObjectId(inventory_id)}
+    if owner is not None:
+        query["user_id"] = owner
+    return await with_pinned_retries(
+        lambda: _patch_inventory_mongo(mongo, query, changes, version, owner), version
+    )
+
 # Delete inventory at certain location
 @router.delete("/mysql/{inventory_id}", response_model=Dict[str,str])
-def delete_inventory_sql(
+@query_budget(mysql=5)
+async def delete_inventory_sql(
     inventory_id: int,
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_async_db),
     current_user=Depends(get_current_user)
-):  
-    item = db.query(InventoryMySQL).get(inventory_id)
+):
+    # Locked so the stats and capacity deltas match the row that is deleted
+    item = await db.get(InventoryMySQL, inventory_id, with_for_update=True)
     if not item:
         raise HTTPException(status_code=404,detail="Inventory not found")
     if not item.user_id == current_user.user_id and not current_user.role == "admin":
         raise HTTPException(status_code=401, detail="Not Authorized")
 
     try:
-        db.delete(item)
-        db.commit()
-    except :
+        if outbox_enabled() and item.mongo_id is not None:
+            record_change(db, "inventory", "delete", item)
+        await apply_sql_deltas(db, stats_deltas([(stats_row(item), None)]))
+        await adjust_sql(db, occupancy_deltas([(stats_row(item), None)]), enforce=False)
+        await db.delete(item)
+        await db.commit()
+    except HTTPException:
+        await db.rollback()
+        raise
+    except Exception:
+        await db.rollback()
         raise HTTPException(status_code=400, detail="Invalid Form")
+    unindex_inventory(inventory_id)
     return {"message":"deleted successfully"}
 
 @router.delete("/mongodb/{inventory_id}", response_model=Dict[str,str])
-def delete_inventory_mongo(
+@query_budget(mysql=1, mongodb=4)
+async def delete_inventory_mongo(
     inventory_id: str,
-    mongo: Collection = Depends(get_mongo_inventory_collection),
+    mongo: AsyncCollection = Depends(get_async_mongo_inventory_collection),
     current_user=Depends(get_current_user)
-):  
+):
     try :
-        item = mongo.find_one({'_id': ObjectId(inventory_id)})
+        item = await mongo.find_one({'_id': ObjectId(inventory_id)})
     except:
         raise HTTPException(status_code=404,detail="Inventory not found")
     if not item:
@@ -211,8 +478,46 @@ def delete_inventory_mongo(
     if not item["user_id"] == current_user.user_id and not current_user.role == "admin":
         raise HTTPException(status_code=401, detail="Not Authorized")
 
+    # The deltas come from the document as it was deleted, and only the
+    # request that deleted it applies them
     try:
-        mongo.delete_one({'_id': ObjectId(inventory_id)})
+        item = await mongo.find_one_and_delete({'_id': ObjectId(inventory_id)})
     except :
         raise HTTPException(status_code=400, detail="Invalid Form")
-    return {"message":"deleted successfully"}
\ No newline at end of file
+    if item is not None:
+        await apply_mongo_deltas(stats_deltas([(stats_row(item), None)]))
+        await adjust_mongo(occupancy_deltas([(stats_row(item), None)]), enforce=False)
+    return {"message":"deleted successfully"}
+
+# Read one entry from whichever store answers first, by its mongo_id (the
+# id both stores share), see hedging.py. The response uses the MongoDB shape
+# and X-Served-By names the store that answered.
+# Declared last so /inventory/mysql and /inventory/mongodb keep their routes
+@router.get("/{mongo_id}", response_model=mongodb_inventory.InventoryRead)
+@query_budget(mysql=2, mongodb=1)
+async def get_inventory_hedged(
+    mongo_id: str, response: Response, current_user=Depends(get_current_user)
+):
+    if not ObjectId.is_valid(mongo_id):
+        raise HTTPException(status_code=404, detail="Not found")
+    user_id = None if current_user.role == "admin" else current_user.user_id
+
+    async def from_mysql():
+        stmt = select(InventoryMySQL).where(InventoryMySQL.mongo_id == mongo_id)
+        if user_id is not None:
+            stmt = stmt.where(InventoryMySQL.user_id == user_id)
+        async with AsyncSessionLocal() as db:
+            row = (await db.execute(stmt)).scalars().first()
+        return None if row is None else {**row_to_dict(row), "_id": mongo_id}
+
+    async def from_mongodb():
+        query = {"_id": ObjectId(mongo_id)}
+        if user_id is not None:
+            query["user_id"] = user_id
+        return await get_async_mongo_collection("inventory").find_one(query)
+
+    backend, item = await hedged_read({"mysql": from_mysql, "mongodb": from_mongodb})
+    if item is None:
+        raise HTTPException(status_code=404, detail="Not found")
+    response.headers["X-Served-By"] = backend
+    return item
@@ -0,0 +1,471 @@
+import asyncio
+import logging
+from collections import defaultdict
+
+from bson import ObjectId
+from fastapi import APIRouter, Body, Depends
+from pymongo.asynchronous.collection import AsyncCollection
+from pymongo.errors import BulkWriteError
+from sqlalchemy import bindparam, delete, insert, select, update
+from sqlalchemy.ext.asyncio import AsyncSession
+from typing import Dict, List
+
+from schemas.bulk import BulkItemResult, BulkResult
+from schemas.mysql import mysql_inventory
+from schemas.mongodb import mongodb_inventory
+
+from models.mysql_models import InventoryMySQL, LocationMySQL
+
+from routers.auth import get_current_user
+from config import get_async_db, get_async_mongo_inventory_collection
+from outbox import outbox_enabled, record_changes, row_to_dict
+from text_index import index_inventory, unindex_inventory
+from capacity import (
+    CAPACITY_EXCEEDED, adjust_mongo, adjust_sql, occupancy_deltas, reserve_mongo, reserve_sql,
+    reversed_occupancy,
+)
+from inventory_stats import (
+    STATS_FIELDS, apply_mongo_deltas, apply_sql_deltas, reverse_deltas, stats_deltas, stats_row,
+)
+from versioning import VERSION_CONFLICT, mongo_patch
+
+# Bulk inventory endpoints. MySQL applies each request with a handful of
+# statements (executemany INSERT/UPDATE) instead of one round trip per item;
+# MongoDB uses insert_many, and concurrent per-document writes where each
+# document has to be checked on its own. Ownership is still checked per item.
+# inventory_stats totals are updated with one upsert per request, and
+# location capacity is reserved with one conditional update per location
+# (items that do not fit are reported as `invalid`). Since that grows with
+# the number of distinct locations, these routes declare no @query_budget.
+# Included in main.py before routers/inventory.py so /mysql/bulk is not
+# matched as /mysql/{inventory_id}.
+
+router = APIRouter(prefix="/inventory")
+
+logger = logging.getLogger(__name__)
+
+MAX_BULK_ITEMS = 5000
+
+
+def _ownership_status(owner_id, current_user):
+    if owner_id is None:
+        return "not_found"
+    if not owner_id == current_user.user_id and not current_user.role == "admin":
+        return "not_authorized"
+    return None
+
+
+def _changes(item, id_field: str) -> dict:
+    # Only the fields the client sent; every column is NOT NULL so explicit
+    # nulls are dropped as well. A client version is only checked by the
+    # single-item PATCH (versioning.py)
+    return {
+        key: value
+        for key, value in item.model_dump(exclude_unset=True, exclude={id_field, "version"}).items()
+        if value is not None
+    }
+
+
+def _summarize(results: List[BulkItemResult]) -> BulkResult:
+    succeeded = sum(result.status in ("created", "updated", "deleted") for result in results)
+    return BulkResult(succeeded=succeeded, failed=len(results) - succeeded, results=results)
+
+
+def _fail(results, indexes, detail="Invalid Form", status="error"):
+    for index in indexes:
+        results[index] = BulkItemResult(index=index, status=status, detail=detail)
+
+
+def _created_deltas(rows: dict, mongo_ids) -> list:
+    return stats_deltas((None, stats_row(rows[mongo_id][1])) for mongo_id in mongo_ids)
+
+
+def _created_occupancy(rows: dict, mongo_ids) -> dict:
+    return occupancy_deltas((None, stats_row(rows[mongo_id][1])) for mongo_id in mongo_ids)
+
+
+def _reject_full(results, indexes):
+    for index in indexes:
+        results[index] = BulkItemResult(index=index, status="invalid", detail=CAPACITY_EXCEEDED)
+
+
+# Bulk create =================================================================
+# Same dual-write contract as POST /inventory/: both stores are written
+# concurrently and whatever one side failed to write is removed from the other.
+@router.post("/bulk", response_model=BulkResult)
+async def bulk_create_inventory(
+    items: List[mysql_inventory.InventoryCreate] = Body(..., max_length=MAX_BULK_ITEMS),
+    db: AsyncSession = Depends(get_async_db),
+    mongo: AsyncCollection = Depends(get_async_mongo_inventory_collection),
+    current_user=Depends(get_current_user),
+):
+    results = [None] * len(items)
+
+    # Location ids are checked up front so one bad item does not fail the
+    # whole executemany on the foreign key
+    location_ids = {item.location_id for item in items}
+    known_locations = set(
+        (
+            await db.execute(
+                select(LocationMySQL.location_id).where(LocationMySQL.location_id.in_(list(location_ids)))
+            )
+        ).scalars()
+    )
+
+    rows = {}  # mongo_id -> (index, row)
+    for index, item in enumerate(items):
+        if item.location_id not in known_locations:
+            results[index] = BulkItemResult(index=index, status="invalid", detail="Location not found")
+            continue
+        mongo_id = str(ObjectId())
+        row = {**item.model_dump(), "user_id": current_user.user_id, "mongo_id": mongo_id}
+        rows[mongo_id] = (index, row)
+
+    if rows:
+        await _reserve_capacity(db, rows, results)
+    if rows:
+        await _bulk_insert(db, mongo, rows, results)
+    return _summarize(results)
+
+
+async def _reserve_capacity(db: AsyncSession, rows: dict, results: list):
+    # Reserved in the transaction _bulk_insert commits and, in dual_write
+    # mode, in MongoDB. Rejected items are removed from rows
+    changes = {mongo_id: (None, stats_row(row)) for mongo_id, (_, row) in rows.items()}
+    rejected = await reserve_sql(db, changes)
+    if not outbox_enabled():
+        mongo_rejected = await reserve_mongo(
+            {mongo_id: change for mongo_id, change in changes.items() if mongo_id not in rejected}
+        )
+        await adjust_sql(db, reversed_occupancy(_created_occupancy(rows, mongo_rejected)), enforce=False)
+        rejected |= mongo_rejected
+    _reject_full(results, [rows[mongo_id][0] for mongo_id in rejected])
+    for mongo_id in rejected:
+        del rows[mongo_id]
+
+
+async def _bulk_insert(db: AsyncSession, mongo: AsyncCollection, rows: dict, results: list):
+    sql_rows = [row for _, row in rows.values()]
+
+    async def write_sql():
+        await db.execute(insert(InventoryMySQL), sql_rows)
+        # MySQL has no RETURNING, so the new keys are read back by mongo_id
+        result = await db.execute(
+            select(InventoryMySQL.mongo_id, InventoryMySQL.inventory_id).where(
+                InventoryMySQL.mongo_id.in_(list(rows))
+            )
+        )
+        ids = dict(result.all())
+        await apply_sql_deltas(db, _created_deltas(rows, rows))
+        if outbox_enabled():
+            await record_changes(
+                db, "inventory", "upsert",
+                [{**row, "inventory_id": ids[row["mongo_id"]], "version": 1} for row in sql_rows],
+            )
+        await db.commit()
+        return ids
+
+    async def write_mongo():
+        # Returns the mongo_ids that failed to insert
+        if outbox_enabled():
+            return set()
+        docs = []
+        for mongo_id, (_, row) in rows.items():
+            doc = {key: value for key, value in row.items() if key != "mongo_id"}
+            docs.append({**doc, "_id": ObjectId(mongo_id), "version": 1})
+        try:
+            await mongo.insert_many(docs, ordered=False)
+        except BulkWriteError as exc:
+            return {str(docs[error["index"]]["_id"]) for error in exc.details["writeErrors"]}
+        return set()
+
+    sql_result, mongo_result = await asyncio.gather(write_sql(), write_mongo(), return_exceptions=True)
+
+    sql_failed = isinstance(sql_result, BaseException)
+    if isinstance(mongo_result, BaseException):
+        # Unknown how much of the batch landed, so undo all of it
+        mongo_failed, mongo_undo = set(rows), set(rows)
+    else:
+        mongo_failed, mongo_undo = mongo_result, set(rows) - mongo_result if sql_failed else set()
+    failed = set(rows) if sql_failed else mongo_failed
+
+    try:
+        if sql_failed:
+            await db.rollback()
+        elif failed:
+            await db.execute(delete(InventoryMySQL).where(InventoryMySQL.mongo_id.in_(list(failed))))
+            await apply_sql_deltas(db, reverse_deltas(_created_deltas(rows, failed)))
+            await adjust_sql(db, reversed_occupancy(_created_occupancy(rows, failed)), enforce=False)
+            await db.commit()
+    except Exception:
+        logger.exception("Failed to compensate bulk inventory create in MySQL")
+
+    if not outbox_enabled():
+        try:
+            if mongo_undo:
+                await mongo.delete_many({"_id": {"$in": [ObjectId(mongo_id) for mongo_id in mongo_undo]}})
+        except Exception:
+            logger.exception("Failed to compensate bulk inventory create in MongoDB")
+        # Everything was reserved up front; rows that did not make it into
+        # both stores give their room back, whichever side failed
+        await apply_mongo_deltas(_created_deltas(rows, set(rows) - failed))
+        await adjust_mongo(reversed_occupancy(_created_occupancy(rows, failed)), enforce=False)
+
+    for mongo_id, (index, row) in rows.items():
+        if mongo_id in failed:
+            _fail(results, [index])
+        else:
+            results[index] = BulkItemResult(
+                index=index, status="created", id=sql_result[mongo_id], mongo_id=mongo_id
+            )
+            index_inventory(
+                sql_result[mongo_id], row["user_id"], name=row["name"], description=row["description"]
+            )
+
+
+# Bulk update =================================================================
+# Items for the same id are merged (later fields win) into one write per id.
+# MySQL locks the rows it reads until commit and bumps the version in SQL.
+# MongoDB writes each document only if its version is still the one read,
+# like a PATCH that sent its version; documents changed in between are
+# reported as `conflict`. Either way the stats and capacity deltas start
+# from what was stored.
+async def _update_sql_rows(db: AsyncSession, changes: Dict[int, dict]) -> None:
+    # One executemany per set of columns
+    table = InventoryMySQL.__table__
+    groups = defaultdict(list)
+    for inventory_id, row in changes.items():
+        groups[tuple(sorted(row))].append(
+            {"b_inventory_id": inventory_id, **{f"b_{key}": value for key, value in row.items()}}
+        )
+    for columns, params in groups.items():
+        stmt = (
+            update(table)
+            .where(table.c.inventory_id == bindparam("b_inventory_id"))
+            .values(**{column: bindparam(f"b_{column}") for column in columns}, version=table.c.version + 1)
+        )
+        await db.execute(stmt, params)
+
+
+@router.put("/mysql/bulk", response_model=BulkResult)
+async def bulk_update_inventory_sql(
+    items: List[mysql_inventory.InventoryBulkUpdate] = Body(..., max_length=MAX_BULK_ITEMS),
+    db: AsyncSession = Depends(get_async_db),
+    current_user=Depends(get_current_user),
+):
+    results = [None] * len(items)
+    result = await db.execute(
+        select(InventoryMySQL.inventory_id, *(getattr(InventoryMySQL, field) for field in STATS_FIELDS))
+        .where(InventoryMySQL.inventory_id.in_(list({item.inventory_id for item in items})))
+        .with_for_update()
+    )
+    before = {row.inventory_id: stats_row(dict(row._mapping)) for row in result}
+    owners = {inventory_id: row["user_id"] for inventory_id, row in before.items()}
+
+    changes, pending = {}, []
+    for index, item in enumerate(items):
+        status = _ownership_status(owners.get(item.inventory_id), current_user)
+        if status:
+            results[index] = BulkItemResult(index=index, status=status, id=item.inventory_id)
+            continue
+        item_changes = _changes(item, "inventory_id")
+        if item_changes:
+            changes[item.inventory_id] = {**changes.get(item.inventory_id, {}), **item_changes}
+        pending.append(index)
+    after = {inventory_id: stats_row({**before[inventory_id], **row}) for inventory_id, row in changes.items()}
+
+    try:
+        full = await reserve_sql(db, {inventory_id: (before[inventory_id], after[inventory_id]) for inventory_id in changes})
+        if full:
+            _reject_full(results, [index for index in pending if items[index].inventory_id in full])
+            pending = [index for index in pending if items[index].inventory_id not in full]
+            changes = {inventory_id: row for inventory_id, row in changes.items() if inventory_id not in full}
+        if changes:
+            await _update_sql_rows(db, changes)
+            await apply_sql_deltas(
+                db, stats_deltas((before[inventory_id], after[inventory_id]) for inventory_id in changes)
+            )
+            if outbox_enabled():
+                changed = await db.execute(
+                    select(InventoryMySQL).where(InventoryMySQL.inventory_id.in_(list(changes)))
+                )
+                await record_changes(
+                    db, "inventory", "upsert", [row_to_dict(row) for row in changed.scalars()]
+                )
+        await db.commit()
+    except Exception:
+        await db.rollback()
+        _fail(results, pending)
+        return _summarize(results)
+
+    for inventory_id, row in changes.items():
+        if "name" in row or "description" in row:
+            index_inventory(
+                inventory_id, owners[inventory_id], name=row.get("name"), description=row.get("description")
+            )
+    for index in pending:
+        results[index] = BulkItemResult(index=index, status="updated", id=items[index].inventory_id)
+    return _summarize(results)
+
+
+@router.put("/mongodb/bulk", response_model=BulkResult)
+async def bulk_update_inventory_mongo(
+    items: List[mongodb_inventory.InventoryBulkUpdate] = Body(..., max_length=MAX_BULK_ITEMS),
+    mongo: AsyncCollection = Depends(get_async_mongo_inventory_collection),
+    current_user=Depends(get_current_user),
+):
+    results = [None] * len(items)
+    ids = {item.inventory_id: ObjectId(item.inventory_id) for item in items if ObjectId.is_valid(item.inventory_id)}
+    before, versions = {}, {}
+    async for doc in mongo.find(
+        {"_id": {"$in": list(ids.values())}}, {"version": 1, **{field: 1 for field in STATS_FIELDS}}
+    ):
+        before[doc["_id"]] = stats_row(doc)
+        versions[doc["_id"]] = doc.get("version", 1)
+    owners = {object_id: row["user_id"] for object_id, row in before.items()}
+
+    changes, indexes = {}, defaultdict(list)  # object_id -> merged changes / item positions
+    for index, item in enumerate(items):
+        object_id = ids.get(item.inventory_id)
+        status = _ownership_status(owners.get(object_id), current_user)
+        if status:
+            results[index] = BulkItemResult(index=index, status=status, id=item.inventory_id)
+            continue
+        results[index] = BulkItemResult(index=index, status="updated", id=item.inventory_id)
+        item_changes = _changes(item, "inventory_id")
+        if item_changes:
+            changes[object_id] = {**changes.get(object_id, {}), **item_changes}
+            indexes[object_id].append(index)
+    planned = {object_id: stats_row({**before[object_id], **row}) for object_id, row in changes.items()}
+
+    full = await reserve_mongo({object_id: (before[object_id], planned[object_id]) for object_id in changes})
+    if full:
+        _reject_full(results, [index for object_id in full for index in indexes[object_id]])
+        changes = {object_id: row for object_id, row in changes.items() if object_id not in full}
+
+    written = await asyncio.gather(
+        *(mongo_patch(mongo, {"_id": object_id}, row, versions[object_id]) for object_id, row in changes.items()),
+        return_exceptions=True,
+    )
+    after = {}
+    for object_id, doc in zip(changes, written):
+        if isinstance(doc, dict):
+            after[object_id] = stats_row(doc)
+        elif doc is None:
+            _fail(results, indexes[object_id], VERSION_CONFLICT, status="conflict")
+        else:
+            _fail(results, indexes[object_id])
+    await apply_mongo_deltas(stats_deltas((before[object_id], after[object_id]) for object_id in after))
+    # Give back what was reserved for updates that did not go through
+    await adjust_mongo(
+        occupancy_deltas((planned[object_id], before[object_id]) for object_id in changes if object_id not in after),
+        enforce=False,
+    )
+    return _summarize(results)
+
+
+# Bulk delete =================================================================
+# The stats and capacity deltas come from the rows each request actually
+# removed, so overlapping deletes do not subtract the same item twice.
+@router.delete("/mysql/bulk", response_model=BulkResult)
+async def bulk_delete_inventory_sql(
+    inventory_ids: List[int] = Body(..., max_length=MAX_BULK_ITEMS),
+    db: AsyncSession = Depends(get_async_db),
+    current_user=Depends(get_current_user),
+):
+    results = [None] * len(inventory_ids)
+    result = await db.execute(
+        select(InventoryMySQL)
+        .where(InventoryMySQL.inventory_id.in_(list(set(inventory_ids))))
+        .with_for_update()
+    )
+    found = {row.inventory_id: row for row in result.scalars()}
+
+    allowed, pending = {}, []
+    for index, inventory_id in enumerate(inventory_ids):
+        row = found.get(inventory_id)
+        status = _ownership_status(row.user_id if row else None, current_user)
+        if status:
+            results[index] = BulkItemResult(index=index, status=status, id=inventory_id)
+            continue
+        allowed[inventory_id] = row
+        pending.append(index)
+
+    try:
+        if allowed:
+            if outbox_enabled():
+                await record_changes(
+                    db, "inventory", "delete",
+                    [row_to_dict(row) for row in allowed.values() if row.mongo_id is not None],
+                )
+            deleted = await db.execute(
+                delete(InventoryMySQL).where(InventoryMySQL.inventory_id.in_(list(allowed)))
+            )
+            # The rows are locked, so this only trips if the lock was not honoured
+            if deleted.rowcount != len(allowed):
+                raise RuntimeError("Rows changed during bulk delete")
+            await apply_sql_deltas(db, stats_deltas((stats_row(row), None) for row in allowed.values()))
+            await adjust_sql(
+                db, occupancy_deltas((stats_row(row), None) for row in allowed.values()), enforce=False
+            )
+            await db.commit()
+    except Exception:
+        await db.rollback()
+        _fail(results, pending)
+        return _summarize(results)
+
+    for inventory_id in allowed:
+        unindex_inventory(inventory_id)
+    for index in pending:
+        results[index] = BulkItemResult(index=index, status="deleted", id=inventory_ids[index])
+    return _summarize(results)
+
+
+@router.delete("/mongodb/bulk", response_model=BulkResult)
+async def bulk_delete_inventory_mongo(
+    inventory_ids: List[str] = Body(..., max_length=MAX_BULK_ITEMS),
+    mongo: AsyncCollection = Depends(get_async_mongo_inventory_collection),
+    current_user=Depends(get_current_user),
+):
+    # Each document is removed with find_one_and_delete, which returns it only
+    # to the request that deleted it. Ids that come back empty are looked up
+    # once to tell not_found from not_authorized
+    results = [None] * len(inventory_ids)
+    ids = {inventory_id: ObjectId(inventory_id) for inventory_id in inventory_ids if ObjectId.is_valid(inventory_id)}
+    owner = {} if current_user.role == "admin" else {"user_id": current_user.user_id}
+    object_ids = list(set(ids.values()))
+    removed = await asyncio.gather(
+        *(
+            mongo.find_one_and_delete({"_id": object_id, **owner}, projection={field: 1 for field in STATS_FIELDS})
+            for object_id in object_ids
+        ),
+        return_exceptions=True,
+    )
+
+    deleted, failed, missing = {}, set(), []
+    for object_id, doc in zip(object_ids, removed):
+        if isinstance(doc, dict):
+            deleted[object_id] = stats_row(doc)
+        elif doc is None:
+            missing.append(object_id)
+        else:
+            failed.add(object_id)
+    statuses = {object_id: "not_found" for object_id in missing}
+    if missing:
+        async for doc in mongo.find({"_id": {"$in": missing}}, {"_id": 1}):
+            statuses[doc["_id"]] = "not_authorized"
+
+    for index, inventory_id in enumerate(inventory_ids):
+        object_id = ids.get(inventory_id)
+        if object_id in deleted:
+            results[index] = BulkItemResult(index=index, status="deleted", id=inventory_id)
+        elif object_id in failed:
+            _fail(results, [index])
+        else:
+            results[index] = BulkItemResult(
+                index=index, status=statuses.get(object_id, "not_found"), id=inventory_id
+            )
+
+    await apply_mongo_deltas(stats_deltas((row, None) for row in deleted.values()))
+    await adjust_mongo(occupancy_deltas((row, None) for row in deleted.values()), enforce=False)
+    return _summarize(results)
@@ -0,0 +1,226 @@
+import asyncio
+import logging
+
+from bson import ObjectId
+from fastapi import APIRouter, Body, Depends, HTTPException
+from pymongo.asynchronous.collection import AsyncCollection
+from sqlalchemy import case, select, update
+from sqlalchemy.ext.asyncio import AsyncSession
+from typing import Dict, List
+
+from schemas.stock import StockAdjustment, StockDelta, StockLevel
+
+from models.mysql_models import InventoryMySQL
+
+from routers.auth import get_current_user
+from config import get_async_db, get_async_mongo_inventory_collection
+from outbox import outbox_enabled, record_changes, row_to_dict
+from query_budget import count_items, query_budget
+from capacity import adjust_mongo, adjust_sql, capacity_exceeded, occupancy_deltas
+from inventory_stats import apply_mongo_deltas, apply_sql_deltas, stats_deltas, stats_row
+from versioning import find_one_and_bump
+
+# Stock adjustments. Point-of-sale terminals and restocks send a signed delta
+# instead of the new quantity, and the database applies it atomically
+# (quantity = quantity + delta, only while the result stays >= 0), so
+# concurrent sales never overwrite each other and nothing is read first.
+# A basket adjusts several items in one call, all or nothing: when an item is
+# missing, not the caller's or out of stock, no item is changed. Restocks must
+# fit the location (capacity.py), and inventory_stats and the version
+# (versioning.py) move like on any other update.
+#
+# MySQL applies a basket with one UPDATE ... CASE inventory_id in one
+# transaction. MongoDB has no transaction here, so every item is its own
+# conditional $inc (sent concurrently) and the items that went through are
+# taken back when another one fails. Basket budgets grow with the number of
+# items (per_item, see query_budget.py).
+
+router = APIRouter(prefix="/inventory")
+
+logger = logging.getLogger(__name__)
+
+MAX_BASKET_ITEMS = 500
+
+INSUFFICIENT_STOCK = "Insufficient stock"
+
+
+def _merge(adjustments) -> Dict:
+    # The same item twice in a basket adds up; request order is kept
+    deltas = {}
+    for adjustment in adjustments:
+        deltas[adjustment.inventory_id] = deltas.get(adjustment.inventory_id, 0) + adjustment.delta
+    return deltas
+
+
+def _before(row: dict, delta: int) -> dict:
+    return {**row, "quantity": row["quantity"] - delta}
+
+
+def _failure(stored: Dict, deltas: Dict, current_user) -> HTTPException:
+    # Why a basket was not applied. stored maps inventory_id to the
+    # (user_id, quantity) read afterwards
+    def error(status_code, message, ids):
+        if len(deltas) == 1:
+            return HTTPException(status_code=status_code, detail=message)
+        return HTTPException(status_code=status_code, detail=f"{message}: {', '.join(str(i) for i in ids)}")
+
+    missing = [inventory_id for inventory_id in deltas if inventory_id not in stored]
+    if missing:
+        return error(404, "Inventory not found", missing)
+    if not current_user.role == "admin":
+        foreign = [inventory_id for inventory_id in deltas if stored[inventory_id][0] != current_user.user_id]
+        if foreign:
+            return error(401, "Not Authorized", foreign)
+    short = [inventory_id for inventory_id, delta in deltas.items() if stored[inventory_id][1] + delta < 0]
+    # Empty when a concurrent restock came in after the check
+    return error(409, INSUFFICIENT_STOCK, short or list(deltas))
+
+
+# MySQL =======================================================================
+async def _adjust_sql(db: AsyncSession, deltas: Dict[int, int], current_user) -> List[StockLevel]:
+    ids = list(deltas)
+    delta = case(deltas, value=InventoryMySQL.inventory_id)
+    conditions = [InventoryMySQL.inventory_id.in_(ids), InventoryMySQL.quantity + delta >= 0]
+    if not current_user.role == "admin":
+        conditions.append(InventoryMySQL.user_id == current_user.user_id)
+    try:
+        result = await db.execute(
+            update(InventoryMySQL)
+            .where(*conditions)
+            .values(quantity=InventoryMySQL.quantity + delta, version=InventoryMySQL.version + 1)
+            .execution_options(synchronize_session=False)
+        )
+        if result.rowcount < len(ids):
+            await db.rollback()
+            stored = await db.execute(
+                select(InventoryMySQL.inventory_id, InventoryMySQL.user_id, InventoryMySQL.quantity).where(
+                    InventoryMySQL.inventory_id.in_(ids)
+                )
+            )
+            raise _failure({row.inventory_id: (row.user_id, row.quantity) for row in stored}, deltas, current_user)
+
+        # The rows are locked by the UPDATE until commit
+        rows = (await db.execute(select(InventoryMySQL).where(InventoryMySQL.inventory_id.in_(ids)))).scalars().all()
+        changes = [(_before(stats_row(row), deltas[row.inventory_id]), stats_row(row)) for row in rows]
+        if await adjust_sql(db, occupancy_deltas(changes)):
+            raise capacity_exceeded()
+        await apply_sql_deltas(db, stats_deltas(changes))
+        if outbox_enabled():
+            await record_changes(
+                db, "inventory", "upsert", [row_to_dict(row) for row in rows if row.mongo_id is not None]
+            )
+        await db.commit()
+    except HTTPException:
+        await db.rollback()
+        raise
+    except:
+        await db.rollback()
+        raise HTTPException(status_code=400, detail="Invalid Form")
+
+    rows = {row.inventory_id: row for row in rows}
+    return [
+        StockLevel(inventory_id=inventory_id, quantity=rows[inventory_id].quantity, version=rows[inventory_id].version)
+        for inventory_id in ids
+    ]
+
+
+# MongoDB =====================================================================
+async def _take_back(mongo: AsyncCollection, applied: Dict[str, dict], deltas: Dict[str, int]) -> None:
+    # Undoes the quantity and the version bump, so a client holding the old
+    # version gets no spurious 409. A document written again in the meantime
+    # keeps its version and only has the quantity taken back, which counts
+    # as one more change
+    async def undo(inventory_id: str, doc: dict):
+        delta = deltas[inventory_id]
+        result = await mongo.update_one(
+            {"_id": doc["_id"], "version": doc["version"]}, {"$inc": {"quantity": -delta, "version": -1}}
+        )
+        if not result.matched_count:
+            await mongo.update_one({"_id": doc["_id"]}, {"$inc": {"quantity": -delta, "version": 1}})
+
+    results = await asyncio.gather(
+        *(undo(inventory_id, doc) for inventory_id, doc in applied.items()), return_exceptions=True
+    )
+    failed = [inventory_id for inventory_id, result in zip(applied, results) if isinstance(result, BaseException)]
+    if failed:
+        logger.error("Failed to take back stock adjustments for %s", failed)
+
+
+async def _adjust_mongo(mongo: AsyncCollection, deltas: Dict[str, int], current_user) -> List[StockLevel]:
+    ids = {inventory_id: ObjectId(inventory_id) for inventory_id in deltas if ObjectId.is_valid(inventory_id)}
+    owner = {} if current_user.role == "admin" else {"user_id": current_user.user_id}
+
+    async def apply(inventory_id: str):
+        delta = deltas[inventory_id]
+        return await find_one_and_bump(
+            mongo, {"_id": ids[inventory_id], **owner, "quantity": {"$gte": -delta}}, {"$inc": {"quantity": delta}}
+        )
+
+    results = await asyncio.gather(*(apply(inventory_id) for inventory_id in ids), return_exceptions=True)
+    applied = {inventory_id: doc for inventory_id, doc in zip(ids, results) if isinstance(doc, dict)}
+    if len(applied) < len(deltas):
+        await _take_back(mongo, applied, deltas)
+        if any(isinstance(result, BaseException) for result in results):
+            raise HTTPException(status_code=400, detail="Invalid Form")
+        stored = {
+            str(doc["_id"]): (doc["user_id"], doc["quantity"])
+            async for doc in mongo.find({"_id": {"$in": list(ids.values())}}, {"user_id": 1, "quantity": 1})
+        }
+        raise _failure(stored, deltas, current_user)
+
+    changes = [(_before(stats_row(doc), deltas[inventory_id]), stats_row(doc)) for inventory_id, doc in applied.items()]
+    if await adjust_mongo(occupancy_deltas(changes)):
+        await _take_back(mongo, applied, deltas)
+        raise capacity_exceeded()
+    await apply_mongo_deltas(stats_deltas(changes))
+    return [
+        StockLevel(inventory_id=inventory_id, quantity=doc["quantity"], version=doc["version"])
+        for inventory_id, doc in applied.items()
+    ]
+
+
+# Routes ======================================================================
+@router.post("/mysql/adjust", response_model=List[StockLevel[int]])
+@query_budget(mysql=5, per_item={"mysql": 1})
+async def adjust_basket_sql(
+    adjustments: List[StockAdjustment[int]] = Body(..., min_length=1, max_length=MAX_BASKET_ITEMS),
+    db: AsyncSession = Depends(get_async_db),
+    current_user=Depends(get_current_user),
+):
+    deltas = _merge(adjustments)
+    count_items(len(deltas))
+    return await _adjust_sql(db, deltas, current_user)
+
+
+@router.post("/mongodb/adjust", response_model=List[StockLevel[str]])
+@query_budget(mysql=1, mongodb=1, per_item={"mongodb": 4})
+async def adjust_basket_mongo(
+    adjustments: List[StockAdjustment[str]] = Body(..., min_length=1, max_length=MAX_BASKET_ITEMS),
+    mongo: AsyncCollection = Depends(get_async_mongo_inventory_collection),
+    current_user=Depends(get_current_user),
+):
+    deltas = _merge(adjustments)
+    count_items(len(deltas))
+    return await _adjust_mongo(mongo, deltas, current_user)
+
+
+@router.post("/mysql/{inventory_id}/adjust", response_model=StockLevel[int])
+@query_budget(mysql=6)
+async def adjust_stock_sql(
+    inventory_id: int,
+    adjustment: StockDelta,
+    db: AsyncSession = Depends(get_async_db),
+    current_user=Depends(get_current_user),
+):
+    return (await _adjust_sql(db, {inventory_id: adjustment.delta}, current_user))[0]
+
+
+@router.post("/mongodb/{inventory_id}/adjust", response_model=StockLevel[str])
+@query_budget(mysql=1, mongodb=4)
+async def adjust_stock_mongo(
+    inventory_id: str,
+    adjustment: StockDelta,
+    mongo: AsyncCollection = Depends(get_async_mongo_inventory_collection),
+    current_user=Depends(get_current_user),
+):
+    return (await _adjust_mongo(mongo, {inventory_id: adjustment.delta}, current_user))[0]
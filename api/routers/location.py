@@ -1,153 +1,292 @@
+import logging
+
 from bson import ObjectId
-from fastapi import APIRouter, FastAPI, HTTPException, Depends
-from sqlalchemy.orm import Session
+from fastapi import APIRouter, FastAPI, HTTPException, Depends, Request
+from sqlalchemy import delete, select
+from sqlalchemy.ext.asyncio import AsyncSession
 from typing import Dict, List
-from pymongo.collection import Collection
+from pymongo.asynchronous.collection import AsyncCollection
 
 from schemas.mysql import mysql_location
 from schemas.mongodb import mongodb_location
+from schemas.pagination import Page
 
-from models.mysql_models import LocationMySQL, UserMySql
+from models.mysql_models import LocationMySQL
 from models.mongodb_models import LocationMongo
 
 from routers.auth import get_current_user, get_admin_user
-from config import get_db, get_mongo_location_collection
+from principal_cache import Principal
+from config import AsyncSessionLocal, get_async_db, get_async_mongo_collection, get_async_mongo_location_collection
+from outbox import outbox_enabled, record_change, row_to_dict
+from pagination import PageParams, page_params, paginate_mongo, paginate_sql
+from export import export_format, stream_mongo_export, stream_sql_export
+from response_cache import cached_response, location_cache
+from hedging import hedged_read
+from query_budget import query_budget
+from admission import limit_by_ip
+from versioning import find_one_and_bump, mongo_patch, mongo_patch_error, patch_changes, sql_patch, sql_patch_error
 
 router = APIRouter(prefix="/location")
 
+logger = logging.getLogger(__name__)
+
+
+async def get_location_or_none(db: AsyncSession, location_id: int):
+    result = await db.execute(
+        select(LocationMySQL).where(LocationMySQL.location_id == location_id)
+    )
+    return result.scalars().first()
+
+
+# In dual_write mode every location write lands in both stores, matched on
+# the mongo_id: the MySQL routes mirror their change to MongoDB and the
+# MongoDB routes mirror theirs to MySQL, each store bumping its own version.
+# The mirror is written once the first store has committed. A failed create
+# is undone on the first store; a failed mirrored edit or delete is logged
+# and left to reconcile.py. In outbox mode the MySQL routes reach MongoDB
+# through the replicator and the MongoDB write routes are refused, since a
+# change made there would never reach MySQL.
+def _mirrored() -> bool:
+    return not outbox_enabled()
+
+
+def _reject_mongo_write():
+    if outbox_enabled():
+        raise HTTPException(
+            status_code=409,
+            detail="MongoDB location writes are disabled in outbox mode, use /location/mysql",
+        )
+
+
+async def _mirror_to_mongo(mongo_id, changes=None):
+    # changes=None deletes the document
+    if not _mirrored() or mongo_id is None or changes == {}:
+        return
+    mongo = get_async_mongo_location_collection()
+    try:
+        if changes is None:
+            await mongo.delete_one({"_id": ObjectId(mongo_id)})
+        else:
+            await find_one_and_bump(mongo, {"_id": ObjectId(mongo_id)}, {"$set": changes})
+    except Exception:
+        logger.exception("Failed to mirror location %s to MongoDB", mongo_id)
+
+
+async def _mirror_to_sql(db: AsyncSession, mongo_id: str, changes=None):
+    # changes=None deletes the row
+    if not _mirrored() or changes == {}:
+        return
+    try:
+        if changes is None:
+            await db.execute(delete(LocationMySQL).where(LocationMySQL.mongo_id == mongo_id))
+        else:
+            await sql_patch(db, LocationMySQL, [LocationMySQL.mongo_id == mongo_id], changes, None)
+        await db.commit()
+    except Exception:
+        await db.rollback()
+        logger.exception("Failed to mirror location %s to MySQL", mongo_id)
+
 
 # Create new location
-# This creates parallel entities in both Mongo and MySQL
+# This creates parallel entities in both Mongo and MySQL. The Mongo _id is
+# stored on the MySQL row as mongo_id, and the MySQL location_id is stored on
+# the Mongo document. In outbox mode the Mongo copy is left to the replicator.
 @router.post("/")
-def create_location(
+@query_budget(mysql=2, mongodb=1)
+async def create_location(
     location: mongodb_location.LocationCreate,
-    db: Session = Depends(get_db),
-    mongo_collection: Collection = Depends(get_mongo_location_collection),
-    current_user: UserMySql = Depends(get_admin_user),  # Ensure the user is an admin
+    db: AsyncSession = Depends(get_async_db),
+    mongo_collection: AsyncCollection = Depends(get_async_mongo_location_collection),
+    current_user: Principal = Depends(get_admin_user),  # Ensure the user is an admin
 ):
+    mongo_id = ObjectId()
+
     # Insert into MySQL
-    mysql_location = LocationMySQL(**location.dict())
+    mysql_location = LocationMySQL(**location.model_dump(), mongo_id=str(mongo_id))
     db.add(mysql_location)
-    db.commit()
-    db.refresh(mysql_location)
+    await db.flush()
+    if outbox_enabled():
+        record_change(db, "location", "upsert", mysql_location)
+    await db.commit()
+    location_cache.invalidate()
+
+    if outbox_enabled():
+        return {"mysql_id": mysql_location.location_id, "mongodb": "queued"}
 
     # Insert into MongoDB
-    mongo_doc = location.dict()
-    mongo_collection.insert_one(mongo_doc)
+    mongo_doc = {**location.model_dump(), "_id": mongo_id, "location_id": mysql_location.location_id, "used": 0, "version": 1}
+    try:
+        await mongo_collection.insert_one(mongo_doc)
+    except Exception:
+        # Undo the MySQL row so the stores do not diverge
+        try:
+            await db.delete(mysql_location)
+            await db.commit()
+        except Exception:
+            logger.exception("Failed to compensate location create (mongo _id=%s)", mongo_id)
+        location_cache.invalidate()
+        raise HTTPException(status_code=400, detail="Invalid Form")
+    location_cache.invalidate()
 
     return {"mysql_id": mysql_location.location_id, "mongodb": "inserted"}
 
 
-# Get all locations from MongoDB
-@router.get("/mongodb", response_model=List[mongodb_location.LocationRead])
-def get_all_locations_mongo(
-    mongo_collection: Collection = Depends(get_mongo_location_collection),
+# Location reads are public and change rarely, so they are served through
+# location_cache (with ETags) and every write below invalidates it. Being
+# unauthenticated, they are rate limited per client IP (admission.py)
+def _dump(schema, data):
+    return schema.model_validate(data, from_attributes=True).model_dump(mode="json", by_alias=True)
+
+
+# Get all locations from MongoDB, one keyset page at a time
+@router.get("/mongodb", response_model=Page[mongodb_location.LocationRead], dependencies=[Depends(limit_by_ip)])
+@query_budget(mongodb=1)
+async def get_all_locations_mongo(
+    request: Request,
+    page: PageParams = Depends(page_params),
+    mongo_collection: AsyncCollection = Depends(get_async_mongo_location_collection),
+):
+    async def load():
+        return _dump(Page[mongodb_location.LocationRead], await paginate_mongo(mongo_collection, {}, page))
+    return await cached_response(request, location_cache, load)
+
+# Get all locations from MySQL, one keyset page at a time
+@router.get("/mysql", response_model=Page[mysql_location.LocationRead], dependencies=[Depends(limit_by_ip)])
+@query_budget(mysql=1)
+async def get_all_locations_mysql(
+    request: Request,
+    page: PageParams = Depends(page_params),
+    db: AsyncSession = Depends(get_async_db),
 ):
-    locations = mongo_collection.find()  # Find all locations
-    return locations
+    async def load():
+        stmt = select(LocationMySQL)
+        return _dump(Page[mysql_location.LocationRead], await paginate_sql(db, stmt, LocationMySQL.location_id, page))
+    return await cached_response(request, location_cache, load)
+
+# Stream every location as NDJSON or CSV
+# (declared before the /{location_id} routes so "export" is not taken as an id)
+@router.get("/mysql/export", dependencies=[Depends(limit_by_ip)])
+@query_budget(mysql=1)
+async def export_locations_mysql(format: str = Depends(export_format)):
+    stmt = select(LocationMySQL).order_by(LocationMySQL.location_id)
+    return stream_sql_export(stmt, mysql_location.LocationRead, format, "location")
 
-# Get all locations from MySQL
-@router.get("/mysql", response_model=List[mysql_location.LocationRead])
-def get_all_locations_mysql(db: Session = Depends(get_db)):
-    all_locations = db.query(LocationMySQL).all()  # Get all records from LocationMySQL
-    return all_locations  # This will be automatically serialized by Pydantic
+@router.get("/mongodb/export", dependencies=[Depends(limit_by_ip)])
+@query_budget(mongodb=1)
+async def export_locations_mongo(
+    format: str = Depends(export_format),
+    mongo_collection: AsyncCollection = Depends(get_async_mongo_location_collection),
+):
+    return stream_mongo_export(mongo_collection, {}, mongodb_location.LocationRead, format, "location")
 
 
-@router.get("/mongodb/{location_id}", response_model=mongodb_location.LocationRead)
-def get_location_by_ID_mongo(
+@router.get("/mongodb/{location_id}", response_model=mongodb_location.LocationRead, dependencies=[Depends(limit_by_ip)])
+@query_budget(mongodb=1)
+async def get_location_by_ID_mongo(
+    request: Request,
     location_id: str,
-    mongo: Collection = Depends(get_mongo_location_collection)
+    mongo: AsyncCollection = Depends(get_async_mongo_location_collection)
 ):
-    
-    try:
-        obj = mongo.find_one({"_id": ObjectId(location_id)})
-    except:
-        raise HTTPException(status_code=404, detail="Not found")
-    if obj != None:
-        return obj
-    raise HTTPException(status_code=404,detail="Not Found")
+    async def load():
+        try:
+            obj = await mongo.find_one({"_id": ObjectId(location_id)})
+        except:
+            raise HTTPException(status_code=404, detail="Not found")
+        if obj != None:
+            return _dump(mongodb_location.LocationRead, obj)
+        raise HTTPException(status_code=404,detail="Not Found")
+    return await cached_response(request, location_cache, load)
 
 # Get location by ID from MySQL DB
-@router.get("/mysql/{location_id}", response_model=mysql_location.LocationRead)
-def get_location_by_ID_mysql(location_id: int, db: Session = Depends(get_db)):
-    location = db.query(LocationMySQL).filter_by(location_id=location_id).first()
-    if not location:
-        raise HTTPException(
-            status_code=404,
-            detail="Location not found"
-        )
-    
-    return location
+@router.get("/mysql/{location_id}", response_model=mysql_location.LocationRead, dependencies=[Depends(limit_by_ip)])
+@query_budget(mysql=1)
+async def get_location_by_ID_mysql(request: Request, location_id: int, db: AsyncSession = Depends(get_async_db)):
+    async def load():
+        location = await get_location_or_none(db, location_id)
+        if not location:
+            raise HTTPException(
+                status_code=404,
+                detail="Location not found"
+            )
+        return _dump(mysql_location.LocationRead, location)
+    return await cached_response(request, location_cache, load)
 
 
 # Edit a location
+# Location edits only write the fields that were sent, see versioning.py.
+# used is only moved by inventory writes and is not part of LocationUpdate
 @router.put("/mongodb/{location_id}", response_model=mongodb_location.LocationRead)
-def post_location_mongo(
+@router.patch("/mongodb/{location_id}", response_model=mongodb_location.LocationRead)
+@query_budget(mysql=2, mongodb=2)
+async def post_location_mongo(
     location_id: str,
     location_item: mongodb_location.LocationUpdate,
-    mongo: Collection = Depends(get_mongo_location_collection),
+    db: AsyncSession = Depends(get_async_db),
+    mongo: AsyncCollection = Depends(get_async_mongo_location_collection),
     current_user=Depends(get_admin_user)
-):  
-    try :
-        item = mongo.find_one({'_id': ObjectId(location_id)})
-    except:
-        raise HTTPException(status_code=404,detail="Location not found")
-    if not item:
+):
+    _reject_mongo_write()
+    if not ObjectId.is_valid(location_id):
         raise HTTPException(status_code=404,detail="Location not found")
-    if not current_user.role == "admin":
-        raise HTTPException(status_code=401, detail="Not Authorized")
-    
-    for key, value in location_item.model_dump().items():
-        item[key] = value
-    #try:
-
-        mongo.update_one({'_id': ObjectId(location_id)}, {'$set':item})
-    #except :
-    #    raise HTTPException(status_code=400, detail="Invalid Form")
+    changes, version = patch_changes(location_item)
+    try:
+        item = await mongo_patch(mongo, {'_id': ObjectId(location_id)}, changes, version)
+    except:
+        raise HTTPException(status_code=400, detail="Invalid Form")
+    if item is None:
+        raise await mongo_patch_error(mongo, ObjectId(location_id), "Location not found")
+    await _mirror_to_sql(db, location_id, changes)
+    location_cache.invalidate()
     return item
 
 
 @router.put("/mysql/{location_id}", response_model=mysql_location.LocationRead)
-def update_location(
+@router.patch("/mysql/{location_id}", response_model=mysql_location.LocationRead)
+@query_budget(mysql=4, mongodb=2)
+async def update_location(
     location_id: int,
     location_item: mysql_location.LocationUpdate,
-    db: Session = Depends(get_db),
-    current_user: UserMySql = Depends(get_admin_user)
+    db: AsyncSession = Depends(get_async_db),
+    current_user: Principal = Depends(get_admin_user)
 ):
-    location = db.query(LocationMySQL).filter_by(location_id=location_id).first()
-    if not location:
-        raise HTTPException(
-            status_code=404, 
-            detail="Location not found"
-        )
-    if not current_user.role == "admin":
-        raise HTTPException(
-            status_code=401,
-            detail="Not Authorized"
-        )
-    
-    for key, value in location_item.model_dump().items():
-        setattr(location, key, value)
-
+    changes, version = patch_changes(location_item)
     try:
-        db.commit()
-        db.refresh(location)
+        if not await sql_patch(db, LocationMySQL, [LocationMySQL.location_id == location_id], changes, version):
+            raise await sql_patch_error(
+                db, LocationMySQL, LocationMySQL.location_id, location_id, "Location not found"
+            )
+        location = await get_location_or_none(db, location_id)
+        if outbox_enabled():
+            if location.mongo_id is None:
+                location.mongo_id = str(ObjectId())
+                await db.flush()
+            record_change(db, "location", "upsert", location)
+        await db.commit()
+    except HTTPException:
+        await db.rollback()
+        raise
     except:
+        await db.rollback()
         raise HTTPException(
             status_code=400,
             detail="Invalid Form"
         )
+    await _mirror_to_mongo(location.mongo_id, changes)
+    location_cache.invalidate()
     return location
 
 # # Delete a location
 @router.delete("/mongodb/{location_id}", response_model=Dict[str,str])
-def delete_location_mongo(
+@query_budget(mysql=2, mongodb=2)
+async def delete_location_mongo(
     location_id: str,
-    mongo: Collection = Depends(get_mongo_location_collection),
+    db: AsyncSession = Depends(get_async_db),
+    mongo: AsyncCollection = Depends(get_async_mongo_location_collection),
     current_user=Depends(get_admin_user)
-):  
+):
+    _reject_mongo_write()
     try :
-        item = mongo.find_one({'_id': ObjectId(location_id)})
+        item = await mongo.find_one({'_id': ObjectId(location_id)})
     except:
         raise HTTPException(status_code=404,detail="Location not found")
     if not item:
@@ -156,18 +295,21 @@ def delete_location_mongo(
         raise HTTPException(status_code=401, detail="Not Authorized")
 
     try:
-        mongo.delete_one({'_id': ObjectId(location_id)})
+        await mongo.delete_one({'_id': ObjectId(location_id)})
     except :
         raise HTTPException(status_code=400, detail="Invalid Form")
+    await _mirror_to_sql(db, location_id)
+    location_cache.invalidate()
     return {"message":"deleted successfully"}
 
 @router.delete("/mysql/{location_id}", response_model=Dict[str, str])
-def delete_location(
+@query_budget(mysql=3, mongodb=1)
+async def delete_location(
     location_id: int,
-    db: Session = Depends(get_db),
-    current_user: UserMySql = Depends(get_admin_user)
+    db: AsyncSession = Depends(get_async_db),
+    current_user: Principal = Depends(get_admin_user)
 ):
-    location = db.query(LocationMySQL).filter_by(location_id=location_id).first()
+    location = await get_location_or_none(db, location_id)
     if not location:
         raise HTTPException(
             status_code=404,
@@ -176,16 +318,51 @@ def delete_location(
 
     if not current_user.role == "admin":
         raise HTTPException(
-            status_code=401, 
+            status_code=401,
             detail="Not Authorized"
         )
-     
+
     try:
-        db.delete(location)
-        db.commit()
-    except:
+        if outbox_enabled() and location.mongo_id is not None:
+            record_change(db, "location", "delete", location)
+        await db.delete(location)
+        await db.commit()
+    except HTTPException:
+        await db.rollback()
+        raise
+    except Exception:
+        await db.rollback()
         raise HTTPException(
-            status_code=400, 
+            status_code=400,
             detail="Invalid form"
         )
-    return {"message": "Location sucessfully deleted"}
\ No newline at end of file
+    await _mirror_to_mongo(location.mongo_id)
+    location_cache.invalidate()
+    return {"message": "Location sucessfully deleted"}
+
+
+# Read a location from whichever store answers first, by its mongo_id (the
+# id both stores share), see hedging.py. Cached like the other location
+# reads; the response uses the MongoDB shape.
+# Declared last so /location/mysql and /location/mongodb keep their routes
+@router.get("/{mongo_id}", response_model=mongodb_location.LocationRead, dependencies=[Depends(limit_by_ip)])
+@query_budget(mysql=1, mongodb=1)
+async def get_location_hedged(request: Request, mongo_id: str):
+    if not ObjectId.is_valid(mongo_id):
+        raise HTTPException(status_code=404, detail="Location not found")
+
+    async def from_mysql():
+        async with AsyncSessionLocal() as db:
+            result = await db.execute(select(LocationMySQL).where(LocationMySQL.mongo_id == mongo_id))
+            location = result.scalars().first()
+        return None if location is None else {**row_to_dict(location), "_id": mongo_id}
+
+    async def from_mongodb():
+        return await get_async_mongo_collection("location").find_one({"_id": ObjectId(mongo_id)})
+
+    async def load():
+        _, location = await hedged_read({"mysql": from_mysql, "mongodb": from_mongodb})
+        if location is None:
+            raise HTTPException(status_code=404, detail="Location not found")
+        return _dump(mongodb_location.LocationRead, location)
+    return await cached_response(request, location_cache, load)
@@ -0,0 +1,20 @@
+from pydantic import BaseModel
+from typing import List, Optional, Union
+
+# Pydantic schemas for the per-item outcome of bulk endpoints, shared by both backends
+
+
+class BulkItemResult(BaseModel):
+    index: int  # position of the item in the request
+    # created / updated / deleted / not_found / not_authorized / invalid /
+    # conflict / error
+    status: str
+    id: Optional[Union[int, str]] = None
+    mongo_id: Optional[str] = None  # set for created items
+    detail: Optional[str] = None
+
+
+class BulkResult(BaseModel):
+    succeeded: int
+    failed: int
+    results: List[BulkItemResult]
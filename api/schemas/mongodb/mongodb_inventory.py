@@ -58,6 +58,7 @@ class InventoryRead(BaseModel):
     tinted: bool
     polarized: bool
     anti_glare: bool
+    version: int = 1
 
     @field_validator('id', mode='before')
     def validate_id(cls, v):
@@ -85,7 +86,13 @@ class InventoryUpdate(BaseModel):
     tinted: Optional[bool] = None
     polarized: Optional[bool] = None
     anti_glare: Optional[bool] = None
+    # Only write if the stored version still matches, see versioning.py
+    version: Optional[int] = Field(None, ge=1)
 
     class Config:
         arbitrary_types_allowed = True
         json_encoders = {ObjectId: str}
+
+
+class InventoryBulkUpdate(InventoryUpdate):
+    inventory_id: str
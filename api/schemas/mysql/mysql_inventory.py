@@ -29,6 +29,7 @@ class InventoryRead(BaseModel):
     tinted: bool
     polarized: bool
     anti_glare: bool
+    version: int = 1
 
     # Makes fastAPI auto-convert sqlalchemy models to schemas
     class Config:
@@ -46,3 +47,9 @@ class InventoryUpdate(BaseModel):
     tinted: Optional[bool] = None
     polarized: Optional[bool] = None
     anti_glare: Optional[bool] = None
+    # Only write if the stored version still matches, see versioning.py
+    version: Optional[int] = Field(None, ge=1)
+
+
+class InventoryBulkUpdate(InventoryUpdate):
+    inventory_id: int
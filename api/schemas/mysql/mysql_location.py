@@ -14,6 +14,7 @@ class LocationRead(BaseModel):
     state: str
     zip_code: int
     capacity: int
+    version: int = 1
 
     class Config:
         from_attributes = True
@@ -25,3 +26,5 @@ class LocationUpdate(BaseModel):
     state: Optional[str] = Field(None, min_length=2, max_length=2)
     zip_code: Optional[int] = Field(None, ge=10000, le=99999)
     capacity: Optional[int] = Field(None, ge=0)
+    # Only write if the stored version still matches, see versioning.py
+    version: Optional[int] = Field(None, ge=1)
@@ -1,4 +1,5 @@
 from pydantic import BaseModel, EmailStr, Field, field_validator
+from typing import Literal
 import re
 
 
@@ -32,6 +33,10 @@ class UserLogin(BaseModel):
     password: str
 
 
+class UserRoleUpdate(BaseModel):
+    role: Literal["user", "admin"]
+
+
 class UserRead(BaseModel):
     user_id: int
     username: str
@@ -0,0 +1,12 @@
+from pydantic import BaseModel
+from typing import Generic, List, Optional, TypeVar
+
+# Pydantic schema for keyset-paginated list responses, shared by both backends
+
+T = TypeVar("T")
+
+
+class Page(BaseModel, Generic[T]):
+    items: List[T]
+    # Pass back as ?cursor= to get the next page, None on the last page
+    next_cursor: Optional[str] = None
@@ -0,0 +1,24 @@
+from pydantic import BaseModel
+from typing import Dict, Generic, List, Optional, TypeVar
+
+# Pydantic schema for faceted search responses, shared by both backends
+
+T = TypeVar("T")
+
+
+class SearchResult(BaseModel, Generic[T]):
+    items: List[T]
+    total: int  # number of matches, items holds at most `limit` of them
+    # Per boolean attribute: {"true": n, "false": m} over all matches
+    facets: Dict[str, Dict[str, int]]
+
+
+class TextSearchHit(BaseModel, Generic[T]):
+    score: float
+    item: T
+
+
+class TextSearchResult(BaseModel, Generic[T]):
+    hits: List[TextSearchHit[T]]  # best match first
+    page: int
+    next_page: Optional[int] = None
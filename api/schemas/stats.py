@@ -0,0 +1,13 @@
+from pydantic import BaseModel
+from typing import Optional
+
+# Pydantic schema for the inventory stats endpoints, shared by both backends
+
+
+class InventoryStats(BaseModel):
+    # Exactly one of location_id/user_id is set, depending on group_by
+    location_id: Optional[int] = None
+    user_id: Optional[int] = None
+    sku_count: int
+    total_units: int
+    total_value: float  # sum of quantity * price
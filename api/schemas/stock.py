@@ -0,0 +1,21 @@
+from pydantic import BaseModel
+from typing import Generic, TypeVar
+
+# Pydantic schemas for the stock adjustment endpoints, shared by both backends
+
+T = TypeVar("T")
+
+
+class StockDelta(BaseModel):
+    # Units to add (restock, return) or take out (sale), negative to take out
+    delta: int
+
+
+class StockAdjustment(StockDelta, Generic[T]):
+    inventory_id: T
+
+
+class StockLevel(BaseModel, Generic[T]):
+    inventory_id: T
+    quantity: int
+    version: int
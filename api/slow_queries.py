@@ -0,0 +1,136 @@
+import asyncio
+import contextvars
+import json
+import logging
+import threading
+from collections import deque
+from datetime import datetime, timezone
+from typing import List, Optional
+
+from bson import json_util
+
+from config import (
+    SLOW_QUERY_EXPLAIN, SLOW_QUERY_LOG_FILE, SLOW_QUERY_LOG_SIZE, SLOW_QUERY_THRESHOLD,
+    async_engine, async_mongo_db,
+)
+from metrics import current_request, query_observers
+
+# Slow-query log. Every SQL statement and MongoDB command slower than
+# SLOW_QUERY_THRESHOLD is kept in a ring buffer (GET /internal/slow-queries)
+# with the route and user that issued it, its SQL text or command document,
+# and the plan from EXPLAIN / explain(). The plan is fetched afterwards on a
+# separate connection, outside the request, and at most MAX_PENDING_EXPLAINS
+# at a time so a slow database is not hit with a burst of explains. With
+# SLOW_QUERY_LOG_FILE set, finished records are appended there as NDJSON.
+
+logger = logging.getLogger(__name__)
+
+MAX_PENDING_EXPLAINS = 4
+MAX_QUERY_CHARS = 10000
+
+# Only these can be explained without side effects
+EXPLAINABLE_SQL = {"SELECT", "UPDATE", "DELETE", "WITH"}
+EXPLAINABLE_MONGO = {"find", "aggregate", "count", "distinct", "update", "delete", "findAndModify"}
+# Session and transport fields pymongo adds to every command
+MONGO_COMMAND_NOISE = {
+    "lsid", "$db", "$clusterTime", "txnNumber", "autocommit", "startTransaction",
+    "$readPreference", "readConcern", "writeConcern",
+}
+
+slow_queries = deque(maxlen=SLOW_QUERY_LOG_SIZE)
+_pending = set()
+_file_lock = threading.Lock()
+
+
+def _json_safe(value):
+    # BSON types, datetimes and Decimals as relaxed extended JSON; huge
+    # documents (bulk inserts) are cut to a string
+    text = json_util.dumps(value)
+    if len(text) > MAX_QUERY_CHARS:
+        return text[:MAX_QUERY_CHARS] + "..."
+    return json.loads(text)
+
+
+def _clean_command(command: dict) -> dict:
+    return {key: value for key, value in command.items() if key not in MONGO_COMMAND_NOISE}
+
+
+def observe(backend: str, operation: str, seconds: float, query: Optional[dict]) -> None:
+    if seconds < SLOW_QUERY_THRESHOLD or query is None or operation in ("EXPLAIN", "explain"):
+        return
+    request = current_request.get()
+    record = {
+        "time": datetime.now(timezone.utc).isoformat(),
+        "backend": backend,
+        "operation": operation,
+        "duration_ms": round(seconds * 1000, 3),
+        "route": request.route if request is not None else None,
+        "user": request.user if request is not None else None,
+        "explain": None,
+    }
+    if "statement" in query:
+        record["query"] = query["statement"]
+        record["parameters"] = _json_safe(query["parameters"])
+    else:
+        query = {"command": _clean_command(query["command"])}
+        record["query"] = _json_safe(query["command"])
+    slow_queries.append(record)
+
+    explainable = operation in (EXPLAINABLE_SQL if backend == "mysql" else EXPLAINABLE_MONGO)
+    if not (SLOW_QUERY_EXPLAIN and explainable and len(_pending) < MAX_PENDING_EXPLAINS):
+        _write(record)
+        return
+    try:
+        asyncio.get_running_loop()
+    except RuntimeError:
+        # Sync engine/client outside the event loop (scripts)
+        _write(record)
+        return
+    # A fresh context, so the explain is not counted against the request
+    task = asyncio.create_task(_explain(record, query), context=contextvars.Context())
+    _pending.add(task)
+    task.add_done_callback(_pending.discard)
+
+
+query_observers.append(observe)
+
+
+# Explain =====================================================================
+async def _explain_sql(statement: str, parameters) -> List[dict]:
+    prefix = "EXPLAIN QUERY PLAN " if async_engine.dialect.name == "sqlite" else "EXPLAIN "
+    async with async_engine.connect() as conn:
+        result = await conn.exec_driver_sql(prefix + statement, parameters or None)
+        return [dict(row) for row in result.mappings()]
+
+
+async def _explain_mongo(command: dict) -> dict:
+    return await async_mongo_db.command({"explain": command, "verbosity": "queryPlanner"})
+
+
+async def _explain(record: dict, query: dict) -> None:
+    try:
+        if "statement" in query:
+            plan = await _explain_sql(query["statement"], query["parameters"])
+        else:
+            plan = await _explain_mongo(query["command"])
+        record["explain"] = _json_safe(plan)
+    except Exception as exc:
+        record["explain"] = {"error": str(exc)}
+    _write(record)
+
+
+# NDJSON file =================================================================
+def _write(record: dict) -> None:
+    if not SLOW_QUERY_LOG_FILE:
+        return
+    try:
+        with _file_lock, open(SLOW_QUERY_LOG_FILE, "a", encoding="utf-8") as log_file:
+            log_file.write(json.dumps(record, default=str) + "\n")
+    except OSError:
+        logger.exception("Could not write to the slow-query log")
+
+
+def recent(limit: int, backend: Optional[str] = None) -> List[dict]:
+    # Newest first
+    records = [record for record in reversed(slow_queries) if backend in (None, record["backend"])]
+    return records[:limit]
@@ -0,0 +1,139 @@
+import os
+import sys
+import tempfile
+
+import pytest
+
+# The app reads its settings at import, so the environment is set before
+# anything from it is imported: a scratch SQLite file for the async engine,
+# the in-memory Mongo double for MongoDB, dual writes, cheap bcrypt and no
+# admission control. Each test gets empty stores (see the app fixture).
+#
+# Run from api/ with the dev requirements installed:
+#
+#   python -m pytest tests
+
+API_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+WORKDIR = tempfile.mkdtemp(prefix="glassview-test-")
+
+os.environ.update({
+    "MYSQL_ASYNC_DATABASE_URL": f"sqlite+aiosqlite:///{WORKDIR}/test.db",
+    "MYSQL_DATABASE_URL": f"sqlite:///{WORKDIR}/test.db",
+    "MONGO_DB_NAME": "glassview-test",
+    "REPLICATION_MODE": "dual_write",
+    "OUTBOX_REPLICATOR_ENABLED": "0",
+    "BCRYPT_ROUNDS": "4",
+    "SLOW_QUERY_EXPLAIN": "0",
+    "RATE_LIMIT_USER_RATE": "0",
+    "RATE_LIMIT_IP_RATE": "0",
+    "SHED_POOL_WAIT": "0",
+    "SHED_THREADPOOL_QUEUE": "0",
+})
+sys.path.insert(0, API_DIR)
+
+import httpx  # noqa: E402
+from sqlalchemy import insert, select  # noqa: E402
+
+import config  # noqa: E402
+from mongo_double import InMemoryMongoDatabase  # noqa: E402
+
+config.async_mongo_db = InMemoryMongoDatabase("glassview-test")
+
+import main  # noqa: E402
+from hashing import hash_password  # noqa: E402
+from models.mysql_models import Base, InventoryMySQL, LocationMySQL, UserMySql  # noqa: E402
+from principal_cache import principal_cache  # noqa: E402
+from response_cache import location_cache  # noqa: E402
+from routers.auth import create_access_token  # noqa: E402
+
+PASSWORD = "Test-pass-1"
+
+
+def item_body(location_id: int, **fields) -> dict:
+    return {
+        "name": "black aviator", "location_id": location_id, "quantity": 5,
+        "description": "polarized metal frame", "price": 20.0, "width": 140.0,
+        "prescription_avail": True, "tinted": False, "polarized": True, "anti_glare": False,
+        **fields,
+    }
+
+
+def location_body(**fields) -> dict:
+    return {"name": "Store", "address": "1 Main St", "state": "CA", "zip_code": 92831, "capacity": 1000, **fields}
+
+
+@pytest.fixture
+def anyio_backend():
+    return "asyncio"
+
+
+@pytest.fixture
+async def app():
+    # Empty stores for every test
+    async with config.async_engine.begin() as conn:
+        await conn.run_sync(Base.metadata.drop_all)
+    config.async_mongo_db = InMemoryMongoDatabase("glassview-test")
+    principal_cache.clear()
+    location_cache.invalidate()
+    async with main.lifespan(main.app):
+        yield main.app
+
+
+@pytest.fixture
+async def client(app):
+    transport = httpx.ASGITransport(app=app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://test") as client:
+        yield client
+
+
+@pytest.fixture
+async def users(app) -> dict:
+    # username -> {"user_id", "headers"} for an admin and two users
+    hashed = await hash_password(PASSWORD)
+    roles = {"admin": "admin", "alice": "user", "bob": "user"}
+    async with config.AsyncSessionLocal() as db:
+        await db.execute(insert(UserMySql), [
+            {"username": name, "email": f"{name}@example.com", "hashed_password": hashed, "role": role}
+            for name, role in roles.items()
+        ])
+        await db.commit()
+        ids = dict((await db.execute(select(UserMySql.username, UserMySql.user_id))).all())
+    return {
+        name: {"user_id": ids[name], "headers": {"Authorization": f"Bearer {create_access_token({'sub': name})}"}}
+        for name in roles
+    }
+
+
+@pytest.fixture
+def make_location(client, users):
+    # Creates a location through the API; returns (location_id, mongo_id)
+    async def make(**fields):
+        response = await client.post("/location/", json=location_body(**fields), headers=users["admin"]["headers"])
+        assert response.status_code == 200, response.text
+        location_id = response.json()["mysql_id"]
+        async with config.AsyncSessionLocal() as db:
+            mongo_id = await db.scalar(select(LocationMySQL.mongo_id).where(LocationMySQL.location_id == location_id))
+        return location_id, mongo_id
+
+    return make
+
+
+@pytest.fixture
+def make_item(client, users):
+    # Creates an item through POST /inventory/ as user; returns (inventory_id, mongo_id).
+    # The response carries neither id, so they are read back from MySQL
+    async def make(location_id: int, user: str = "alice", **fields):
+        response = await client.post("/inventory/", json=item_body(location_id, **fields), headers=users[user]["headers"])
+        assert response.status_code == 200, response.text
+        async with config.AsyncSessionLocal() as db:
+            row = (await db.execute(
+                select(InventoryMySQL.inventory_id, InventoryMySQL.mongo_id)
+                .order_by(InventoryMySQL.inventory_id.desc()).limit(1)
+            )).one()
+        return row.inventory_id, row.mongo_id
+
+    return make
+
+
+def mongo(name: str):
+    return config.get_async_mongo_collection(name)
@@ -0,0 +1,38 @@
+import pytest
+
+from conftest import PASSWORD
+
+pytestmark = pytest.mark.anyio
+
+
+async def test_register_login_me(client):
+    body = {"username": "carol", "email": "carol@example.com", "password": PASSWORD}
+    response = await client.post("/auth/register", json=body)
+    assert response.status_code == 200, response.text
+    assert (await client.post("/auth/register", json=body)).status_code == 400
+
+    response = await client.post("/auth/login", data={"username": "carol", "password": PASSWORD})
+    assert response.status_code == 200
+    token = response.json()["access_token"]
+    response = await client.get("/auth/me", headers={"Authorization": f"Bearer {token}"})
+    assert response.status_code == 200
+    assert response.json()["username"] == "carol"
+
+
+async def test_bad_password_and_token(client, users):
+    response = await client.post("/auth/login", data={"username": "alice", "password": "Wrong-pass-1"})
+    assert response.status_code == 401
+    response = await client.get("/auth/me", headers={"Authorization": "Bearer not-a-token"})
+    assert response.status_code == 401
+
+
+async def test_role_change_takes_effect(client, users):
+    alice = users["alice"]
+    assert (await client.get("/internal/pools", headers=alice["headers"])).status_code == 403
+
+    response = await client.put(
+        f"/auth/users/{alice['user_id']}/role", json={"role": "admin"}, headers=users["admin"]["headers"]
+    )
+    assert response.status_code == 200
+    # The cached principal was dropped, so the new role applies straight away
+    assert (await client.get("/internal/pools", headers=alice["headers"])).status_code == 200
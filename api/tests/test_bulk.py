@@ -0,0 +1,98 @@
+import pytest
+from bson import ObjectId
+
+from conftest import mongo
+
+pytestmark = pytest.mark.anyio
+
+
+async def stats(client, backend, headers):
+    response = await client.get(f"/inventory/{backend}/stats", headers=headers)
+    assert response.status_code == 200
+    return response.json()
+
+
+async def test_bulk_update_bumps_version_and_stats(client, users, make_location, make_item):
+    location_id, _ = await make_location()
+    first, first_mongo = await make_item(location_id)
+    second, second_mongo = await make_item(location_id)
+    headers = users["alice"]["headers"]
+
+    for backend, keys in (("mysql", (first, second)), ("mongodb", (first_mongo, second_mongo))):
+        body = [
+            {"inventory_id": keys[0], "quantity": 7},
+            {"inventory_id": keys[0], "name": "gold wayfarer"},
+            {"inventory_id": keys[1], "quantity": 1},
+        ]
+        response = await client.put(f"/inventory/{backend}/bulk", json=body, headers=headers)
+        assert response.status_code == 200
+        assert response.json()["succeeded"] == 3
+
+        item = (await client.get(f"/inventory/{backend}/{keys[0]}", headers=headers)).json()
+        assert (item["quantity"], item["name"], item["version"]) == (7, "gold wayfarer", 2)
+        [totals] = await stats(client, backend, headers)
+        assert totals["total_units"] == 8
+
+
+async def test_bulk_update_reports_conflicts(client, users, make_location, make_item, monkeypatch):
+    location_id, _ = await make_location()
+    _, mongo_id = await make_item(location_id)
+    headers = users["alice"]["headers"]
+    collection = mongo("inventory")
+    find_one_and_update = collection.find_one_and_update
+
+    async def concurrent_write(*args, **kwargs):
+        # Someone else updates the document between the read and the write
+        await collection.update_one({"_id": ObjectId(mongo_id)}, {"$set": {"quantity": 9, "version": 2}})
+        return await find_one_and_update(*args, **kwargs)
+
+    monkeypatch.setattr(collection, "find_one_and_update", concurrent_write)
+    body = [{"inventory_id": mongo_id, "quantity": 1}]
+    response = await client.put("/inventory/mongodb/bulk", json=body, headers=headers)
+    assert response.json()["results"][0]["status"] == "conflict"
+
+    doc = await collection.find_one({"_id": ObjectId(mongo_id)})
+    assert (doc["quantity"], doc["version"]) == (9, 2)
+    # The reservation for the lost update was given back
+    location = await mongo("location").find_one({"location_id": location_id})
+    assert location["used"] == 5
+
+
+async def test_bulk_update_checks_owner(client, users, make_location, make_item):
+    location_id, _ = await make_location()
+    inventory_id, _ = await make_item(location_id)
+
+    body = [{"inventory_id": inventory_id, "quantity": 1}, {"inventory_id": 999, "quantity": 1}]
+    response = await client.put("/inventory/mysql/bulk", json=body, headers=users["bob"]["headers"])
+    assert [result["status"] for result in response.json()["results"]] == ["not_authorized", "not_found"]
+
+
+async def test_overlapping_bulk_deletes_count_once(client, users, make_location, make_item):
+    location_id, _ = await make_location()
+    first, first_mongo = await make_item(location_id)
+    second, second_mongo = await make_item(location_id)
+    await make_item(location_id)
+    headers = users["alice"]["headers"]
+
+    for backend, keys in (("mysql", (first, second)), ("mongodb", (first_mongo, second_mongo))):
+        response = await client.request("DELETE", f"/inventory/{backend}/bulk", json=list(keys), headers=headers)
+        assert response.json()["succeeded"] == 2
+        # Already gone: reported and not subtracted again
+        response = await client.request("DELETE", f"/inventory/{backend}/bulk", json=[keys[0]], headers=headers)
+        assert response.json()["results"][0]["status"] == "not_found"
+        [totals] = await stats(client, backend, headers)
+        assert (totals["sku_count"], totals["total_units"]) == (1, 5)
+
+    location = await mongo("location").find_one({"location_id": location_id})
+    assert location["used"] == 5
+
+
+async def test_bulk_delete_checks_owner(client, users, make_location, make_item):
+    location_id, _ = await make_location()
+    _, mongo_id = await make_item(location_id)
+
+    body = [mongo_id, str(ObjectId()), "not-an-id"]
+    response = await client.request("DELETE", "/inventory/mongodb/bulk", json=body, headers=users["bob"]["headers"])
+    statuses = [result["status"] for result in response.json()["results"]]
+    assert statuses == ["not_authorized", "not_found", "not_found"]
+    assert await mongo("inventory").find_one({"_id": ObjectId(mongo_id)})
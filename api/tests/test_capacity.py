@@ -0,0 +1,80 @@
+import pytest
+from bson import ObjectId
+
+import config
+import routers.inventory_bulk
+from capacity import occupancy_deltas, rebuild_mongo
+from conftest import item_body, mongo
+from models.mysql_models import LocationMySQL
+
+pytestmark = pytest.mark.anyio
+
+
+async def used(location_id, mongo_id):
+    # (MySQL, MongoDB) used counters of a location
+    async with config.AsyncSessionLocal() as db:
+        location = await db.get(LocationMySQL, location_id)
+    doc = await mongo("location").find_one({"_id": ObjectId(mongo_id)})
+    return location.used, doc["used"]
+
+
+def test_rows_without_a_location_occupy_nothing():
+    before = {"location_id": None, "quantity": 3}
+    after = {"location_id": 2, "quantity": 5}
+    assert occupancy_deltas([(before, after)]) == {2: 5}
+    assert occupancy_deltas([(after, before)]) == {2: -5}
+
+
+async def test_full_locations_reject_items(client, users, make_location):
+    small, small_mongo = await make_location(capacity=12)
+    large, large_mongo = await make_location()
+    body = [item_body(small, quantity=5) for _ in range(3)] + [item_body(large, quantity=5)]
+    response = await client.post("/inventory/bulk", json=body, headers=users["alice"]["headers"])
+    statuses = [result["status"] for result in response.json()["results"]]
+    assert statuses == ["invalid", "invalid", "invalid", "created"]
+    assert await used(small, small_mongo) == (0, 0)
+    assert await used(large, large_mongo) == (5, 5)
+
+
+async def test_failed_bulk_create_gives_room_back(client, users, make_location, monkeypatch):
+    location_id, mongo_id = await make_location()
+
+    async def fail(*args, **kwargs):
+        raise RuntimeError("lost connection")
+
+    # Both stores fail to write
+    monkeypatch.setattr(routers.inventory_bulk, "apply_sql_deltas", fail)
+    monkeypatch.setattr(mongo("inventory"), "insert_many", fail)
+    body = [item_body(location_id) for _ in range(2)]
+    response = await client.post("/inventory/bulk", json=body, headers=users["alice"]["headers"])
+    assert response.json()["failed"] == 2
+    # The MySQL reservation goes with the rolled back transaction (on MySQL;
+    # the sqlite3 driver commits the savepoint), MongoDB's is given back
+    assert (await used(location_id, mongo_id))[1] == 0
+
+
+async def test_repeated_deletes_free_room_once(client, users, make_location, make_item):
+    location_id, location_mongo_id = await make_location()
+    inventory_id, mongo_id = await make_item(location_id)
+    await make_item(location_id)
+    headers = users["alice"]["headers"]
+
+    for path in (f"/inventory/mysql/{inventory_id}", f"/inventory/mongodb/{mongo_id}"):
+        assert (await client.delete(path, headers=headers)).status_code == 200
+        assert (await client.delete(path, headers=headers)).status_code == 404
+    assert await used(location_id, location_mongo_id) == (5, 5)
+
+
+async def test_rebuild_backfills_locations_created_before_capacity(client, users, make_location, make_item):
+    location_id, location_mongo_id = await make_location(capacity=12)
+    _, mongo_id = await make_item(location_id)
+    # What the original create_location wrote to MongoDB
+    await mongo("location").update_one(
+        {"_id": ObjectId(location_mongo_id)}, {"$unset": {"location_id": "", "used": "", "version": ""}}
+    )
+
+    await rebuild_mongo()
+    doc = await mongo("location").find_one({"_id": ObjectId(location_mongo_id)})
+    assert (doc["location_id"], doc["used"], doc["version"]) == (location_id, 5, 1)
+    response = await client.patch(f"/inventory/mongodb/{mongo_id}", json={"quantity": 13}, headers=users["alice"]["headers"])
+    assert response.status_code == 409
@@ -0,0 +1,117 @@
+import pytest
+from bson import ObjectId
+
+import routers.inventory
+from conftest import item_body, mongo
+
+pytestmark = pytest.mark.anyio
+
+
+async def test_create_writes_both_stores(client, users, make_location, make_item):
+    location_id, _ = await make_location()
+    inventory_id, mongo_id = await make_item(location_id)
+    headers = users["alice"]["headers"]
+
+    response = await client.get(f"/inventory/mysql/{inventory_id}", headers=headers)
+    assert response.status_code == 200
+    assert response.json()["name"] == "black aviator"
+    response = await client.get(f"/inventory/mongodb/{mongo_id}", headers=headers)
+    assert response.status_code == 200
+    assert response.json()["_id"] == mongo_id
+    doc = await mongo("inventory").find_one({"_id": ObjectId(mongo_id)})
+    assert doc["user_id"] == users["alice"]["user_id"]
+
+
+async def test_create_needs_login(client, make_location):
+    location_id, _ = await make_location()
+    response = await client.post("/inventory/", json=item_body(location_id))
+    assert response.status_code == 401
+
+
+async def test_items_are_private_to_their_owner(client, users, make_location, make_item):
+    location_id, _ = await make_location()
+    inventory_id, mongo_id = await make_item(location_id)
+
+    for path in (f"/inventory/mysql/{inventory_id}", f"/inventory/mongodb/{mongo_id}"):
+        assert (await client.get(path, headers=users["bob"]["headers"])).status_code == 404
+        assert (await client.get(path, headers=users["admin"]["headers"])).status_code == 200
+    response = await client.delete(f"/inventory/mysql/{inventory_id}", headers=users["bob"]["headers"])
+    assert response.status_code == 401
+
+
+async def test_list_pages(client, users, make_location, make_item):
+    location_id, _ = await make_location()
+    for _ in range(3):
+        await make_item(location_id)
+    await make_item(location_id, user="bob")
+    headers = users["alice"]["headers"]
+
+    for backend in ("mysql", "mongodb"):
+        first = (await client.get(f"/inventory/{backend}?limit=2", headers=headers)).json()
+        assert len(first["items"]) == 2 and first["next_cursor"]
+        rest = (await client.get(f"/inventory/{backend}?limit=2&cursor={first['next_cursor']}", headers=headers)).json()
+        assert len(rest["items"]) == 1 and rest["next_cursor"] is None
+
+
+async def test_update_and_delete(client, users, make_location, make_item):
+    location_id, _ = await make_location()
+    inventory_id, mongo_id = await make_item(location_id)
+    headers = users["alice"]["headers"]
+
+    for backend, key in (("mysql", inventory_id), ("mongodb", mongo_id)):
+        response = await client.put(f"/inventory/{backend}/{key}", json={"name": "gold wayfarer"}, headers=headers)
+        assert response.status_code == 200, response.text
+        assert response.json()["name"] == "gold wayfarer"
+
+        response = await client.delete(f"/inventory/{backend}/{key}", headers=headers)
+        assert response.status_code == 200
+        assert (await client.get(f"/inventory/{backend}/{key}", headers=headers)).status_code == 404
+
+
+async def test_failed_delete_is_rolled_back(client, users, make_location, make_item, monkeypatch):
+    location_id, _ = await make_location()
+    inventory_id, _ = await make_item(location_id)
+    headers = users["alice"]["headers"]
+    before = (await client.get("/inventory/mysql/stats", headers=headers)).json()
+
+    async def fail(*args, **kwargs):
+        raise RuntimeError("lost connection")
+
+    monkeypatch.setattr(routers.inventory, "adjust_sql", fail)
+    response = await client.delete(f"/inventory/mysql/{inventory_id}", headers=headers)
+    assert response.status_code == 400
+    # The stats update that ran before the failure was not committed later
+    assert (await client.get("/inventory/mysql/stats", headers=headers)).json() == before
+    assert (await client.get(f"/inventory/mysql/{inventory_id}", headers=headers)).status_code == 200
+
+
+async def test_failed_basket_keeps_versions(client, users, make_location, make_item):
+    location_id, _ = await make_location()
+    _, sold = await make_item(location_id, quantity=5)
+    _, short = await make_item(location_id, quantity=1)
+    headers = users["alice"]["headers"]
+
+    body = [{"inventory_id": sold, "delta": -2}, {"inventory_id": short, "delta": -3}]
+    response = await client.post("/inventory/mongodb/adjust", json=body, headers=headers)
+    assert response.status_code == 409
+    doc = await mongo("inventory").find_one({"_id": ObjectId(sold)})
+    assert (doc["quantity"], doc["version"]) == (5, 1)
+    # A client that read version 1 before the basket can still write
+    response = await client.patch(f"/inventory/mongodb/{sold}", json={"quantity": 4, "version": 1}, headers=headers)
+    assert response.status_code == 200
+
+
+async def test_search_returns_the_current_version(client, users, make_location, make_item):
+    location_id, _ = await make_location()
+    inventory_id, mongo_id = await make_item(location_id)
+    headers = users["alice"]["headers"]
+
+    for backend, key in (("mysql", inventory_id), ("mongodb", mongo_id)):
+        await client.patch(f"/inventory/{backend}/{key}", json={"quantity": 3}, headers=headers)
+        [item] = (await client.get(f"/inventory/{backend}/search?name=aviator", headers=headers)).json()["items"]
+        assert item["version"] == 2
+        # The version from the search is good for a conditional update
+        response = await client.patch(
+            f"/inventory/{backend}/{key}", json={"quantity": 4, "version": item["version"]}, headers=headers
+        )
+        assert response.status_code == 200
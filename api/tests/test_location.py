@@ -0,0 +1,83 @@
+import pytest
+from bson import ObjectId
+
+import outbox
+from conftest import location_body, mongo
+
+pytestmark = pytest.mark.anyio
+
+
+async def test_create_writes_both_stores(client, make_location):
+    location_id, mongo_id = await make_location(name="Fullerton")
+
+    response = await client.get(f"/location/mysql/{location_id}")
+    assert response.status_code == 200
+    assert response.json()["name"] == "Fullerton"
+    response = await client.get(f"/location/mongodb/{mongo_id}")
+    assert response.status_code == 200
+    doc = await mongo("location").find_one({"_id": ObjectId(mongo_id)})
+    assert doc["location_id"] == location_id and doc["used"] == 0
+
+
+async def test_create_is_admin_only(client, users):
+    response = await client.post("/location/", json=location_body(), headers=users["alice"]["headers"])
+    assert response.status_code == 403
+
+
+async def test_reads_are_public_and_paged(client, make_location):
+    for _ in range(3):
+        await make_location()
+    for backend in ("mysql", "mongodb"):
+        page = (await client.get(f"/location/{backend}?limit=2")).json()
+        assert len(page["items"]) == 2 and page["next_cursor"]
+
+
+async def test_missing_location(client):
+    assert (await client.get("/location/mysql/999")).status_code == 404
+    assert (await client.get(f"/location/mongodb/{ObjectId()}")).status_code == 404
+
+
+async def test_edits_are_mirrored_to_the_other_store(client, users, make_location):
+    headers = users["admin"]["headers"]
+    location_id, mongo_id = await make_location()
+
+    response = await client.patch(f"/location/mysql/{location_id}", json={"name": "Brea"}, headers=headers)
+    assert response.status_code == 200
+    assert (await client.get(f"/location/mongodb/{mongo_id}")).json()["name"] == "Brea"
+
+    response = await client.patch(f"/location/mongodb/{mongo_id}", json={"capacity": 50}, headers=headers)
+    assert response.status_code == 200
+    assert (await client.get(f"/location/mysql/{location_id}")).json()["capacity"] == 50
+
+
+async def test_deletes_are_mirrored_to_the_other_store(client, users, make_location):
+    headers = users["admin"]["headers"]
+    first, first_mongo = await make_location()
+    second, second_mongo = await make_location()
+
+    assert (await client.delete(f"/location/mysql/{first}", headers=headers)).status_code == 200
+    assert await mongo("location").find_one({"_id": ObjectId(first_mongo)}) is None
+    assert (await client.delete(f"/location/mongodb/{second_mongo}", headers=headers)).status_code == 200
+    assert (await client.get(f"/location/mysql/{second}")).status_code == 404
+
+
+async def test_failed_mongo_create_is_undone(client, users, monkeypatch):
+    async def fail(*args, **kwargs):
+        raise RuntimeError("mongod went away")
+
+    monkeypatch.setattr(mongo("location"), "insert_one", fail)
+    response = await client.post("/location/", json=location_body(), headers=users["admin"]["headers"])
+    assert response.status_code == 400
+    assert (await client.get("/location/mysql")).json()["items"] == []
+
+
+async def test_mongo_writes_are_refused_in_outbox_mode(client, users, make_location, monkeypatch):
+    headers = users["admin"]["headers"]
+    _, mongo_id = await make_location()
+    monkeypatch.setattr(outbox, "REPLICATION_MODE", "outbox")
+
+    response = await client.patch(f"/location/mongodb/{mongo_id}", json={"capacity": 50}, headers=headers)
+    assert response.status_code == 409
+    assert (await client.delete(f"/location/mongodb/{mongo_id}", headers=headers)).status_code == 409
+    location = await mongo("location").find_one({"_id": ObjectId(mongo_id)})
+    assert location["capacity"] == 1000
@@ -0,0 +1,152 @@
+import httpx
+import pytest
+from starlette.routing import Match
+
+import main
+import query_budget
+import routers.inventory
+from conftest import PASSWORD, item_body, location_body
+from principal_cache import principal_cache
+from query_budget import count_queries, get_query_budget, over_budget
+from response_cache import location_cache
+
+pytestmark = pytest.mark.anyio
+
+
+def budget_for(method: str, path: str, items: int) -> dict:
+    scope = {"type": "http", "method": method, "path": path, "root_path": ""}
+    for route in main.app.router.routes:
+        match, _ = route.matches(scope)
+        if match == Match.FULL:
+            return get_query_budget(route.endpoint, items)
+    raise AssertionError(f"no route for {method} {path}")
+
+
+@pytest.fixture
+def budgeted(client, monkeypatch):
+    # Sends a request the way its budget is counted: cold principal and
+    # location caches. Every backend the request uses must be in the budget
+    monkeypatch.setattr(query_budget, "budget_mode", "raise")
+    overruns = []
+
+    async def send(method: str, path: str, items: int = 0, **kwargs):
+        budget = budget_for(method, path.split("?")[0], items)
+        assert budget is not None, f"{method} {path} declares no budget"
+        principal_cache.clear()
+        location_cache.invalidate()
+        with count_queries() as counts:
+            response = await client.request(method, path, **kwargs)
+        assert response.status_code < 400, (method, path, response.text)
+        unbudgeted = {backend: count for backend, count in counts.items() if backend not in budget}
+        if over_budget(budget, counts) or unbudgeted:
+            overruns.append((method, path, counts, budget))
+        return response
+
+    yield send
+    assert overruns == []
+
+
+async def test_auth_routes(budgeted, users):
+    body = {"username": "carol", "email": "carol@example.com", "password": PASSWORD}
+    await budgeted("POST", "/auth/register", json=body)
+    await budgeted("POST", "/auth/login", data={"username": "carol", "password": PASSWORD})
+    headers = users["alice"]["headers"]
+    await budgeted("GET", "/auth/me", headers=headers)
+    await budgeted(
+        "PUT", f"/auth/users/{users['bob']['user_id']}/role", json={"role": "admin"},
+        headers=users["admin"]["headers"],
+    )
+    await budgeted("POST", "/auth/logout", headers=headers)
+
+
+async def test_location_routes(budgeted, users, make_location):
+    headers = users["admin"]["headers"]
+    await budgeted("POST", "/location/", json=location_body(), headers=headers)
+    location_id, mongo_id = await make_location()
+    for backend, key in (("mysql", location_id), ("mongodb", mongo_id)):
+        await budgeted("GET", f"/location/{backend}")
+        await budgeted("GET", f"/location/{backend}/export")
+        await budgeted("GET", f"/location/{backend}/{key}")
+        await budgeted("PATCH", f"/location/{backend}/{key}", json={"name": "Brea"}, headers=headers)
+    await budgeted("GET", f"/location/{mongo_id}")
+    await budgeted("DELETE", f"/location/mysql/{location_id}", headers=headers)
+    _, mongo_id = await make_location()
+    await budgeted("DELETE", f"/location/mongodb/{mongo_id}", headers=headers)
+
+
+async def test_inventory_routes(budgeted, users, make_location, make_item):
+    headers = users["alice"]["headers"]
+    location_id, _ = await make_location()
+    await budgeted("POST", "/inventory/", json=item_body(location_id), headers=headers)
+    inventory_id, mongo_id = await make_item(location_id)
+
+    for backend, key in (("mysql", inventory_id), ("mongodb", mongo_id)):
+        await budgeted("GET", f"/inventory/{backend}", headers=headers)
+        await budgeted("GET", f"/inventory/{backend}/by_location/{location_id}", headers=headers)
+        await budgeted("GET", f"/inventory/{backend}/export", headers=headers)
+        await budgeted("GET", f"/inventory/{backend}/search?name=aviator", headers=headers)
+        await budgeted("GET", f"/inventory/{backend}/stats", headers=headers)
+        await budgeted("GET", f"/inventory/{backend}/{key}", headers=headers)
+        for method in ("PUT", "PATCH"):
+            await budgeted(method, f"/inventory/{backend}/{key}", json={"quantity": 3}, headers=headers)
+        await budgeted("POST", f"/inventory/{backend}/{key}/adjust", json={"delta": -1}, headers=headers)
+        await budgeted("DELETE", f"/inventory/{backend}/{key}", headers=headers)
+    # mongomock has no $text, so only MySQL's full-text search runs here
+    await budgeted("GET", "/inventory/mysql/text_search?q=aviator", headers=headers)
+
+    _, mongo_id = await make_item(location_id)
+    await budgeted("GET", f"/inventory/{mongo_id}", headers=headers)
+
+
+async def test_basket_routes(budgeted, users, make_location, make_item):
+    headers = users["alice"]["headers"]
+    items = []
+    for _ in range(3):
+        location_id, _ = await make_location()
+        items.append(await make_item(location_id))
+
+    for backend, key in (("mysql", 0), ("mongodb", 1)):
+        for count in (1, 3):
+            body = [{"inventory_id": item[key], "delta": 2} for item in items[:count]]
+            await budgeted("POST", f"/inventory/{backend}/adjust", items=count, json=body, headers=headers)
+
+
+async def test_updates_stay_in_budget_after_a_retry(budgeted, users, make_location, make_item, monkeypatch):
+    headers = users["alice"]["headers"]
+    location_id, _ = await make_location()
+    other_location, _ = await make_location()
+    inventory_id, mongo_id = await make_item(location_id)
+    sql_patch, mongo_patch = routers.inventory.sql_patch, routers.inventory.mongo_patch
+    lost = set()
+
+    # The first pinned write of each request loses to a concurrent writer
+    async def lose_first_sql(db, model, conditions, changes, version):
+        if "mysql" not in lost:
+            lost.add("mysql")
+            return False
+        return await sql_patch(db, model, conditions, changes, version)
+
+    async def lose_first_mongo(collection, query, changes, version):
+        if "mongodb" not in lost:
+            lost.add("mongodb")
+            return None
+        return await mongo_patch(collection, query, changes, version)
+
+    monkeypatch.setattr(routers.inventory, "sql_patch", lose_first_sql)
+    monkeypatch.setattr(routers.inventory, "mongo_patch", lose_first_mongo)
+    move = {"location_id": other_location, "quantity": 9}
+    await budgeted("PUT", f"/inventory/mysql/{inventory_id}", json=move, headers=headers)
+    await budgeted("PUT", f"/inventory/mongodb/{mongo_id}", json=move, headers=headers)
+    assert lost == {"mysql", "mongodb"}
+
+
+async def test_over_budget_fails_before_the_response(app, users, monkeypatch):
+    monkeypatch.setattr(query_budget, "budget_mode", "raise")
+    endpoint = next(route.endpoint for route in main.app.router.routes if getattr(route, "path", None) == "/auth/me")
+    monkeypatch.setattr(endpoint, "__query_budget__", {"mysql": 0})
+    principal_cache.clear()
+    # The client sees what a real one would instead of the exception
+    transport = httpx.ASGITransport(app=app, raise_app_exceptions=False)
+    async with httpx.AsyncClient(transport=transport, base_url="http://test") as client:
+        response = await client.get("/auth/me", headers=users["alice"]["headers"])
+    assert response.status_code == 500
@@ -0,0 +1,42 @@
+import pytest
+from bson import ObjectId
+
+from conftest import mongo
+from reconcile import reconcile
+
+pytestmark = pytest.mark.anyio
+
+
+async def diffs(entity="inventory", **options):
+    return [report async for report in reconcile(entity, **options)]
+
+
+async def test_matching_stores_report_nothing(make_location, make_item):
+    location_id, _ = await make_location()
+    for quantity in range(1, 6):
+        await make_item(location_id, quantity=quantity, price=quantity * 1.1)
+    assert await diffs(chunk_size=2) == []
+    assert await diffs("location") == []
+
+
+async def test_changes_that_keep_the_sums_are_found(users, make_location, make_item):
+    location_id, _ = await make_location()
+    _, renamed = await make_item(location_id, name="black aviator")
+    _, first = await make_item(location_id, quantity=5)
+    _, second = await make_item(location_id, quantity=7)
+    _, moved = await make_item(location_id)
+    _, other = await make_item(location_id, user="bob")
+    inventory = mongo("inventory")
+
+    # Same length, swapped between rows, and owners traded
+    await inventory.update_one({"_id": ObjectId(renamed)}, {"$set": {"name": "black aviatoR"}})
+    await inventory.update_one({"_id": ObjectId(first)}, {"$set": {"quantity": 7}})
+    await inventory.update_one({"_id": ObjectId(second)}, {"$set": {"quantity": 5}})
+    await inventory.update_one({"_id": ObjectId(moved)}, {"$set": {"user_id": users["bob"]["user_id"]}})
+    await inventory.update_one({"_id": ObjectId(other)}, {"$set": {"user_id": users["alice"]["user_id"]}})
+
+    # All in one chunk, with the same count and sums on both sides
+    found = {report["mongo_id"]: report["fields"] for report in await diffs()}
+    assert found == {
+        renamed: ["name"], first: ["quantity"], second: ["quantity"], moved: ["user_id"], other: ["user_id"],
+    }
@@ -0,0 +1,46 @@
+import json
+
+import pytest
+from bson import ObjectId
+
+import config
+from conftest import item_body, mongo
+from models.mysql_models import OutboxMySQL
+from replicator import prune, replicate_batch, replication_status
+
+pytestmark = pytest.mark.anyio
+
+
+async def commit_event(outbox_id: int, payload: dict) -> None:
+    # What a transaction holding outbox_id does when it finally commits
+    async with config.AsyncSessionLocal() as db:
+        db.add(OutboxMySQL(outbox_id=outbox_id, entity="inventory", op="upsert", payload=json.dumps(payload)))
+        await db.commit()
+
+
+def item_payload(inventory_id: int, location_id: int, user_id: int) -> dict:
+    return {
+        **item_body(location_id), "inventory_id": inventory_id, "user_id": user_id,
+        "mongo_id": str(ObjectId()), "version": 1,
+    }
+
+
+async def test_events_committed_out_of_order_are_replicated(users, make_location):
+    location_id, _ = await make_location()
+    user_id = users["alice"]["user_id"]
+    late, early = item_payload(1, location_id, user_id), item_payload(2, location_id, user_id)
+
+    await commit_event(10, early)
+    assert await replicate_batch() == 1
+    # outbox_id 5 was handed out first but its transaction commits after 10
+    # has been replicated
+    await commit_event(5, late)
+    assert (await replication_status())["pending"] == 1
+    assert await replicate_batch() == 1
+
+    for payload in (early, late):
+        assert await mongo("inventory").find_one({"_id": ObjectId(payload["mongo_id"])})
+    location = await mongo("location").find_one({"location_id": location_id})
+    assert location["used"] == 10
+    assert (await replication_status())["pending"] == 0
+    assert await prune() == 2
@@ -0,0 +1,129 @@
+import heapq
+import math
+import re
+from collections import Counter, defaultdict
+from typing import List, Optional, Tuple
+
+from sqlalchemy import select
+
+from config import AsyncSessionLocal, async_engine
+from models.mysql_models import InventoryMySQL
+
+# Pure-Python inverted index over inventory name/description, ranked with
+# BM25. Used for full-text search when the SQL backend has no FULLTEXT
+# support (SQLite in tests and local setups). It is built at startup and kept
+# current by the inventory write handlers, so it only sees writes made by this
+# process; deployments with several workers should run on MySQL.
+
+TOKEN_RE = re.compile(r"[a-z0-9]+")
+
+# Matches in the name count more than matches in the description
+FIELD_WEIGHTS = {"name": 2.0, "description": 1.0}
+
+
+def tokenize(text: str) -> List[str]:
+    return TOKEN_RE.findall(text.lower())
+
+
+class InvertedIndex:
+    def __init__(self, k1: float = 1.2, b: float = 0.75):
+        self.k1 = k1
+        self.b = b
+        self._postings = defaultdict(dict)  # term -> {doc_id: weighted term frequency}
+        self._docs = {}  # doc_id -> (user_id, {field: Counter of terms})
+        self._lengths = {}  # doc_id -> weighted length
+        self._total_length = 0.0
+
+    def __len__(self) -> int:
+        return len(self._docs)
+
+    def upsert(self, doc_id: int, user_id: int, **fields: str) -> None:
+        # Fields that are not passed keep their indexed terms, so partial
+        # updates only need the fields that changed
+        _, field_terms = self._docs.get(doc_id, (user_id, {}))
+        field_terms = dict(field_terms)
+        for field, text in fields.items():
+            if field in FIELD_WEIGHTS and text is not None:
+                field_terms[field] = Counter(tokenize(text))
+        self.remove(doc_id)
+
+        weighted = Counter()
+        for field, terms in field_terms.items():
+            for term, count in terms.items():
+                weighted[term] += count * FIELD_WEIGHTS[field]
+        for term, frequency in weighted.items():
+            self._postings[term][doc_id] = frequency
+        length = sum(weighted.values())
+        self._docs[doc_id] = (user_id, field_terms)
+        self._lengths[doc_id] = length
+        self._total_length += length
+
+    def remove(self, doc_id: int) -> None:
+        if doc_id not in self._docs:
+            return
+        _, field_terms = self._docs.pop(doc_id)
+        for terms in field_terms.values():
+            for term in terms:
+                postings = self._postings.get(term)
+                if postings is not None:
+                    postings.pop(doc_id, None)
+                    if not postings:
+                        del self._postings[term]
+        self._total_length -= self._lengths.pop(doc_id)
+
+    def search(
+        self, query: str, user_id: Optional[int] = None, limit: int = 20, offset: int = 0
+    ) -> Tuple[List[Tuple[int, float]], bool]:
+        # Returns one page of (doc_id, score), best first, and whether more follow
+        if not self._docs:
+            return [], False
+        doc_count = len(self._docs)
+        average_length = self._total_length / doc_count or 1.0
+
+        scores = defaultdict(float)
+        for term in set(tokenize(query)):
+            postings = self._postings.get(term)
+            if not postings:
+                continue
+            idf = math.log(1 + (doc_count - len(postings) + 0.5) / (len(postings) + 0.5))
+            for doc_id, frequency in postings.items():
+                if user_id is not None and self._docs[doc_id][0] != user_id:
+                    continue
+                norm = 1 - self.b + self.b * self._lengths[doc_id] / average_length
+                scores[doc_id] += idf * frequency * (self.k1 + 1) / (frequency + self.k1 * norm)
+
+        # Only the top offset+limit+1 are ordered, not every match
+        top = heapq.nlargest(offset + limit + 1, scores.items(), key=lambda hit: (hit[1], -hit[0]))
+        return top[offset:offset + limit], len(top) > offset + limit
+
+
+inventory_text_index = InvertedIndex()
+
+
+def text_index_enabled() -> bool:
+    return async_engine.dialect.name != "mysql"
+
+
+# Called by the inventory write handlers after a successful commit
+def index_inventory(inventory_id: int, user_id: int, **fields: str) -> None:
+    if text_index_enabled():
+        inventory_text_index.upsert(inventory_id, user_id, **fields)
+
+
+def unindex_inventory(inventory_id: int) -> None:
+    if text_index_enabled():
+        inventory_text_index.remove(inventory_id)
+
+
+async def build_text_index(batch_size: int = 1000) -> int:
+    if not text_index_enabled():
+        return 0
+    stmt = select(
+        InventoryMySQL.inventory_id, InventoryMySQL.user_id,
+        InventoryMySQL.name, InventoryMySQL.description,
+    ).execution_options(yield_per=batch_size)
+    async with AsyncSessionLocal() as db:
+        result = await db.stream(stmt)
+        async for inventory_id, user_id, name, description in result:
+            inventory_text_index.upsert(inventory_id, user_id, name=name, description=description)
+    return len(inventory_text_index)
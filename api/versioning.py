@@ -0,0 +1,120 @@
+from typing import Awaitable, Callable, Optional, Tuple
+
+from fastapi import HTTPException
+from pymongo import ReturnDocument
+from sqlalchemy import select, update
+from sqlalchemy.ext.asyncio import AsyncSession
+
+# Partial updates with optimistic concurrency, used by the inventory and
+# location PUT/PATCH handlers. Only the fields the client sent are written,
+# with one UPDATE ... WHERE id [AND user_id] [AND version] or one
+# find_one_and_update, and every write bumps the row's version. A client that
+# sends back the version it read only overwrites that version: if the row
+# changed in between the write matches nothing and the handler answers 409.
+# Without a version the write goes to whatever is stored (last write wins).
+# MongoDB documents written before versioning have no version field and
+# count as version 1.
+#
+# Handlers that must read a row before writing it (inventory stats/capacity)
+# pin the write to the version they read. Without a client version, losing
+# that race is retried instead of reported.
+
+PINNED_ATTEMPTS = 3
+
+VERSION_CONFLICT = "Version conflict, re-read and retry"
+
+
+class VersionConflict(HTTPException):
+    pass
+
+
+def version_conflict() -> HTTPException:
+    return VersionConflict(status_code=409, detail=VERSION_CONFLICT)
+
+
+async def with_pinned_retries(
+    write: Callable[[], Awaitable], version: Optional[int], rollback: Optional[Callable[[], Awaitable]] = None
+):
+    # write() reads, pins and writes; a conflict on the client's own version
+    # is returned to the client straight away
+    for attempt in range(PINNED_ATTEMPTS):
+        try:
+            return await write()
+        except VersionConflict:
+            if version is not None or attempt == PINNED_ATTEMPTS - 1:
+                raise
+            if rollback is not None:
+                await rollback()
+
+
+def patch_changes(item) -> Tuple[dict, Optional[int]]:
+    # (fields to write, expected version). Every column is NOT NULL, so
+    # explicit nulls mean "leave as is" like unset fields
+    changes = {key: value for key, value in item.model_dump(exclude_unset=True).items() if value is not None}
+    return changes, changes.pop("version", None)
+
+
+# MySQL =======================================================================
+async def sql_patch(db: AsyncSession, model, conditions: list, changes: dict, version: Optional[int]) -> bool:
+    # False when no row matched the conditions (and version)
+    stmt = update(model).where(*conditions).values(**changes, version=model.version + 1)
+    if version is not None:
+        stmt = stmt.where(model.version == version)
+    result = await db.execute(stmt)
+    return result.rowcount > 0
+
+
+async def sql_patch_error(
+    db: AsyncSession, model, key_column, key, not_found: str, owner_column=None, owner: Optional[int] = None
+) -> HTTPException:
+    # Why a conditional UPDATE/SELECT matched nothing. Only runs on failure
+    columns = [model.version] if owner_column is None else [model.version, owner_column]
+    row = (await db.execute(select(*columns).where(key_column == key))).first()
+    if row is None:
+        return HTTPException(status_code=404, detail=not_found)
+    if owner is not None and row[1] != owner:
+        return HTTPException(status_code=401, detail="Not Authorized")
+    return version_conflict()
+
+
+# MongoDB =====================================================================
+def versioned(query: dict, version: int) -> dict:
+    return {**query, "version": {"$in": [1, None]} if version == 1 else version}
+
+
+async def find_one_and_bump(collection, query: dict, operations: dict) -> Optional[dict]:
+    # find_one_and_update that also bumps the version; the updated document,
+    # or None when nothing matched
+    bump = {**operations, "$inc": {**operations.get("$inc", {}), "version": 1}}
+    doc = await collection.find_one_and_update(
+        {**query, "version": {"$exists": True}}, bump, return_document=ReturnDocument.AFTER
+    )
+    if doc is None:
+        # Not there, or written before versioning ($inc would start it at 1)
+        first = {**operations, "$set": {**operations.get("$set", {}), "version": 2}}
+        doc = await collection.find_one_and_update(
+            {**query, "version": {"$exists": False}}, first, return_document=ReturnDocument.AFTER
+        )
+    return doc
+
+
+async def mongo_patch(collection, query: dict, changes: dict, version: Optional[int]) -> Optional[dict]:
+    # The updated document, or None when nothing matched
+    if version is not None:
+        return await collection.find_one_and_update(
+            versioned(query, version),
+            {"$set": {**changes, "version": version + 1}},
+            return_document=ReturnDocument.AFTER,
+        )
+    return await find_one_and_bump(collection, query, {"$set": changes} if changes else {})
+
+
+async def mongo_patch_error(
+    collection, object_id, not_found: str, owner_field: Optional[str] = None, owner: Optional[int] = None
+) -> HTTPException:
+    doc = await collection.find_one({"_id": object_id}, {"_id": 1, **({owner_field: 1} if owner_field else {})})
+    if doc is None:
+        return HTTPException(status_code=404, detail=not_found)
+    if owner is not None and doc.get(owner_field) != owner:
+        return HTTPException(status_code=401, detail="Not Authorized")
+    return version_conflict()